@@ -0,0 +1,302 @@
+import struct
+from typing import Any, Callable, Iterable, TypeVar
+from entoli.base.maybe import Just, Nothing
+from entoli.parsec.prim import (
+    Expect,
+    Parsec,
+    SourcePos,
+    State,
+    SysUnExpect,
+    UnExpect,
+    new_pos,
+    parse,
+    partial_input,
+    suspend,
+    token_prim,
+    tokens,
+    ParseError,
+    UNKNOWN_ERROR,
+)
+
+# Imported for testing
+from entoli.parsec.prim import Done, get_position, many, run_partial
+
+_U = TypeVar("_U")
+
+# ! Primitives over bytes, bytearray and mmap input. Tokens are ints, as when
+# ! indexing bytes. Lines mean nothing in binary data, so positions stay on
+# ! line 1 and the column is the byte offset plus one. Multi-byte primitives
+# ! are atomic: short input fails them without consuming.
+
+
+def update_pos_bytes(pos: SourcePos, n: int) -> SourcePos:
+    return new_pos(pos.name, pos.line, pos.col + n)
+
+
+def _show_byte(b: int) -> str:
+    return f"0x{b:02x}"
+
+
+def _show_bytes(bs: Iterable[int]) -> str:
+    return repr(bytes(bs))
+
+
+# -- | @satisfyByte f@ succeeds for any byte for which @f@ returns 'True', and
+# -- returns it.
+
+
+def satisfy_byte(f: Callable[[int], bool]) -> Parsec[Any, _U, int]:
+    return token_prim(
+        _show_byte,
+        lambda pos, b, bs: update_pos_bytes(pos, 1),
+        lambda b: Just(b) if f(b) else Nothing(),
+    )
+
+
+def _test_satisfy_byte():
+    assert parse(satisfy_byte(lambda b: b < 0x80), "", b"\x7f") == 0x7F
+    assert parse(satisfy_byte(lambda b: b < 0x80), "", b"\x80") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("0x80")]
+    )
+
+
+any_byte = satisfy_byte(lambda _: True)
+
+
+def byte(b: int) -> Parsec[Any, _U, int]:
+    return satisfy_byte(lambda x: x == b).with_first([b])
+
+
+def _test_byte():
+    assert parse(any_byte, "", b"") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("")]
+    )
+    assert parse(many(any_byte), "", bytearray(b"ab")) == [0x61, 0x62]
+    assert parse(byte(1).then(byte(2)), "", b"\x01\x03") == ParseError(
+        SourcePos("", 1, 2), [SysUnExpect("0x03")]
+    )
+
+
+def bytes_(bs: bytes) -> Parsec[Any, _U, bytes]:
+    return tokens(_show_bytes, lambda pos, bs: update_pos_bytes(pos, len(bs)), bs)
+
+
+def _test_bytes_():
+    assert parse(bytes_(b"\x89PNG").then(any_byte), "", b"\x89PNG\r") == 0x0D
+    assert parse(bytes_(b"PK"), "", b"PX") == ParseError(
+        SourcePos("", 1, 1), [Expect("b'PK'"), SysUnExpect("b'X'")]
+    )
+
+
+def _short(s: State[Any, _U], label: str) -> ParseError:
+    input = s.input
+    o = s.offset
+    return ParseError.lazy(
+        s.error_pos(),
+        lambda: [
+            Expect(label),
+            SysUnExpect(_show_byte(input[o]) if o < len(input) else ""),
+        ],
+    )
+
+
+# -- | @take n@ consumes exactly @n@ bytes and returns them as a memoryview
+# -- into the input, without copying.
+
+
+def take(n: int) -> Parsec[Any, _U, memoryview]:
+    label = f"{n} bytes"
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        if o + n > len(input):
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, cerr, eok, eerr)
+            return eerr(_short(s, label))
+
+        view = memoryview(input)[o : o + n]
+        if n == 0:
+            return eok(view, s, UNKNOWN_ERROR)
+        pos = s._pos and update_pos_bytes(s._pos, n)
+        return cok(view, State(input, pos, s.user_state, o + n, s.ctx), UNKNOWN_ERROR)
+
+    return Parsec(_un_parser)
+
+
+def _test_take():
+    input = bytearray(b"abcd")
+    view = parse(take(2).skip(take(0)), "", input)
+    assert isinstance(view, memoryview) and view == b"ab"
+    input[0] = ord("x")
+    assert view == b"xb"
+    assert parse(any_byte.then(take(4)), "", b"abcd") == ParseError(
+        SourcePos("", 1, 2), [Expect("4 bytes"), SysUnExpect("0x62")]
+    )
+
+
+# -- | @unpack fmt@ reads the fields of the struct format @fmt@ at the current
+# -- offset, as by @struct.unpack_from@. A single field is returned as is.
+
+
+def unpack(fmt: str) -> Parsec[Any, _U, Any]:
+    st = struct.Struct(fmt)
+    unpack_from = st.unpack_from
+    n = st.size
+    single = len(unpack_from(bytes(n))) == 1
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        if o + n > len(input):
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, cerr, eok, eerr)
+            return eerr(_short(s, fmt))
+
+        r = unpack_from(input, o)
+        pos = s._pos and update_pos_bytes(s._pos, n)
+        s_ = State(input, pos, s.user_state, o + n, s.ctx)
+        return cok(r[0] if single else r, s_, UNKNOWN_ERROR)
+
+    return Parsec(_un_parser)
+
+
+def _test_unpack():
+    assert parse(unpack("<HI"), "", b"\x01\x00\x02\x00\x00\x00") == (1, 2)
+    assert parse(unpack(">h").then(unpack("<d")), "", b"\xff\xfe" + bytes(8)) == 0.0
+    assert parse(unpack(">h"), "", b"\xff\xfe") == -2
+    assert parse(unpack(">I"), "", b"\x00\x00") == ParseError(
+        SourcePos("", 1, 1), [Expect(">I"), SysUnExpect("0x00")]
+    )
+
+
+# -- | @unpackN fmt n@ reads @n@ consecutive records of @fmt@ in one step, as
+# -- by @struct.iter_unpack@. Records of a single field are returned as is.
+
+
+def unpack_n(fmt: str, n: int) -> Parsec[Any, _U, list[Any]]:
+    st = struct.Struct(fmt)
+    size = st.size * n
+    single = len(st.unpack_from(bytes(st.size))) == 1
+    label = f"{n} x {fmt}"
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        if o + size > len(input):
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, cerr, eok, eerr)
+            return eerr(_short(s, label))
+
+        records = st.iter_unpack(memoryview(input)[o : o + size])
+        r = [x for (x,) in records] if single else list(records)
+        if size == 0:
+            return eok(r, s, UNKNOWN_ERROR)
+        pos = s._pos and update_pos_bytes(s._pos, size)
+        s_ = State(input, pos, s.user_state, o + size, s.ctx)
+        return cok(r, s_, UNKNOWN_ERROR)
+
+    return Parsec(_un_parser)
+
+
+def _test_unpack_n():
+    input = struct.pack("<3H", 1, 2, 3) + b"\xff"
+    assert parse(unpack_n("<H", 3), "", input) == [1, 2, 3]
+    assert parse(unpack_n("<BB", 2), "", input) == [(1, 0), (2, 0)]
+    assert parse(unpack_n("<H", 0), "", b"") == []
+    assert parse(u16_be.then(unpack_n("<H", 3)), "", input) == ParseError(
+        SourcePos("", 1, 3), [Expect("3 x <H"), SysUnExpect("0x02")]
+    )
+    counted = u8.and_then(lambda n: unpack_n(">h", n))
+    assert parse(counted, "", b"\x02\xff\xff\x00\x01") == [-1, 1]
+
+
+u8 = unpack("B")
+i8 = unpack("b")
+u16_be = unpack(">H")
+u16_le = unpack("<H")
+i16_be = unpack(">h")
+i16_le = unpack("<h")
+u32_be = unpack(">I")
+u32_le = unpack("<I")
+i32_be = unpack(">i")
+i32_le = unpack("<i")
+u64_be = unpack(">Q")
+u64_le = unpack("<Q")
+i64_be = unpack(">q")
+i64_le = unpack("<q")
+f32_be = unpack(">f")
+f32_le = unpack("<f")
+f64_be = unpack(">d")
+f64_le = unpack("<d")
+
+
+def _test_fixed_width():
+    input = bytes.fromhex("0102030405060708")
+    assert parse(u32_be, "", input) == 0x01020304
+    assert parse(u32_le, "", input) == 0x04030201
+    p = u16_le.then(u16_be).then(get_position())
+    assert parse(p, "", input) == SourcePos("", 1, 5)
+    assert parse(i8.then(i64_le), "", b"\x80" + input) == 0x0807060504030201
+    assert parse(f32_le, "", struct.pack("<f", 1.5)) == 1.5
+
+
+# ! Varints are LEB128 as in protocol buffers: seven bits per byte, least
+# ! significant group first, with the high bit set on every byte but the last.
+# ! At most ten bytes are read, enough for 64 bits.
+
+
+def _uvarint(label: str, f: Callable[[int], int]) -> Parsec[Any, _U, int]:
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        end = min(len(input), o + 10)
+        n = 0
+        shift = 0
+        for i in range(o, end):
+            b = input[i]
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                pos = s._pos and update_pos_bytes(s._pos, i + 1 - o)
+                s_ = State(input, pos, s.user_state, i + 1, s.ctx)
+                return cok(f(n), s_, UNKNOWN_ERROR)
+            shift += 7
+
+        if end < o + 10:
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, cerr, eok, eerr)
+            return eerr(
+                ParseError.lazy(s.error_pos(), lambda: [Expect(label), SysUnExpect("")])
+            )
+        return eerr(
+            ParseError.lazy(
+                s.error_pos(),
+                lambda: [Expect(label), UnExpect("varint over 10 bytes")],
+            )
+        )
+
+    return Parsec(_un_parser)
+
+
+uvarint = _uvarint("uvarint", lambda n: n)
+
+# Zigzag encoded, so that small negative numbers stay short
+varint = _uvarint("varint", lambda n: (n >> 1) ^ -(n & 1))
+
+
+def _test_varint():
+    assert parse(uvarint, "", b"\x00") == 0
+    assert parse(uvarint, "", b"\xac\x02") == 300
+    p = uvarint.then(get_position())
+    assert parse(p, "", b"\xac\x02\x05") == SourcePos("", 1, 3)
+    assert parse(uvarint, "", b"\xff" * 9 + b"\x01") == 2**64 - 1
+    assert parse(varint, "", b"\x03") == -2
+    assert parse(varint, "", b"\x04") == 2
+    assert parse(uvarint, "", b"\xac") == ParseError(
+        SourcePos("", 1, 1), [Expect("uvarint"), SysUnExpect("")]
+    )
+    assert parse(uvarint, "", b"\x80" * 11) == ParseError(
+        SourcePos("", 1, 1), [Expect("uvarint"), UnExpect("varint over 10 bytes")]
+    )
+    r = run_partial(uvarint.then(u16_be), None, "", b"\xac").feed(b"\x02\x00")
+    assert r.feed(b"\x07") == Done(7, b"")
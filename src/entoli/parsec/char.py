@@ -1,22 +1,231 @@
-from typing import Callable, Iterable, TypeVar
+from bisect import bisect_right
+import re
+from typing import Any, Callable, Iterable, Sequence, TypeVar
 from entoli.base.maybe import Just, Maybe, Nothing
 from entoli.parsec.prim import (
     Expect,
+    MappedText,
+    OffsetPos,
     Parsec,
     SourcePos,
+    State,
+    Suspend,
     SysUnExpect,
     UnExpect,
     parse,
+    partial_input,
+    run_pt,
     skip_many,
+    suspend,
     token_prim,
+    literal_next_pos,
+    next_pos_char,
     tokens,
-    update_pos_char,
+    tokens_,
+    update_pos_string,
     ParseError,
+    UNKNOWN_ERROR,
 )
-from entoli.prelude import concat, elem
+from entoli.prelude import concat
+
+# Imported for testing
+from entoli.parsec.prim import Done, get_position, many, run_partial
 
 _U = TypeVar("_U")
 
+# ! A CharSet is a sorted tuple of boundaries: the code points of the set are
+# ! the half-open ranges [b0, b1), [b2, b3), ..., so a code point is a member
+# ! when an odd number of boundaries are at or below it. Set operations sweep
+# ! the boundaries of both sets. Membership is compiled once per set: a small
+# ! set to a frozenset, a large one to a 128-entry ASCII table and a bisect of
+# ! the boundaries for the rest. Span scanners over str input match the set as
+# ! a regex character class instead of testing each character.
+
+_MAX_CODE = 0x110000
+_SMALL_SET = 256
+
+
+class _Hits(dict):
+    """
+    The Just of each member of a small CharSet, and Nothing for the rest
+    """
+
+    __slots__ = ()
+
+    def __missing__(self, c: Any) -> Maybe[Any]:
+        return Nothing()
+
+
+def _combine(
+    a: tuple[int, ...], b: tuple[int, ...], op: Callable[[bool, bool], bool]
+) -> tuple[int, ...]:
+    bounds = []
+    inside = False
+    for x in sorted(set(a) | set(b)):
+        now = op(bisect_right(a, x) & 1 == 1, bisect_right(b, x) & 1 == 1)
+        if now != inside:
+            bounds.append(x)
+            inside = now
+    return tuple(bounds)
+
+
+class CharSet:
+    """
+    An immutable set of characters, built from characters and ranges and
+    combined with | (union), & (intersection), - (difference) and ~
+    (negation). contains tests a character, or the int of a byte, in O(1)
+    without allocating, and pattern is the set as a regex character class.
+    """
+
+    __slots__ = ("bounds", "size", "chars", "contains", "test", "_span")
+
+    def __init__(self, chars: Iterable[str] = ""):
+        bounds: list[int] = []
+        for o in sorted({ord(c) for c in chars}):
+            if bounds and bounds[-1] == o:
+                bounds[-1] = o + 1
+            else:
+                bounds += [o, o + 1]
+        self._compile(tuple(bounds))
+
+    @classmethod
+    def range(cls, lo: str, hi: str) -> "CharSet":
+        """
+        The characters from lo to hi, both included
+        """
+        return cls._of(() if hi < lo else (ord(lo), ord(hi) + 1))
+
+    @classmethod
+    def _of(cls, bounds: tuple[int, ...]) -> "CharSet":
+        self = cls.__new__(cls)
+        self._compile(bounds)
+        return self
+
+    def _compile(self, bounds: tuple[int, ...]) -> None:
+        self.bounds = bounds
+        self.size = sum(bounds[i + 1] - bounds[i] for i in range(0, len(bounds), 2))
+        self._span = None
+        if self.size <= _SMALL_SET:
+            codes = [
+                o
+                for i in range(0, len(bounds), 2)
+                for o in range(bounds[i], bounds[i + 1])
+            ]
+            self.chars = frozenset(map(chr, codes))
+            # The ints of bytes input are members by code point
+            self.contains = self.chars.union(codes).__contains__
+            hits = {c: Just(c) for c in self.chars}
+            hits.update((o, Just(o)) for o in codes)
+            self.test = _Hits(hits).__getitem__
+            return
+
+        self.chars = None
+        ascii = bytes(bisect_right(bounds, o) & 1 for o in range(128))
+        hits = tuple(Just(chr(o)) if ascii[o] else Nothing() for o in range(128))
+        byte_hits = tuple(Just(o) if ascii[o] else Nothing() for o in range(128))
+
+        def contains(c: str | int) -> bool:
+            o = c if type(c) is int else ord(c)
+            if o < 128:
+                return ascii[o] == 1
+            return bisect_right(bounds, o) & 1 == 1
+
+        def test(c: str | int) -> Maybe[str | int]:
+            if type(c) is int:
+                if c < 128:
+                    return byte_hits[c]
+                return Just(c) if bisect_right(bounds, c) & 1 else Nothing()
+            o = ord(c)
+            if o < 128:
+                return hits[o]
+            return Just(c) if bisect_right(bounds, o) & 1 else Nothing()
+
+        self.contains = contains
+        self.test = test
+
+    def __contains__(self, c: str) -> bool:
+        return self.contains(c)
+
+    def __or__(self, other: "CharSet") -> "CharSet":
+        return CharSet._of(_combine(self.bounds, other.bounds, lambda a, b: a or b))
+
+    def __and__(self, other: "CharSet") -> "CharSet":
+        return CharSet._of(_combine(self.bounds, other.bounds, lambda a, b: a and b))
+
+    def __sub__(self, other: "CharSet") -> "CharSet":
+        return CharSet._of(
+            _combine(self.bounds, other.bounds, lambda a, b: a and not b)
+        )
+
+    def __invert__(self) -> "CharSet":
+        return CharSet._of(_combine(self.bounds, (0, _MAX_CODE), lambda a, b: b != a))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CharSet) and self.bounds == other.bounds
+
+    def __hash__(self) -> int:
+        return hash(self.bounds)
+
+    def __repr__(self) -> str:
+        return f"CharSet({self.pattern!r})"
+
+    @property
+    def pattern(self) -> str:
+        """
+        The set as a regex character class
+        """
+        bounds = self.bounds
+        if not bounds:
+            return "[^\\x00-\\U0010ffff]"
+        parts = []
+        for i in range(0, len(bounds), 2):
+            lo = re.escape(chr(bounds[i]))
+            hi = re.escape(chr(bounds[i + 1] - 1))
+            parts.append(lo if lo == hi else f"{lo}-{hi}")
+        return f"[{''.join(parts)}]"
+
+    def span(self, input: str, o: int) -> int:
+        """
+        The end of the run of members of input from o
+        """
+        if self._span is None:
+            self._span = re.compile(self.pattern + "*").match
+        return self._span(input, o).end()
+
+
+def _test_char_set():
+    lower = CharSet.range("a", "z")
+    vowels = CharSet("aeiou")
+    consonants = lower - vowels
+    assert "b" in consonants and "a" not in consonants and "B" not in consonants
+    assert (consonants | vowels) == lower and (lower & vowels) == vowels
+    assert consonants.size == 21 and consonants.chars is not None
+    assert CharSet("cab") == CharSet.range("a", "c")
+    assert CharSet.range("b", "a").size == 0
+
+    not_vowels = ~vowels
+    assert not_vowels.chars is None and ~not_vowels == vowels
+    assert "x" in not_vowels and "é" in not_vowels and "a" not in not_vowels
+    assert not_vowels.test("x") == Just("x") and not not_vowels.test("e")
+    assert vowels.test("e") == Just("e") and not vowels.test("x")
+    not_e = ~CharSet.range("é", "é")
+    assert [c in not_e for c in "a\U0001f600é"] == [True, True, False]
+
+    assert CharSet("]-^a\\").pattern == "[\\-\\\\-\\^a]"
+    assert re.fullmatch(lower.pattern + "+", "abc")
+    assert not re.match(CharSet().pattern, "a") and (~CharSet()).size == _MAX_CODE
+    assert consonants.span("bcdaxy", 0) == 3 and consonants.span("bcd", 3) == 3
+
+    # Bytes input reads as ints
+    for letters in [CharSet("ab"), ~CharSet("c")]:
+        assert 97 in letters and 99 not in letters
+        assert letters.test(98) == Just(98) and not letters.test(99)
+    assert 233 not in not_e and 233 in ~not_e and not_vowels.test(233) == Just(233)
+    assert parse(take_while(~CharSet("a")), "", b"xya") == b"xy"
+    assert parse(satisfy(CharSet("ab")), "", b"a") == ord("a")
+    assert parse(satisfy(CharSet("ab")).mplus(char("c")), "", b"b") == ord("b")
+    assert parse(one_of(CharSet.range("a", "z")), "", b"q") == ord("q")
+
 # -- | The parser @satisfy f@ succeeds for any character for which the
 # -- supplied function @f@ returns 'True'. Returns the character that is
 # -- actually parsed.
@@ -31,10 +240,14 @@ _U = TypeVar("_U")
 #                                 (\c -> if f c then Just c else Nothing)
 
 
-def satisfy(f: Callable[[str], bool]) -> Parsec[Iterable[str], _U, str]:
+def satisfy(f: Callable[[str], bool] | CharSet) -> Parsec[Iterable[str], _U, str]:
+    if type(f) is CharSet:
+        # The compiled test of the set, and its members as first set if few
+        p = token_prim(lambda c: str(c), next_pos_char, f.test)
+        return p if f.chars is None else p.with_first(f.chars.union(map(ord, f.chars)))
     return token_prim(
         lambda c: str(c),
-        lambda pos, c, cs: update_pos_char(pos, c),
+        next_pos_char,
         lambda c: Just(c) if f(c) else Nothing(),
     )
 
@@ -49,13 +262,33 @@ def _test_satisfy():
     )
 
 
+def _test_satisfy_mapped_text():
+    # Columns count characters, not the bytes of a UTF-8 MappedText
+    text = "é€x\té!"
+    for p in [
+        many(satisfy(lambda c: c != "!")).then(char("?")),
+        many(none_of("!")).then(char("?")),
+        string("é€").then(one_of("x")).then(char("?")),
+    ]:
+        expected = parse(p, "", text)
+        assert parse(p, "", MappedText(text.encode())) == expected
+        mapped = run_pt(p, None, "", MappedText(text.encode()), lazy_positions=True)
+        assert mapped.source_pos == expected.source_pos
+
+
 # oneOf :: (Stream s m Char) => [Char] -> ParsecT s u m Char
 # {-# INLINABLE oneOf #-}
 # oneOf cs            = satisfy (\c -> elem c cs)
 
 
-def one_of(cs: str) -> Parsec[Iterable[str], _U, str]:
-    return satisfy(lambda c: elem(c, cs))
+def one_of(cs: str | CharSet | Iterable[Any]) -> Parsec[Iterable[str], _U, str]:
+    if type(cs) is str:
+        return satisfy(CharSet(cs))
+    if type(cs) is CharSet:
+        return satisfy(cs)
+    # Other tokens, such as the ints of bytes input
+    members = frozenset(cs)
+    return satisfy(members.__contains__).with_first(members)
 
 
 def _test_one_of():
@@ -67,6 +300,9 @@ def _test_one_of():
     assert parse(one_of("ab"), "", "c") == ParseError(
         SourcePos("", 1, 1), [SysUnExpect("c")]
     )
+    assert parse(one_of(CharSet.range("a", "z") - CharSet("x")), "", "q") == "q"
+    assert parse(one_of(b"ab"), "", b"b") == ord("b")
+    assert one_of("ab").first == frozenset(["a", "b", ord("a"), ord("b")])
 
 
 # -- | As the dual of 'oneOf', @noneOf cs@ succeeds if the current
@@ -80,8 +316,13 @@ def _test_one_of():
 # noneOf cs           = satisfy (\c -> not (elem c cs))
 
 
-def none_of(cs: str) -> Parsec[Iterable[str], _U, str]:
-    return satisfy(lambda c: not elem(c, cs))
+def none_of(cs: str | CharSet | Iterable[Any]) -> Parsec[Iterable[str], _U, str]:
+    if type(cs) is str:
+        return satisfy(~CharSet(cs))
+    if type(cs) is CharSet:
+        return satisfy(~cs)
+    members = frozenset(cs)
+    return satisfy(lambda c: c not in members)
 
 
 def _test_none_of():
@@ -95,6 +336,395 @@ def _test_none_of():
         SourcePos("", 1, 1), [SysUnExpect("b")]
     )
     assert parse(none_of("ab"), "", "c") == "c"
+    assert parse(none_of("ab"), "", "é") == "é"
+    assert parse(none_of(CharSet.range("0", "9")), "", "5") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("5")]
+    )
+
+
+# ! Span primitives. Unlike many (satisfy f), they scan the whole run of
+# ! matching characters in one loop over the input, and return it as a single
+# ! slice with one state and position update at the end.
+
+
+def _scan(f: Callable[[Any], bool] | CharSet, input: Sequence[Any], o: int) -> int:
+    if type(f) is CharSet:
+        if type(input) is str:
+            return f.span(input, o)
+        f = f.contains
+    end = len(input)
+    while o < end and f(input[o]):
+        o += 1
+    return o
+
+
+def _scan_more(
+    f: Callable[[Any], bool],
+    s: State[Iterable[str], _U],
+    i: int,
+    done: Callable[[int, State[Iterable[str], _U]], Any],
+) -> Any:
+    # _scan from i of a span which reached the end of partial input. The scan
+    # resumes where it stopped, and done gets the state over the longer input.
+    def resume(input, shift):
+        s_ = State(input, s._pos, s.user_state, s.offset + shift, s.ctx)
+        i_ = _scan(f, input, i + shift)
+        if i_ == len(input) and partial_input(s_):
+            return _scan_more(f, s_, i_, done)
+        return done(i_, s_)
+
+    return Suspend(resume, s)
+
+
+def _unexpect_at(
+    input: Sequence[Any], i: int, pos: SourcePos | OffsetPos
+) -> ParseError:
+    # The error satisfy would give at i
+    return ParseError.lazy(
+        pos, lambda: [SysUnExpect(str(input[i]) if i < len(input) else "")]
+    )
+
+
+def _span(
+    i: int,
+    s: State[Iterable[str], _U],
+    cok: Callable[[Any, State[Iterable[str], _U], ParseError], Any],
+    eok: Callable[[Any, State[Iterable[str], _U], ParseError], Any],
+    keep: bool,
+) -> Any:
+    input = s.input
+    o = s.offset
+    if i == o:
+        err = _unexpect_at(input, i, s.error_pos())
+        return eok(input[o:o] if keep else None, s, err)
+
+    span = input[o:i]
+    pos = s._pos and update_pos_string(s._pos, span)
+    s_ = State(input, pos, s.user_state, i, s.ctx)
+    return cok(span if keep else None, s_, _unexpect_at(input, i, s_.error_pos()))
+
+
+# -- | @takeWhile f@ consumes the longest prefix of characters satisfying @f@
+# -- and returns it. Equivalent to @many (satisfy f)@, joined.
+
+
+def take_while(
+    f: Callable[[str], bool] | CharSet,
+) -> Parsec[Iterable[str], _U, str]:
+    def _un_parser(s, cok, _cerr, eok, _eerr):
+        i = _scan(f, s.input, s.offset)
+        if i == len(s.input) and partial_input(s):
+            return _scan_more(f, s, i, lambda i, s: _span(i, s, cok, eok, True))
+        return _span(i, s, cok, eok, True)
+
+    return Parsec(_un_parser)
+
+
+def _test_take_while():
+    assert parse(take_while(str.isdigit), "", "") == ""
+    assert parse(take_while(str.isdigit), "", "123abc") == "123"
+    assert parse(take_while(str.isdigit), "", "abc") == ""
+    assert parse(take_while(str.isdigit).then(char("x")), "", "12\n3y") == ParseError(
+        SourcePos("", 1, 3), [SysUnExpect("\n"), SysUnExpect("\n")]
+    )
+    assert parse(take_while(lambda c: c != "y").then(char("x")), "", "1\n\ty") == (
+        ParseError(SourcePos("", 2, 9), [SysUnExpect("y"), SysUnExpect("y")])
+    )
+    p = take_while(lambda c: c != "y").then(char("x"))
+    assert run_pt(p, None, "", "1\n\ty", lazy_positions=True) == parse(p, "", "1\n\ty")
+
+    seen = []
+    digits = take_while(lambda c: seen.append(c) or c.isdigit())
+    r = run_partial(digits, None, "", "12").feed("34").feed("5;")
+    assert r == Done("12345", ";") and "".join(seen) == "12345;"
+
+    word = take_while(CharSet.range("a", "z") | CharSet("_"))
+    assert parse(word.skip(char(" ")), "", "snake_case é") == "snake_case"
+    assert parse(word, "", MappedText(b"ab_c!")) == "ab_c"
+    p = word.then(char("!"))
+    assert parse(p, "", "ab\ncd") == ParseError(
+        SourcePos("", 1, 3), [SysUnExpect("\n"), SysUnExpect("\n")]
+    )
+    assert run_partial(word, None, "", "ab").feed("c_").feed("d!") == Done(
+        "abc_d", "!"
+    )
+
+
+# -- | @takeWhile1 f@ is like 'takeWhile', but fails unless at least one
+# -- character satisfies @f@. Equivalent to @many1 (satisfy f)@, joined.
+
+
+def _span1(i, s, cok, eok, eerr):
+    if i == s.offset:
+        return eerr(_unexpect_at(s.input, i, s.error_pos()))
+    return _span(i, s, cok, eok, True)
+
+
+def take_while1(
+    f: Callable[[str], bool] | CharSet,
+) -> Parsec[Iterable[str], _U, str]:
+    def _un_parser(s, cok, _cerr, eok, eerr):
+        i = _scan(f, s.input, s.offset)
+        if i == len(s.input) and partial_input(s):
+            return _scan_more(f, s, i, lambda i, s: _span1(i, s, cok, eok, eerr))
+        return _span1(i, s, cok, eok, eerr)
+
+    return Parsec(_un_parser)
+
+
+def _test_take_while1():
+    assert parse(take_while1(str.isdigit), "", "") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("")]
+    )
+    assert parse(take_while1(str.isdigit), "", "123abc") == "123"
+    assert parse(take_while1(str.isdigit), "", "abc") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("a")]
+    )
+
+
+# -- | @skipWhile f@ skips the longest prefix of characters satisfying @f@.
+# -- Equivalent to @skipMany (satisfy f)@.
+
+
+def skip_while(
+    f: Callable[[str], bool] | CharSet,
+) -> Parsec[Iterable[str], _U, None]:
+    def _un_parser(s, cok, _cerr, eok, _eerr):
+        i = _scan(f, s.input, s.offset)
+        if i == len(s.input) and partial_input(s):
+            return _scan_more(f, s, i, lambda i, s: _span(i, s, cok, eok, False))
+        return _span(i, s, cok, eok, False)
+
+    return Parsec(_un_parser)
+
+
+def _test_skip_while():
+    assert parse(skip_while(str.isspace), "", "") is None
+    assert parse(skip_while(str.isspace).then(char("a")), "", " \n a") == "a"
+    assert parse(skip_while(str.isspace).then(char("a")), "", " \n b") == ParseError(
+        SourcePos("", 2, 2), [SysUnExpect("b"), SysUnExpect("b")]
+    )
+
+
+# -- | @takeN n@ consumes exactly @n@ characters and returns them.
+# -- Equivalent to @count n anyChar@, joined.
+
+
+def take_n(n: int) -> Parsec[Iterable[str], _U, str]:
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        end = len(input)
+        if n <= 0:
+            return eok(input[o:o], s, _unexpect_at(input, o, s.error_pos()))
+        if o + n <= end:
+            span = input[o : o + n]
+            pos = s._pos and update_pos_string(s._pos, span)
+            s_ = State(input, pos, s.user_state, o + n, s.ctx)
+            return cok(span, s_, UNKNOWN_ERROR)
+        if partial_input(s):
+            return suspend(_un_parser, s, cok, cerr, eok, eerr)
+        if o == end:
+            return eerr(_unexpect_at(input, end, s.error_pos()))
+        return cerr(_unexpect_at(input, end, s.error_pos(end)))
+
+    return Parsec(_un_parser)
+
+
+def _test_take_n():
+    assert parse(take_n(0), "", "") == ""
+    assert parse(take_n(2), "", "abc") == "ab"
+    assert parse(take_n(2), "", "") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("")]
+    )
+    assert parse(take_n(2), "", "a") == ParseError(
+        SourcePos("", 1, 2), [SysUnExpect("")]
+    )
+    assert run_partial(take_n(3), None, "", "a").feed("bcd") == Done("abc", "d")
+
+
+# -- | @scanUntil end@ skips to the first occurrence of the literal @end@ and
+# -- past it, and returns the input it skipped before @end@. Equivalent to
+# -- @manyTill anyChar (try (string end))@, joined, but the input is searched
+# -- by @find@ and the position advanced once.
+
+
+def scan_until(end: str | bytes) -> Parsec[Iterable[str], _U, Any]:
+    """
+    Fails without consuming input, at the end of the input, when end does not
+    occur. Also works on bytes input with a bytes end.
+    """
+    n = len(end)
+    next_pos = literal_next_pos(end)
+    label = end if isinstance(end, str) else repr(end)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        find = getattr(input, "find", None)
+        if find is not None:
+            i = find(end, o)
+        else:
+            i = next(
+                (i for i in range(o, len(input) - n + 1) if input[i : i + n] == end),
+                -1,
+            )
+        if i < 0:
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, cerr, eok, eerr)
+            return eerr(
+                ParseError.lazy(
+                    s.error_pos(len(input)),
+                    lambda: [Expect(label), SysUnExpect("")],
+                )
+            )
+
+        span = input[o:i]
+        if n == 0 and i == o:
+            return eok(span, s, UNKNOWN_ERROR)
+        pos = s._pos and next_pos(update_pos_string(s._pos, span), end)
+        return cok(span, State(input, pos, s.user_state, i + n, s.ctx), UNKNOWN_ERROR)
+
+    return Parsec(_un_parser)
+
+
+def _test_scan_until():
+    comment = string("/*").then(scan_until("*/"))
+    p = comment.then(get_position())
+    assert parse(comment, "", "/* a\n * b */c") == " a\n * b "
+    assert parse(p, "", "/* a\n\t* b */c") == SourcePos("", 2, 15)
+    lazy = run_pt(p, None, "", "/* a\n\t*/", lazy_positions=True)
+    assert lazy == SourcePos("", 2, 11)
+    assert parse(comment, "", "/**/") == ""
+    assert parse(comment, "", "/* a\n b") == ParseError(
+        SourcePos("", 2, 3), [Expect("*/"), SysUnExpect("")]
+    )
+    assert parse(scan_until("").then(any_char), "", "ab") == "a"
+    assert parse(scan_until(b"\r\n"), "", b"HTTP/1.1\r\n") == b"HTTP/1.1"
+    assert parse(scan_until(["z"]), "", ["x", "y", "z"]) == ["x", "y"]
+
+    r = run_partial(scan_until("-->"), None, "", "a -").feed("- b -->")
+    assert r == Done("a -- b ", "")
+
+
+# ! Regex primitives hand a whole lexeme to the re engine. The pattern is
+# ! matched at the current offset of str or bytes input, and the match is
+# ! consumed in one step. re cannot tell input which does not match from a
+# ! match cut short at the end of a chunk, so under run_partial they raise a
+# ! ValueError instead of failing on valid input.
+
+
+def _regex(
+    pattern: str | bytes | re.Pattern,
+    flags: int,
+    groups: bool,
+) -> Parsec[Iterable[str], _U, Any]:
+    if flags and isinstance(pattern, re.Pattern):
+        raise ValueError("flags cannot be given with a compiled pattern")
+    compiled = re.compile(pattern, flags)
+    match_ = compiled.match
+
+    def _un_parser(s, cok, _cerr, eok, eerr):
+        if partial_input(s):
+            raise ValueError("regex cannot run with run_partial")
+        input = s.input
+        o = s.offset
+        mapped = type(input) is MappedText
+        if mapped:
+            m = input.bytes_pattern(compiled).match(input.buffer, o)
+        else:
+            m = match_(input, o)
+        if m is None:
+            return eerr(
+                ParseError.lazy(
+                    s.error_pos(),
+                    lambda: [
+                        Expect(str(compiled.pattern)),
+                        SysUnExpect(str(input[o]) if o < len(input) else ""),
+                    ],
+                )
+            )
+
+        i = m.end()
+        if not groups:
+            x = input[o:i] if mapped else m.group(0)
+        elif mapped:
+            encoding = input.encoding
+            x = tuple(g and g.decode(encoding, "surrogateescape") for g in m.groups())
+        else:
+            x = m.groups()
+        if i == o:
+            return eok(x, s, UNKNOWN_ERROR)
+        pos = s._pos and update_pos_string(s._pos, input[o:i])
+        return cok(x, State(input, pos, s.user_state, i, s.ctx), UNKNOWN_ERROR)
+
+    return Parsec(_un_parser)
+
+
+# -- | @regex pattern@ parses the longest match of @pattern@ at the current
+# -- position, as by @re.match@, and returns the matched text. As with
+# -- @re.compile@, @flags@ cannot be given with a compiled @pattern@. It
+# -- cannot run with 'run_partial', which raises a ValueError.
+
+
+def regex(
+    pattern: str | bytes | re.Pattern,
+    flags: int = 0,
+) -> Parsec[Iterable[str], _U, str]:
+    return _regex(pattern, flags, False)
+
+
+def _test_regex():
+    pattern = r"[-+]?\d+(\.\d*)?([eE][-+]?\d+)?"
+    float_ = regex(pattern)
+    assert parse(float_, "", "-1.5e3x") == "-1.5e3"
+    assert parse(float_, "", "x") == ParseError(
+        SourcePos("", 1, 1), [Expect(pattern), SysUnExpect("x")]
+    )
+    assert parse(float_, "", "") == ParseError(
+        SourcePos("", 1, 1), [Expect(pattern), SysUnExpect("")]
+    )
+    assert parse(regex("a*"), "", "b") == ""
+    assert parse(char("x").then(regex(r"a\nb*")).then(char("c")), "", "xa\nbbd") == (
+        ParseError(SourcePos("", 2, 3), [SysUnExpect("d")])
+    )
+    assert parse(regex(rb"\d+"), "", b"12ab") == b"12"
+    assert parse(regex("abc", re.IGNORECASE), "", "ABC") == "ABC"
+    assert parse(regex(re.compile("abc", re.IGNORECASE)), "", "ABC") == "ABC"
+    for make in [regex, regex_groups]:
+        try:
+            make(re.compile("abc"), re.IGNORECASE)
+            assert False
+        except ValueError as e:
+            assert "compiled pattern" in str(e)
+    for p, chunk in [(regex("true"), "tr"), (float_.skip(char(";")), "1.5;")]:
+        try:
+            run_partial(p, None, "", chunk)
+            assert False
+        except ValueError as e:
+            assert "run_partial" in str(e)
+
+
+# -- | @regexGroups pattern@ is like 'regex', but returns the groups of the
+# -- match.
+
+
+def regex_groups(
+    pattern: str | bytes | re.Pattern,
+    flags: int = 0,
+) -> Parsec[Iterable[str], _U, tuple]:
+    return _regex(pattern, flags, True)
+
+
+def _test_regex_groups():
+    uuid = regex_groups(r"([0-9a-f]{8})-([0-9a-f]{4})")
+    assert parse(uuid, "", "deadbeef-0123") == ("deadbeef", "0123")
+    assert parse(regex_groups(r'"((?:[^"\\]|\\.)*)"'), "", r'"a\"b"') == ('a\\"b',)
+    try:
+        run_partial(regex_groups(r'"([^"]*)"'), None, "", '"ab')
+        assert False
+    except ValueError as e:
+        assert "run_partial" in str(e)
 
 
 # -- | Parses a white space character (any character which satisfies 'isSpace')
@@ -127,7 +757,8 @@ def _test_space():
 # def spaces() -> ParsecT[Iterable[str], _U, None]:
 #     return skip_many(space)
 
-spaces = skip_many(space)
+# ! skip_while scans the whole run at once, instead of a parse per character
+spaces = skip_while(str.isspace)
 
 
 def _test_spaces():
@@ -148,7 +779,7 @@ def _test_spaces():
 
 
 def char(c: str) -> Parsec[Iterable[str], _U, str]:
-    return satisfy(lambda x: x == c)
+    return satisfy(lambda x: x == c).with_first(c)
 
 
 def _test_char():
@@ -354,11 +985,11 @@ def _test_digit():
 # hexDigit            = satisfy isHexDigit    <?> "hexadecimal digit"
 
 
-def _is_hex_digit(c: str) -> bool:
-    return "0" <= c <= "9" or "a" <= c <= "f" or "A" <= c <= "F"
-
+hex_digits = (
+    CharSet.range("0", "9") | CharSet.range("a", "f") | CharSet.range("A", "F")
+)
 
-hex_digit = satisfy(_is_hex_digit)
+hex_digit = satisfy(hex_digits)
 
 
 def _test_hex_digit():
@@ -381,11 +1012,9 @@ def _test_hex_digit():
 # octDigit            = satisfy isOctDigit    <?> "octal digit"
 
 
-def _is_oct_digit(c: str) -> bool:
-    return "0" <= c <= "7"
-
+oct_digits = CharSet.range("0", "7")
 
-oct_digit = satisfy(_is_oct_digit)
+oct_digit = satisfy(oct_digits)
 
 
 def _test_oct_digit():
@@ -429,9 +1058,7 @@ def _test_any_char():
 
 
 def string(s: str) -> Parsec[Iterable[str], _U, str]:
-    return tokens(
-        lambda cs: "".join(cs), lambda pos, cs: update_pos_char(pos, "".join(cs)), s
-    ).fmap(lambda cs: "".join(cs))
+    return tokens("".join, literal_next_pos(s), s)
 
 
 def _test_string():
@@ -443,6 +1070,9 @@ def _test_string():
     assert parse(string("abc"), "", "ab") == ParseError(
         SourcePos("", 1, 1), [Expect(value="abc"), SysUnExpect(value="")]
     )
+    assert parse(string("a\nb").then(char("x")), "", "a\nby") == ParseError(
+        SourcePos("", 2, 2), [SysUnExpect("y")]
+    )
 
 
 # -- | @'string'' s@ parses a sequence of characters given by @s@.
@@ -459,9 +1089,7 @@ def _test_string():
 
 
 def string_(s: str) -> Parsec[Iterable[str], _U, str]:
-    return tokens(
-        lambda cs: "".join(cs), lambda pos, cs: update_pos_char(pos, "".join(cs)), s
-    ).fmap(lambda cs: "".join(cs))
+    return tokens_("".join, literal_next_pos(s), s)
 
 
 def _test_string_():
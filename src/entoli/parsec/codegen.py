@@ -0,0 +1,902 @@
+import hashlib
+import marshal
+import os
+import sys
+from types import CodeType
+from typing import Any, TypeVar
+
+from entoli.parsec.interp import _run, interpret, optimize
+from entoli.parsec.node import (
+    Alt,
+    Bind,
+    Dispatch,
+    Fail,
+    First,
+    InputLeaf,
+    Label,
+    Leaf,
+    Literal,
+    Many,
+    Map,
+    Node,
+    Pure,
+    Ref,
+    Then,
+    Token,
+    Tokens,
+    Try,
+    node_of,
+)
+from entoli.parsec.prim import (
+    Bounce,
+    OffsetPos,
+    ParseError,
+    Parsec,
+    SourcePos,
+    State,
+    SysUnExpect,
+    UNKNOWN_ERROR,
+    _Rest,
+    enter_label,
+    error_is_unknown,
+    exit_label,
+    label,
+    many,
+    many_err,
+    merge_error,
+    new_error_unknown,
+    parse,
+    run_pt,
+    set_expect_errors,
+    try_,
+)
+
+# Imported for testing
+from entoli.parsec.char import (
+    any_char,
+    char,
+    digit,
+    letter,
+    one_of,
+    satisfy,
+    spaces,
+    string,
+)
+from entoli.parsec.combinator import choice, sep_by
+from entoli.parsec.prim import fix, run_partial, set_input
+
+_S = TypeVar("_S")
+_U = TypeVar("_U")
+_A = TypeVar("_A")
+
+# ! compile_parser turns an optimized node tree into Python source. Every
+# ! composite node becomes a local function of a factory, which is called
+# ! once per input and closes over it. A node function takes the offset,
+# ! position and user state and returns (kind, value, offset, position, user
+# ! state, error), following the interpreter of entoli.parsec.interp. Token,
+# ! literal, fmap, try_ and label nodes are inlined into their parent. Nodes
+# ! which are only known at run time, Bind results and Leaf closures, are run
+# ! by the interpreter. The source only names the functions and values of the
+# ! grammar, so its code object is cached by the hash of the source.
+# ! A function which may recurse, through a Ref or through another such
+# ! function, is a generator. It yields its calls to _drive, which keeps the
+# ! callers on an explicit stack, so the Python stack does not grow with the
+# ! nesting of the input. Other calls are direct.
+
+_COK = 0
+_CERR = 1
+_EOK = 2
+_EERR = 3
+
+_cache: dict[str, CodeType] = {}
+
+
+def _eof_error(pos: SourcePos | OffsetPos) -> ParseError:
+    return ParseError.lazy(pos, lambda: [SysUnExpect("")])
+
+
+def _token_error(pos: SourcePos | OffsetPos, show: Any, c: Any) -> ParseError:
+    return ParseError.lazy(pos, lambda: [SysUnExpect(show(c))])
+
+
+class _Gen:
+    def __init__(self):
+        self.consts: dict[str, Any] = {}
+        self.const_ids: dict[int, str] = {}
+        self.funcs: dict[int, str] = {}
+        self.memo_keys: dict[int, str] = {}
+        self.defs: list[list[str]] = []
+        # Numbers the locals of inlined snippets. o0, pos0 and u0 are the
+        # start of an alternation, so numbering starts at 1
+        self.locals = 1
+        self.done: set[str] = set()
+        self.suspending: set[str] = set()
+        self.yields = False
+
+    def const(self, x: Any) -> str:
+        name = self.const_ids.get(id(x))
+        if name is None:
+            name = f"_c{len(self.consts)}"
+            self.const_ids[id(x)] = name
+            self.consts[name] = x
+        return name
+
+    def literal(self, x: Any) -> str:
+        if type(x) is str or type(x) is bytes:
+            return repr(x)
+        return self.const(x)
+
+    def func(self, n: Node) -> str:
+        name = self.funcs.get(id(n))
+        if name is not None:
+            return name
+        name = self.funcs[id(n)] = f"_n{len(self.funcs)}"
+        # Reserve the slot first, so that definitions keep a stable order
+        i = len(self.defs)
+        self.defs.append([])
+        outer, self.yields = self.yields, False
+        body = self.body(n)
+        if self.yields:
+            self.suspending.add(name)
+        self.yields = outer
+        self.done.add(name)
+        self.defs[i] = [f"def {name}(o, pos, u):"] + _indent(body)
+        return name
+
+    def call(self, n: Node, args: str = "o, pos, u") -> str:
+        name = self.func(n)
+        if name in self.done and name not in self.suspending:
+            return f"{name}({args})"
+        # Unfinished functions are on a cycle, and may recurse
+        self.yields = True
+        return f"(yield {name}, {args})"
+
+    # A snippet leaves k, x and e set, and advances o, pos and u on success
+
+    def snippet(self, n: Node) -> list[str]:
+        t = type(n)
+        if t is First and type(n.p) is Token:
+            return self.token(n.p, n.first)
+        if t is First:
+            return self.snippet(n.p)
+        if t is Token:
+            return self.token(n, None)
+        if t is Tokens:
+            return self.tokens(n)
+        if t is Literal:
+            return self.literal_(n)
+        if t is Map:
+            return self.snippet(n.p) + [
+                "if k == 0 or k == 2:",
+                f"    x = {self.const(n.f)}(x)",
+            ]
+        if t is Try:
+            return self.try_(n)
+        if t is Label:
+            return self.label(n)
+        if t is Pure:
+            return ["k = 2", f"x = {self.const(n.value)}", "e = UNKNOWN_ERROR"]
+        if t is Fail:
+            return ["k = 3", "x = None", "e = new_error_unknown(_err_at(o, pos))"]
+        if t is InputLeaf:
+            raise ValueError("set_input is not supported in compiled parsers")
+        if t is Leaf:
+            un_parser = self.const(n.parser.un_parser)
+            return [f"k, x, o, pos, u, e = _closure({un_parser}, o, pos, u)"]
+        if t is Ref:
+            # Through the function of the target, which closes the cycle
+            p = n.cell[0]
+            if p is None:
+                raise ValueError("forward parser used before define")
+            return [f"k, x, o, pos, u, e = {self.call(node_of(p))}"]
+        return [f"k, x, o, pos, u, e = {self.call(n)}"]
+
+    def token(self, n: Token, first: frozenset | None) -> list[str]:
+        test = self.const(n.test)
+        hit = f"r = {test}(c)"
+        if first is not None:
+            hit = f"r = {test}(c) if c in {self.const(first)} else None"
+        lines = [
+            "if o < n_input:",
+            "    c = input[o]",
+            f"    {hit}",
+            "    if r:",
+            "        x = r.value",
+        ]
+        if n.next_state:
+            ns = self.const(n.next_state.value)
+            lines.append(f"        u = {ns}(_at(o, pos), c, _Rest(input, o + 1), u)")
+        lines += [
+            "        if pos is not None:",
+            f"            pos = {self.const(n.next_pos)}(pos, c, _Rest(input, o + 1))",
+            "        o += 1",
+            "        k = 0",
+            "        e = UNKNOWN_ERROR",
+            "    else:",
+            "        k = 3",
+            "        x = None",
+            f"        e = _token_error(_err_at(o, pos), {self.const(n.show)}, c)",
+            "else:",
+            "    k = 3",
+            "    x = None",
+            "    e = _eof_error(_err_at(o, pos))",
+        ]
+        return lines
+
+    def try_(self, n: Try) -> list[str]:
+        i = self.locals
+        self.locals += 1
+        # Under packrat, memoized by a key of its own per node, since its
+        # replies differ from those of the interpreter
+        key = self.memo_keys.get(id(n))
+        if key is None:
+            key = self.memo_keys[id(n)] = self.const(object())
+        run = [
+            f"o{i}, pos{i}, u{i} = o, pos, u",
+            *self.snippet(n.p),
+            "if k == 1:",
+            "    if trace is not None:",
+            f"        trace.rollback(o{i}, _at(o{i}, pos{i}), e.source_pos)",
+            "    k = 3",
+            "if memo is not None:",
+            f"    s{i} = State(input, pos{i}, u{i}, o{i}, ctx)",
+            "    x = x if k == 0 or k == 2 else None",
+            f"    memo.put({key}, s{i}, k, (k, x, o, pos, u, e))",
+        ]
+        return [
+            "hit = None",
+            "if memo is not None:",
+            f"    hit = memo.get({key}, State(input, pos, u, o, ctx))",
+            "if hit is not None:",
+            "    k, x, o, pos, u, e = hit[1]",
+            "else:",
+            *_indent(run),
+        ]
+
+    def label(self, n: Label) -> list[str]:
+        i = self.locals
+        self.locals += 1
+        name = self.literal(", ".join(n.names))
+        return [
+            f"entered{i} = enter_label(ctx, {name}) if observed else None",
+            f"o{i} = o",
+            *self.snippet(n.p),
+            "if k == 3 or (k == 2 and not error_is_unknown(e)):",
+            f"    e = set_expect_errors(e, {self.const(n.names)})",
+            f"if entered{i} is not None:",
+            f"    consumed = o - o{i} if k == 0 else 0",
+            f"    exit_label(ctx, entered{i}, k == 0 or k == 2, consumed)",
+        ]
+
+    def tokens(self, n: Tokens) -> list[str]:
+        fallback = f"k, x, o, pos, u, e = _prim({self.const(n.un_parser)}, o, pos, u)"
+        if type(n.tts) is not str:
+            return [fallback]
+        tts = self.literal(n.tts)
+        return [
+            f"if is_str and input.startswith({tts}, o):",
+            f"    x = {tts}",
+            "    if pos is not None:",
+            f"        pos = {self.const(n.next_pos)}(pos, {tts})",
+            f"    o += {len(n.tts)}",
+            "    k = 0",
+            "    e = UNKNOWN_ERROR",
+            "else:",
+            f"    {fallback}",
+        ]
+
+    def literal_(self, n: Literal) -> list[str]:
+        lines = [
+            f"if is_str and input.startswith({self.literal(n.text)}, o):",
+            f"    x = {self.literal(n.parts[n.keep].tts)}",
+            "    if pos is not None:",
+        ]
+        for part in n.parts:
+            next_pos = self.const(part.next_pos)
+            lines.append(f"        pos = {next_pos}(pos, {self.literal(part.tts)})")
+        lines += [
+            f"    o += {len(n.text)}",
+            "    k = 0",
+            "    e = UNKNOWN_ERROR",
+            "else:",
+            f"    k, x, o, pos, u, e = {self.call(n.reference)}",
+        ]
+        return lines
+
+    # Bodies of node functions
+
+    def body(self, n: Node) -> list[str]:
+        t = type(n)
+        if t is Then:
+            return self.then(n)
+        if t is Alt:
+            return self.alt(n)
+        if t is Many:
+            return self.many(n)
+        if t is Bind:
+            return self.bind(n)
+        if t is Dispatch:
+            return self.dispatch(n)
+        return self.snippet(n) + ["return k, x, o, pos, u, e"]
+
+    def then(self, n: Then) -> list[str]:
+        lines = ["consumed = False", "e0 = UNKNOWN_ERROR", "kept = None"]
+        for i, p in enumerate(n.ps):
+            lines += self.snippet(p)
+            lines += [
+                "if k == 1:",
+                "    return 1, None, o, pos, u, e",
+                "if k == 0:",
+                "    consumed = True",
+            ]
+            if i > 0:
+                lines += [
+                    "elif not error_is_unknown(e0):",
+                    "    e = merge_error(e0, e)",
+                ]
+            lines += [
+                "if k == 3:",
+                "    return (1 if consumed else 3), None, o, pos, u, e",
+                "e0 = e",
+            ]
+            if n.keep is None:
+                lines.append(f"x{i} = x")
+            elif i == n.keep:
+                lines.append("kept = x")
+        if n.keep is None:
+            lines.append(f"kept = ({''.join(f'x{i}, ' for i in range(len(n.ps)))})")
+        lines.append("return (0 if consumed else 2), kept, o, pos, u, e0")
+        return lines
+
+    def alt(self, n: Alt) -> list[str]:
+        lines = ["o0, pos0, u0 = o, pos, u"]
+        for i, p in enumerate(n.ps):
+            if i > 0:
+                lines.append("o, pos, u = o0, pos0, u0")
+            lines += self.snippet(p)
+            if i == 0:
+                lines += ["if k != 3:", "    return k, x, o, pos, u, e", "acc = e"]
+            else:
+                lines += [
+                    "if k == 2:",
+                    "    if e is UNKNOWN_ERROR:",
+                    "        e = new_error_unknown(_err_at(o, pos))",
+                    "    return 2, x, o, pos, u, merge_error(acc, e)",
+                    "if k != 3:",
+                    "    return k, x, o, pos, u, e",
+                    "acc = merge_error(acc, e)",
+                ]
+        lines.append("return 3, None, o0, pos0, u0, acc")
+        return lines
+
+    def many(self, n: Many) -> list[str]:
+        p = self.snippet(n.p)
+        lines = ["xs = []" if n.collect else "xs = None"]
+        lines += p
+        lines += [
+            "if k == 2:",
+            "    many_err()",
+            "if k != 0:",
+        ]
+        if n.at_least_one:
+            lines.append("    return k, None, o, pos, u, e")
+        else:
+            lines += [
+                "    if k == 1:",
+                "        return 1, None, o, pos, u, e",
+                "    return 2, xs, o, pos, u, e",
+            ]
+        lines.append("while True:")
+        body = ["xs.append(x)"] if n.collect else []
+        body += ["lo, lpos, lu = o, pos, u"]
+        body += p
+        body += [
+            "if k != 0:",
+            "    if k == 2:",
+            "        many_err()",
+            "    if k == 1:",
+            "        return 1, None, o, pos, u, e",
+            "    return 0, xs, lo, lpos, lu, e",
+        ]
+        return lines + _indent(body)
+
+    def bind(self, n: Bind) -> list[str]:
+        return self.snippet(n.p) + [
+            "if k == 1 or k == 3:",
+            "    return k, None, o, pos, u, e",
+            "consumed = k == 0",
+            "e0 = e",
+            f"k, x, o, pos, u, e = _leaf(node_of({self.const(n.k)}(x)), o, pos, u)",
+            "if k == 2 or k == 3:",
+            "    if not error_is_unknown(e0):",
+            "        e = merge_error(e0, e)",
+            "    if consumed:",
+            "        k = 0 if k == 2 else 1",
+            "return k, x, o, pos, u, e",
+        ]
+
+    def dispatch(self, n: Dispatch) -> list[str]:
+        groups: dict[tuple[bool, ...], int] = {n.default: 0}
+        keys: dict[Any, int] = {}
+        for c, runs in n.table.items():
+            keys[c] = groups.setdefault(runs, len(groups))
+        table = self.const(keys)
+
+        lines = [
+            "o0, pos0, u0 = o, pos, u",
+            "g = 0",
+            "if o < n_input:",
+            "    try:",
+            f"        g = {table}.get(input[o], 0)",
+            "    except TypeError:",
+            "        pass",
+        ]
+        for runs, g in groups.items():
+            lines.append(f"{'if' if g == 0 else 'elif'} g == {g}:")
+            lines += _indent(self.candidates(n.full.ps, runs))
+        return lines
+
+    def candidates(self, ps: tuple[Node, ...], runs: tuple[bool, ...]) -> list[str]:
+        # Runs the candidates in order until one does not fail empty, then the
+        # skipped alternatives before it for their errors, as the interpreter
+        n = len(ps)
+        lines = [f"end = {n}"]
+        for i, p in enumerate(ps):
+            if not runs[i]:
+                continue
+            run = [
+                "o, pos, u = o0, pos0, u0",
+                *self.snippet(p),
+                "if k == 0 or k == 1:",
+                "    return k, x, o, pos, u, e",
+                "if k == 2:",
+                f"    end = {i}",
+                "    kx, ko, kpos, ku, ke = x, o, pos, u, e",
+                "else:",
+                f"    err{i} = e",
+            ]
+            lines += run if len(lines) == 1 else [f"if end == {n}:"] + _indent(run)
+
+        for j, p in enumerate(ps):
+            if runs[j]:
+                merge = [f"e = err{j}"]
+            else:
+                merge = ["o, pos, u = o0, pos0, u0", *self.snippet(p), "if k == 2:"]
+                if j > 0:
+                    merge += [
+                        "    if e is UNKNOWN_ERROR:",
+                        "        e = new_error_unknown(_err_at(o, pos))",
+                        "    e = merge_error(acc, e)",
+                    ]
+                merge += [
+                    "    return 2, x, o, pos, u, e",
+                    "if k != 3:",
+                    "    return k, x, o, pos, u, e",
+                ]
+            merge.append("acc = e" if j == 0 else "acc = merge_error(acc, e)")
+            lines += [f"if end > {j}:"] + _indent(merge)
+
+        lines += [
+            f"if end == {n}:",
+            "    return 3, None, o0, pos0, u0, acc",
+            "if end > 0:",
+            "    if ke is UNKNOWN_ERROR:",
+            "        ke = new_error_unknown(_err_at(ko, kpos))",
+            "    ke = merge_error(acc, ke)",
+            "return 2, kx, ko, kpos, ku, ke",
+        ]
+        return lines
+
+
+def _indent(lines: list[str]) -> list[str]:
+    return ["    " + line for line in lines]
+
+
+_PRELUDE = """\
+def _factory(input, ctx):
+    n_input = len(input)
+    is_str = type(input) is str
+    lines = ctx.lines if ctx is not None else None
+    trace = ctx.trace if ctx is not None else None
+    memo = ctx.memo if ctx is not None and ctx.packrat else None
+    observed = ctx is not None and (ctx.profile is not None or trace is not None)
+
+    def _at(o, pos):
+        return pos if pos is not None else lines.pos_at(o)
+
+    def _err_at(o, pos):
+        return pos if pos is not None else OffsetPos(lines, o)
+
+    def _reply(r, o, pos, u):
+        k, x, s_, e = r
+        if s_ is None:
+            return k, x, o, pos, u, e
+        if s_.input is not input:
+            raise ValueError("set_input is not supported in compiled parsers")
+        return k, x, s_.offset, s_._pos, s_.user_state, e
+
+    def _prim(f, o, pos, u):
+        s = State(input, pos, u, o, ctx)
+        return _reply(f(s, _leaf_cok, _leaf_cerr, _leaf_eok, _leaf_eerr), o, pos, u)
+
+    def _closure(f, o, pos, u):
+        s = State(input, pos, u, o, ctx)
+        r = f(s, _leaf_cok, _leaf_cerr, _leaf_eok, _leaf_eerr)
+        while type(r) is Bounce:
+            r = r.f(*r.args)
+        return _reply(r, o, pos, u)
+
+    def _leaf(n, o, pos, u):
+        return _reply(_run(n, State(input, pos, u, o, ctx)), o, pos, u)
+"""
+
+
+def _leaf_cok(x: Any, s: State, err: ParseError) -> tuple:
+    return (_COK, x, s, err)
+
+
+def _leaf_cerr(err: ParseError) -> tuple:
+    return (_CERR, None, None, err)
+
+
+def _leaf_eok(x: Any, s: State, err: ParseError) -> tuple:
+    return (_EOK, x, s, err)
+
+
+def _leaf_eerr(err: ParseError) -> tuple:
+    return (_EERR, None, None, err)
+
+
+def _drive(g: Any) -> tuple:
+    # Runs the generator of a node function, and the calls it yields
+    stack = []
+    r = None
+    while True:
+        try:
+            f, o, pos, u = g.send(r)
+        except StopIteration as stop:
+            r = stop.value
+            if not stack:
+                return r
+            g = stack.pop()
+            continue
+        r = f(o, pos, u)
+        if type(r) is not tuple:
+            stack.append(g)
+            g = r
+            r = None
+
+
+def _generate(p: Parsec, optimized: bool) -> tuple[str, dict[str, Any]]:
+    node = node_of(p)
+    if optimized:
+        node = optimize(node)
+    gen = _Gen()
+    root = gen.func(node)
+    lines = _PRELUDE.split("\n")
+    for d in gen.defs:
+        lines += _indent(d) + [""]
+    if root in gen.suspending:
+        lines.append(f"    return lambda o, pos, u: _drive({root}(o, pos, u))")
+    else:
+        lines.append(f"    return {root}")
+    return "\n".join(lines) + "\n", gen.consts
+
+
+# -- | @compileSource p@ is the Python source which 'compile_parser' runs.
+
+
+def compile_source(p: Parsec[_S, _U, _A], optimized: bool = True) -> str:
+    return _generate(p, optimized)[0]
+
+
+def _code(source: str, cache_dir: str | os.PathLike | None) -> CodeType:
+    key = hashlib.sha256(
+        (sys.implementation.cache_tag or "").encode() + source.encode()
+    ).hexdigest()
+    code = _cache.get(key)
+    if code is not None:
+        return code
+
+    path = None
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"{key}.bin")
+        try:
+            with open(path, "rb") as f:
+                code = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            code = None
+
+    if code is None:
+        code = compile(source, f"<parsec {key[:12]}>", "exec")
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)  # type: ignore
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp, path)
+
+    _cache[key] = code
+    return code
+
+
+# -- | @compile_parser p@ compiles the grammar of @p@ into Python functions.
+# -- The result behaves as @p@, errors included. The input of a compiled
+# -- parser cannot be replaced with 'set_input': a grammar using it is
+# -- rejected with a ValueError, and so is a parser built at run time by
+# -- 'and_then' when it runs. A compiled parser cannot be suspended for
+# -- more input either, so running it with 'run_partial' raises a
+# -- ValueError. Under packrat, the replies of its 'try_' nodes are memoized
+# -- as by 'try_'. With @cache_dir@, compiled code is kept on disk, keyed by
+# -- the hash of the generated source.
+
+
+def compile_parser(
+    p: Parsec[_S, _U, _A],
+    *,
+    cache_dir: str | os.PathLike | None = None,
+    optimized: bool = True,
+) -> Parsec[_S, _U, _A]:
+    source, consts = _generate(p, optimized)
+    namespace: dict[str, Any] = {
+        "Bounce": Bounce,
+        "OffsetPos": OffsetPos,
+        "State": State,
+        "UNKNOWN_ERROR": UNKNOWN_ERROR,
+        "_Rest": _Rest,
+        "_drive": _drive,
+        "_eof_error": _eof_error,
+        "_leaf_cerr": _leaf_cerr,
+        "_leaf_cok": _leaf_cok,
+        "_leaf_eerr": _leaf_eerr,
+        "_leaf_eok": _leaf_eok,
+        "_run": _run,
+        "_token_error": _token_error,
+        "error_is_unknown": error_is_unknown,
+        "many_err": many_err,
+        "merge_error": merge_error,
+        "new_error_unknown": new_error_unknown,
+        "node_of": node_of,
+        "enter_label": enter_label,
+        "exit_label": exit_label,
+        "set_expect_errors": set_expect_errors,
+        **consts,
+    }
+    exec(_code(source, cache_dir), namespace)
+    factory = namespace["_factory"]
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        ctx = s.ctx
+        if ctx is None:
+            run = factory(input, ctx)
+        elif ctx.partial:
+            raise ValueError("run_partial is not supported in compiled parsers")
+        else:
+            # Cached in the context, which only lives as long as the run
+            built = ctx.compiled.get(factory)
+            if built is None or built[0] is not input:
+                built = ctx.compiled[factory] = (input, factory(input, ctx))
+            run = built[1]
+        k, x, o, pos, u, err = run(s.offset, s._pos, s.user_state)
+        if k == _COK:
+            return cok(x, State(input, pos, u, o, s.ctx), err)
+        if k == _CERR:
+            return cerr(err)
+        if k == _EOK:
+            return eok(x, State(input, pos, u, o, s.ctx), err)
+        return eerr(err)
+
+    return Parsec(_un_parser, p.first, node_of(p))
+
+
+def _grammar() -> Parsec:
+    number = many(digit).and_then(
+        lambda ds: Parsec.pure(int("".join(ds))) if ds else Parsec.mzero()
+    )
+    keyword = choice([try_(string("let")), try_(string("loop")), string("if")])
+    arrow = string("-").then(string(">")).then(string(" ")).skip(spaces)
+    name = many(letter).fmap("".join)
+    item = label(
+        "item", choice([keyword, number.fmap(str).fmap(len), one_of("xyz"), name])
+    )
+    return sep_by(item.skip(spaces), char(",").skip(spaces)).skip(arrow.mplus(spaces))
+
+
+def _test_compile_parser():
+    g = _grammar()
+    inputs = [
+        "",
+        "let, 12, x",
+        "let ,loop,if, 7 -> ",
+        "lo",
+        "let, ",
+        "q",
+        "12,,",
+        "-",
+        "- >",
+        "if, 1234, z ->  ",
+        "if, 1234, z -> q",
+        "abc\n,\tde, 1x",
+    ]
+    compiled = compile_parser(g)
+    unoptimized = compile_parser(g, optimized=False)
+    for input in inputs:
+        expected = parse(g, "", input)
+        assert parse(compiled, "", input) == expected
+        assert parse(unoptimized, "", input) == expected
+        assert run_pt(compiled, None, "", input, lazy_positions=True) == run_pt(
+            g, None, "", input, lazy_positions=True
+        )
+
+    # Failing primitives, alone and under fmap and label
+    for p in [char("b"), digit, one_of("ab"), any_char, Parsec.mzero()]:
+        for q in [p, p.fmap(str), label("x", p.fmap(str))]:
+            for input in ["x", ""]:
+                assert parse(compile_parser(q), "", input) == parse(q, "", input)
+
+
+def _test_compile_parser_fix():
+    def tree(self):
+        items = sep_by(self.mplus(digit), char(","))
+        return char("[").then(items).skip(char("]")).fmap(tuple)
+
+    g = fix(tree)
+    for optimized in [False, True]:
+        compiled = compile_parser(g, optimized=optimized)
+        for input in ["[]", "[1,[2,[]],3]", "[1,[2", "[[[[x]]]]", "[1,2]]"]:
+            assert parse(compiled, "", input) == parse(g, "", input)
+
+    # The nesting of the input does not grow the Python stack
+    nested = fix(lambda self: char("(").then(self).skip(char(")")).mplus(digit))
+    compiled = compile_parser(nested)
+    assert parse(compiled, "", "(" * 5000 + "7" + ")" * 5000) == "7"
+    unclosed = "(" * 5000 + "7)"
+    assert parse(compiled, "", unclosed) == parse(nested, "", unclosed)
+
+
+def _test_compile_parser_set_input():
+    g = string("a").then(set_input("b")).then(char("b"))
+    for p in [g, label("x", g), fix(lambda self: g.mplus(self))]:
+        try:
+            compile_parser(p)
+            assert False
+        except ValueError as e:
+            assert "set_input" in str(e)
+
+    late = compile_parser(char("a").and_then(lambda _: set_input("b")))
+    try:
+        parse(late, "", "a")
+        assert False
+    except ValueError as e:
+        assert "set_input" in str(e)
+
+
+def _test_compile_parser_partial():
+    compiled = compile_parser(_grammar())
+    try:
+        run_partial(compiled, None, "", "let, 1")
+        assert False
+    except ValueError as e:
+        assert "run_partial" in str(e)
+    assert parse(compiled, "", "let, 1") == parse(_grammar(), "", "let, 1")
+
+
+def _test_compile_parser_input():
+    import weakref
+
+    class Text(str):
+        pass
+
+    compiled = compile_parser(many(letter))
+    input = Text("abc")
+    ref = weakref.ref(input)
+    assert parse(compiled, "", input) == ["a", "b", "c"]
+    del input
+    assert ref() is None
+    assert parse(many(compiled.skip(char(","))), "", "ab,c,") == [["a", "b"], ["c"]]
+
+
+def _test_compile_parser_profile():
+    g = _grammar()
+    input = "let, 12, x, loop -> "
+    compiled = compile_parser(g)
+    assert run_pt(compiled, None, "", input, profile=False) == parse(g, "", input)
+
+    reference = run_pt(g, None, "", input, profile=True)[1]["item"]
+    item = run_pt(compiled, None, "", input, profile=True)[1]["item"]
+    assert (item.calls, item.ok, item.failed, item.consumed) == (
+        reference.calls,
+        reference.ok,
+        reference.failed,
+        reference.consumed,
+    )
+
+
+def _test_compile_parser_trace():
+    # Engines may re-parse differently, so the interpreter of the same tree
+    # is the reference
+    g = _grammar()
+    for optimized in [False, True]:
+        compiled = compile_parser(g, optimized=optimized)
+        interpreted = interpret(g, optimized=optimized)
+        for input in ["let, lo", "loop, le, 1 -> ", "if,\nlol"]:
+            expected = run_pt(interpreted, None, "", input, trace=True)[1]
+            r, report = run_pt(compiled, None, "", input, trace=True)
+            assert r == parse(g, "", input)
+            assert report.heatmap() == expected.heatmap()
+            assert [s.rollbacks for s in report.sites] == [
+                s.rollbacks for s in expected.sites
+            ]
+
+
+def _test_compile_parser_cache(tmp_path):
+    g = _grammar()
+    source = compile_source(g)
+    assert "def _factory(input, ctx):" in source and "while True:" in source
+
+    _cache.clear()
+    compile_parser(g, cache_dir=tmp_path)
+    assert len(os.listdir(tmp_path)) == 1
+
+    _cache.clear()
+    compiled = compile_parser(g, cache_dir=tmp_path)
+    assert len(os.listdir(tmp_path)) == 1
+    assert parse(compiled, "", "let, 12") == ["let", 2]
+
+
+def _test_compile_parser_packrat():
+    tests = []
+
+    def is_a(c):
+        tests.append(c)
+        return c == "a"
+
+    a = satisfy(is_a).with_first("a")
+    aa = try_(a.then(a))
+    p = try_(aa.then(char("x"))).mplus(aa.then(char("y")))
+    for optimized in [False, True]:
+        compiled = compile_parser(p, optimized=optimized)
+        for input in ["aay", "aax", "aaz"]:
+            expected = parse(p, "", input)
+            tests.clear()
+            assert run_pt(compiled, None, "", input, packrat=True) == expected
+            assert len(tests) == 2
+        assert run_pt(compiled, None, "", "ab", packrat=True) == parse(p, "", "ab")
+        assert run_pt(compiled, None, "", "aay", trace=True, packrat=True)[0] == "y"
+
+
+def _test_compile_parser_many():
+    n = 10_000
+    ab = compile_parser(many(string("a").then(string("b"))))
+    assert parse(ab, "", "ab" * n) == ["b"] * n
+    assert parse(ab, "", "ab" * n + "ac") == parse(
+        many(string("a").then(string("b"))), "", "ab" * n + "ac"
+    )
+
+
+def _test_compile_parser_dispatch_once():
+    tests = []
+
+    def is_a(c):
+        tests.append(c)
+        return c == "a"
+
+    a = satisfy(is_a).with_first("a")
+    p = char("b")
+    for _ in range(16):
+        p = try_(a.then(p)).mplus(char("b"))
+    compiled = compile_parser(p)
+    assert "g == 1:" in compile_source(p)
+
+    for input in ["a" * 16 + "c", "a" * 8 + "b", "b", "c", ""]:
+        expected = parse(p, "", input)
+        tests.clear()
+        assert parse(compiled, "", input) == expected
+        assert len(tests) == input.count("a")
+
+    # Skipped alternatives still contribute their errors, in order
+    q = char("x").mplus(string("").label("nothing")).mplus(char("y"))
+    compiled = compile_parser(q)
+    for input in ["x", "y", "z", ""]:
+        assert parse(compiled, "", input) == parse(q, "", input)
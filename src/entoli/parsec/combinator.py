@@ -1,23 +1,35 @@
-from typing import Callable, Iterable, TypeVar
+from typing import Any, Callable, Iterable, TypeVar
 
 from entoli.base.maybe import Just, Maybe, Nothing
 from entoli.parsec.prim import (
+    Bounce,
     ParseError,
     Parsec,
     SourcePos,
+    State,
     SysUnExpect,
+    UNKNOWN_ERROR,
     UnExpect,
+    error_is_unknown,
+    fix,
+    lift_a2,
     many1,
+    merge_error,
     parse,
+    partial_input,
     skip_many,
     token_prim,
     try_,
     unexpected,
+    with_unknown_pos,
 )
+from entoli.parsec.char import any_char, scan_until
+from entoli.parsec.node import Tokens, Try
 from entoli.prelude import append, foldr
 
 # Imported for testing
-from entoli.parsec.char import char
+from entoli.parsec.char import char, one_of, string
+from entoli.parsec.prim import get_position
 
 
 _S = TypeVar("_S")
@@ -62,7 +74,90 @@ def _test_many():
 # choice ps           = foldr (<|>) mzero ps
 
 
+# ! When alternatives declare first sets, choice dispatches on the next token
+# ! to the alternatives which can start with it, plus those with unknown first
+# ! sets. The skipped ones would fail without consuming input, and are only
+# ! run for their errors once the result is empty. Errors are merged in the
+# ! original order, so the merged error or empty result is unchanged, and no
+# ! alternative is run twice.
+
+
 def choice(ps: Iterable[Parsec[_S, _U, _T]]) -> Parsec[_S, _U, _T]:
+    ps = list(ps)
+    full = _alternatives(ps)
+    if sum(p.first is not None for p in ps) < 2:
+        return full
+
+    # Per token, the alternatives in order, each with whether it is run
+    plans: dict[tuple[bool, ...], tuple[tuple[Parsec[_S, _U, _T], bool], ...]] = {}
+
+    def plan(c: Any) -> tuple[tuple[Parsec[_S, _U, _T], bool], ...]:
+        runs = tuple(p.first is None or c in p.first for p in ps)
+        if runs not in plans:
+            plans[runs] = tuple(zip(ps, runs))
+        return plans[runs]
+
+    table = {c: plan(c) for p in ps if p.first is not None for c in p.first}
+    default = tuple((p, p.first is None) for p in ps)
+    # At the end of partial input the next token is not known yet
+    every = tuple((p, True) for p in ps)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        input = s.input
+        o = s.offset
+        steps = default
+        if o < len(input):
+            try:
+                steps = table.get(input[o], default)
+            except TypeError:
+                pass
+        elif partial_input(s):
+            steps = every
+
+        errs: dict[int, ParseError] = {}
+
+        def join(err, e, s_):
+            return e if err is None else merge_error(err, with_unknown_pos(e, s_))
+
+        def merged(i, end, err, then):
+            # Merges the errors of steps[i:end] into err in order, running
+            # the skipped alternatives for theirs
+            while i < end:
+                p, run = steps[i]
+                if not run:
+                    return Bounce(
+                        p.un_parser,
+                        s,
+                        cok,
+                        cerr,
+                        lambda x, s_, e: eok(x, s_, join(err, e, s_)),
+                        lambda e: merged(i + 1, end, join(err, e, s), then),
+                    )
+                err = join(err, errs[i], s)
+                i += 1
+            return then(err)
+
+        def step(i):
+            while i < len(steps) and not steps[i][1]:
+                i += 1
+            if i == len(steps):
+                return merged(0, i, None, eerr)
+
+            def eok_(x, s_, e):
+                return merged(0, i, None, lambda err: eok(x, s_, join(err, e, s_)))
+
+            def eerr_(e):
+                errs[i] = e
+                return step(i + 1)
+
+            return Bounce(steps[i][0].un_parser, s, cok, cerr, eok_, eerr_)
+
+        return step(0)
+
+    return Parsec(_un_parser, full.first, full.node)
+
+
+def _alternatives(ps: list[Parsec[_S, _U, _T]]) -> Parsec[_S, _U, _T]:
     return foldr(lambda x, y: x.mplus(y), Parsec.mzero(), ps)
 
 
@@ -77,6 +172,49 @@ def _test_choice():
     )
 
 
+def _test_choice_dispatch():
+    runs = []
+
+    def keyword(k):
+        p = try_(string(k))
+
+        def _un_parser(s, cok, cerr, eok, eerr):
+            runs.append(k)
+            return p.un_parser(s, cok, cerr, eok, eerr)
+
+        return Parsec(_un_parser, p.first)
+
+    keywords = ["if", "in", "else", "end", "let", "loop", "while"]
+    alts = [keyword(k) for k in keywords]
+    alts += [many1(char("x")).fmap("".join), string("").then(Parsec.pure("nil"))]
+    p = choice(alts)
+    assert p.first is None
+
+    reference = _alternatives(alts)
+    for input in ["if", "in", "else", "end", "loop", "xx", "ix", "e", "q", ""]:
+        assert parse(p, "", input) == parse(reference, "", input)
+
+    runs.clear()
+    assert parse(p, "", "while") == "while"
+    assert runs == ["while"]
+    runs.clear()
+    assert parse(p, "", "loop") == "loop"
+    assert runs == ["let", "loop"]
+    runs.clear()
+    assert parse(p, "", "ix") == parse(reference, "", "ix")
+    assert runs == keywords + keywords
+    runs.clear()
+    assert parse(p, "", "iq") == "nil"
+    assert runs == keywords
+
+    digits = choice([char("0"), char("1"), one_of("23")])
+    assert digits.first == frozenset("0123") | {ord("2"), ord("3")}
+    assert parse(many(digits), "", "3120") == ["3", "1", "2", "0"]
+    assert parse(digits, "", "4") == parse(
+        _alternatives([char("0"), char("1"), one_of("23")]), "", "4"
+    )
+
+
 # -- | @option x p@ tries to apply parser @p@. If @p@ fails without
 # -- consuming input, it returns the value @x@, otherwise the value
 # -- returned by @p@.
@@ -223,7 +361,13 @@ def sep_by1(
     p: Parsec[_S, _U, _T],
     sep: Parsec[_S, _U, _V],
 ) -> Parsec[_S, _U, Iterable[_T]]:
-    return p.and_then(lambda x: many(sep.then(p)).fmap(lambda xs: append([x], xs)))
+    return lift_a2(_cons, p, many(sep.then(p)))
+
+
+def _cons(x: _T, xs: list[_T]) -> list[_T]:
+    # xs is a fresh list from many, so it can be extended in place
+    xs.insert(0, x)
+    return xs
 
 
 def _test_sep_by1():
@@ -260,6 +404,9 @@ def _test_sep_by():
     assert parse(sep_by(char("a"), char(",")), "", "a,a") == ["a", "a"]
     assert parse(sep_by(char("a"), char(",")), "", "b") == []
 
+    xs = parse(sep_by(char("a"), char(",")), "", ",".join("a" * 10_000))
+    assert type(xs) is list and len(xs) == 10_000
+
     # -- | @sepEndBy p sep@ parses /zero/ or more occurrences of @p@,
 
 
@@ -338,7 +485,7 @@ def end_by1(
     p: Parsec[_S, _U, _T],
     sep: Parsec[_S, _U, _T],
 ) -> Parsec[_S, _U, Iterable[_T]]:
-    return many1(p.and_then(lambda x: sep.then(Parsec.pure(x))))
+    return many1(p.skip(sep))
 
 
 def _test_end_by1():
@@ -371,7 +518,7 @@ def end_by(
     p: Parsec[_S, _U, _T],
     sep: Parsec[_S, _U, _T],
 ) -> Parsec[_S, _U, Iterable[_T]]:
-    return many(p.and_then(lambda x: sep.then(Parsec.pure(x))))
+    return many(p.skip(sep))
 
 
 def _test_end_by():
@@ -404,12 +551,78 @@ def count(
 ) -> Parsec[_S, _U, Iterable[_T]]:
     if n <= 0:
         return Parsec[_S, _U, Iterable[_T]].pure([])
-    else:
-        return foldr(
-            lambda x, y: x.and_then(lambda x: y.fmap(lambda xs: append([x], xs))),
-            Parsec.pure([]),
-            [p] * n,
-        )
+
+    def _un_parser(
+        s: State[_S, _U],
+        cok: Callable[[Iterable[_T], State[_S, _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[Iterable[_T], State[_S, _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        seq = _Sequence(cok, cerr, eok, eerr)
+        xs: list[_T] = []
+
+        def pcok(x: _T, s_: State[_S, _U], err: ParseError) -> Any:
+            seq.consume(err)
+            return next_(x, s_)
+
+        def peok(x: _T, s_: State[_S, _U], err: ParseError) -> Any:
+            seq.pend(err)
+            return next_(x, s_)
+
+        def next_(x: _T, s_: State[_S, _U]) -> Any:
+            xs.append(x)
+            if len(xs) == n:
+                return seq.ok(xs, s_)
+            return Bounce(p.un_parser, s_, pcok, cerr, peok, seq.err)
+
+        return p.un_parser(s, pcok, cerr, peok, seq.err)
+
+    return Parsec(_un_parser)
+
+
+# ! Continuations of a sequence of binds run in a loop. Errors of steps which
+# ! did not consume are merged into a later empty result, as parserBind does,
+# ! and the first consuming step turns empty results into consumed ones.
+
+
+class _Sequence:
+    __slots__ = ("cok", "cerr", "eok", "eerr", "consumed", "pending")
+
+    def __init__(
+        self,
+        cok: Callable[[Any, State, ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[Any, State, ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ):
+        self.cok = cok
+        self.cerr = cerr
+        self.eok = eok
+        self.eerr = eerr
+        self.consumed = False
+        self.pending: list[ParseError] = []
+
+    def consume(self, err: ParseError) -> None:
+        self.consumed = True
+        self.pending = [] if error_is_unknown(err) else [err]
+
+    def pend(self, err: ParseError) -> None:
+        if not error_is_unknown(err):
+            self.pending.append(err)
+
+    def merged(self, err: ParseError) -> ParseError:
+        for e in reversed(self.pending):
+            err = merge_error(e, err)
+        return err
+
+    def ok(self, x: Any, s: State) -> Any:
+        k = self.cok if self.consumed else self.eok
+        return Bounce(k, x, s, self.merged(UNKNOWN_ERROR))
+
+    def err(self, err: ParseError) -> Any:
+        k = self.cerr if self.consumed else self.eerr
+        return Bounce(k, self.merged(err))
 
 
 def _test_count():
@@ -423,6 +636,7 @@ def _test_count():
     )
     assert parse(count(2, char("a")), "", "aa") == ["a", "a"]
     assert parse(count(2, char("a")), "", "aaa") == ["a", "a"]
+    assert parse(count(10_000, char("a")), "", "a" * 10_000) == ["a"] * 10_000
 
 
 # -- | @chainr p op x@ parses /zero/ or more occurrences of @p@,
@@ -504,12 +718,14 @@ def chainl1(
     p: Parsec[_S, _U, _T],
     op: Parsec[_S, _U, Callable[[_T, _T], _T]],
 ) -> Parsec[_S, _U, _T]:
-    def rest(x: _T) -> Parsec[_S, _U, _T]:
-        return op.and_then(lambda f: p.and_then(lambda y: rest(f(x, y)))).mplus(
-            Parsec.pure(x)
-        )
+    # The (f, y) pairs are collected by one many, built once, instead of a
+    # new rest parser for every operator
+    def fold(x: _T, rest: list[tuple[Callable[[_T, _T], _T], _T]]) -> _T:
+        for f, y in rest:
+            x = f(x, y)
+        return x
 
-    return p.and_then(rest)
+    return lift_a2(fold, p, many(lift_a2(lambda f, y: (f, y), op, p)))
 
 
 def _test_chain1():
@@ -546,15 +762,12 @@ def chainr1(
     p: Parsec[_S, _U, _T],
     op: Parsec[_S, _U, Callable[[_T, _T], _T]],
 ) -> Parsec[_S, _U, _T]:
-    def scan() -> Parsec[_S, _U, _T]:
-        def rest(x: _T) -> Parsec[_S, _U, _T]:
-            return op.and_then(lambda f: scan().fmap(lambda y: f(x, y))).mplus(
-                Parsec.pure(x)
-            )
-
-        return p.and_then(rest)
+    # scan is built once, and refers to itself through fix
+    def scan(self: Parsec[_S, _U, _T]) -> Parsec[_S, _U, _T]:
+        rest = lift_a2(lambda f, y: lambda x: f(x, y), op, self)
+        return lift_a2(lambda x, k: k(x), p, option(lambda x: x, rest))
 
-    return scan()
+    return fix(scan)
 
 
 def _test_chainr1():
@@ -567,6 +780,10 @@ def _test_chainr1():
     assert parse(chainr1(p, op), "", "1") == 1
     assert parse(chainr1(p, op), "", "1+1") == 2
     assert parse(chainr1(p, op), "", "1+1+1") == 3
+    assert parse(chainr1(p, op), "", "+".join("1" * 5000)) == 5000
+    assert parse(chainr1(p, op), "", "1+1+") == ParseError(
+        SourcePos("", 1, 5), [SysUnExpect(value="")]
+    )
 
 
 # -----------------------------------------------------------
@@ -687,13 +904,93 @@ def many_till(
     p: Parsec[_S, _U, _T],
     end: Parsec[_S, _U, _V],
 ) -> Parsec[_S, _U, Iterable[_T]]:
-    return end.then(Parsec.pure([])).mplus(
-        p.and_then(
-            lambda x: many_till(p, end).and_then(
-                lambda xs: Parsec.pure(append([x], xs))
-            )
+    scan = _many_till(p, end)
+    lit = _literal(end)
+    if p is not any_char or lit is None:
+        return scan
+    return _many_till_literal(lit, scan)
+
+
+# ! manyTill anyChar (try (string end)) tries end at every character. When
+# ! end is found further on, the characters up to it are skipped at once by
+# ! scan_until. Otherwise the parser runs as written, for the same error.
+
+
+def _literal(end: Parsec[_S, _U, _V]) -> str | None:
+    # A literal end must fail without consuming input, as a try_ or one char
+    node = end.node
+    atomic = type(node) is Try
+    if atomic:
+        node = node.p
+    if type(node) is not Tokens or not node.consume or type(node.tts) is not str:
+        return None
+    if (atomic and node.tts) or len(node.tts) == 1:
+        return node.tts
+    return None
+
+
+def _many_till_literal(
+    lit: str, scan: Parsec[_S, _U, Iterable[_T]]
+) -> Parsec[_S, _U, Iterable[_T]]:
+    skip = scan_until(lit)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        if type(s.input) is not str or s.offset == len(s.input):
+            return scan.un_parser(s, cok, cerr, eok, eerr)
+        return skip.un_parser(
+            s,
+            lambda span, s_, err: Bounce(cok, list(span), s_, err),
+            cerr,
+            eok,
+            lambda _: Bounce(scan.un_parser, s, cok, cerr, eok, eerr),
         )
-    )
+
+    return Parsec(_un_parser)
+
+
+def _many_till(
+    p: Parsec[_S, _U, _T],
+    end: Parsec[_S, _U, _V],
+) -> Parsec[_S, _U, Iterable[_T]]:
+    def _un_parser(
+        s: State[_S, _U],
+        cok: Callable[[Iterable[_T], State[_S, _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[Iterable[_T], State[_S, _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        seq = _Sequence(cok, cerr, eok, eerr)
+        xs: list[_T] = []
+
+        def scan(s_: State[_S, _U]) -> Any:
+            def end_cok(_: _V, s__: State[_S, _U], err: ParseError) -> Any:
+                return Bounce(cok, xs, s__, err)
+
+            def end_eok(_: _V, s__: State[_S, _U], err: ParseError) -> Any:
+                seq.pend(err)
+                return seq.ok(xs, s__)
+
+            def end_eerr(end_err: ParseError) -> Any:
+                def pcok(x: _T, s__: State[_S, _U], err: ParseError) -> Any:
+                    seq.consume(err)
+                    xs.append(x)
+                    return Bounce(scan, s__)
+
+                def peok(x: _T, s__: State[_S, _U], err: ParseError) -> Any:
+                    seq.pend(merge_error(end_err, with_unknown_pos(err, s__)))
+                    xs.append(x)
+                    return Bounce(scan, s__)
+
+                def peerr(err: ParseError) -> Any:
+                    return seq.err(merge_error(end_err, err))
+
+                return Bounce(p.un_parser, s_, pcok, cerr, peok, peerr)
+
+            return end.un_parser(s_, end_cok, cerr, end_eok, end_eerr)
+
+        return scan(s)
+
+    return Parsec(_un_parser)
 
 
 def _test_many_till():
@@ -729,6 +1026,21 @@ def _test_many_till():
         "a",
         "a",
     ]  # fail with only three as
+    assert parse(many_till(char("a"), char("b")), "", "a" * 10_000 + "b") == (
+        ["a"] * 10_000
+    )
+
+
+def _test_many_till_literal():
+    for end in [try_(string("*/")), string("\n"), string("*/"), char("\n")]:
+        for input in ["", "*/", "a*/b", "a\n\t* b\n*/x", "a*", "a\n*/", "a*b"]:
+            p = many_till(any_char, end).then(get_position())
+            slow = _many_till(any_char, end).then(get_position())
+            assert parse(p, "", input) == parse(slow, "", input)
+            q = many_till(any_char, end)
+            assert parse(q, "", input) == parse(_many_till(any_char, end), "", input)
+    assert _literal(try_(string("*/"))) == "*/" and _literal(string("\n")) == "\n"
+    assert _literal(string("*/")) is None and _literal(char("\n")) is None
 
 
 # -- | @parserTrace label@ is an impure function, implemented with "Debug.Trace" that
@@ -0,0 +1,286 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Callable, Generic, Sequence, TypeVar
+from entoli.parsec.combinator import choice
+from entoli.parsec.prim import (
+    Bounce,
+    Parsec,
+    ParseError,
+    RawMessage,
+    State,
+    merge_error,
+    new_error_message,
+)
+
+# Imported for testing
+from entoli.parsec.char import char, digit, spaces, string
+from entoli.parsec.prim import Expect, SourcePos, many1, parse, try_
+
+_S = TypeVar("_S")
+_U = TypeVar("_U")
+_T = TypeVar("_T")
+
+# -- | This data type specifies the associativity of operators: left, right
+# -- or none.
+
+# data Assoc                = AssocNone
+#                           | AssocLeft
+#                           | AssocRight
+
+
+class Assoc(Enum):
+    NONE = "non"
+    LEFT = "left"
+    RIGHT = "right"
+
+
+# -- | This data type specifies operators that work on values of type @a@.
+# -- An operator is either binary infix or unary prefix or postfix. A
+# -- binary operator has also an associated associativity.
+
+# data Operator s u m a   = Infix (ParsecT s u m (a -> a -> a)) Assoc
+#                         | Prefix (ParsecT s u m (a -> a))
+#                         | Postfix (ParsecT s u m (a -> a))
+
+
+@dataclass(frozen=True, slots=True)
+class Infix(Generic[_S, _U, _T]):
+    op: Parsec[_S, _U, Callable[[_T, _T], _T]]
+    assoc: Assoc
+
+
+@dataclass(frozen=True, slots=True)
+class Prefix(Generic[_S, _U, _T]):
+    op: Parsec[_S, _U, Callable[[_T], _T]]
+
+
+@dataclass(frozen=True, slots=True)
+class Postfix(Generic[_S, _U, _T]):
+    op: Parsec[_S, _U, Callable[[_T], _T]]
+
+
+type Operator[_S, _U, _T] = Infix[_S, _U, _T] | Prefix[_S, _U, _T] | Postfix[
+    _S, _U, _T
+]
+
+# -- | An @OperatorTable s u m a@ is a list of @Operator s u m a@
+# -- lists. The list is ordered in descending
+# -- precedence. All operators in one list have the same precedence (but
+# -- may have a different associativity).
+
+# type OperatorTable s u m a = [[Operator s u m a]]
+
+type OperatorTable[_S, _U, _T] = Sequence[Sequence[Operator[_S, _U, _T]]]
+
+
+# ! Instead of one chainl1/chainr1 layer per precedence level, as
+# ! buildExpressionParser does, the table is compiled to binding powers and
+# ! one precedence climbing loop parses the whole expression. Every level
+# ! gets four powers above its base b:
+# !     infix left (b, b + 1), infix right and non associative (b + 1, b + 1)
+# !       as (left, right) binding powers,
+# !     postfix b + 2, so it applies to the operands of infix ops of its level,
+# !     the operand of a prefix op b + 3, so infix and postfix ops of its level
+# !       apply to the prefixed term, as post (pre x) in Text.Parsec.Expr.
+# ! An operator binds to the operand on its left if its left power is at
+# ! least the power the innermost pending operator requires. Pending
+# ! operators are a linked stack of frames, and each operator is parsed once.
+# ! Unlike Text.Parsec.Expr, prefix and postfix operators may repeat.
+
+_PREFIX = 0
+_INFIX = 1
+
+
+def _ambiguous(assoc: Assoc, s: State) -> ParseError:
+    # fail ("ambiguous use of a " ++ assoc ++ " associative operator")
+    msg = f"ambiguous use of a {assoc.value} associative operator"
+    return new_error_message(RawMessage(msg), s.error_pos())
+
+
+# buildExpressionParser :: (Stream s m t)
+#                       => OperatorTable s u m a
+#                       -> ParsecT s u m a
+#                       -> ParsecT s u m a
+# {-# INLINABLE buildExpressionParser #-}
+# buildExpressionParser operators simpleExpr
+#     = foldl (makeParser) simpleExpr operators
+
+
+def expression_parser(
+    term: Parsec[_S, _U, _T],
+    operator_table: OperatorTable[_S, _U, _T],
+) -> Parsec[_S, _U, _T]:
+    """
+    Parses expressions of term and the operators of operator_table, listed
+    from the highest precedence level to the lowest.
+    Operators must consume input when they succeed.
+    """
+    prefix_ops = []
+    other_ops = []
+    for i, level in enumerate(operator_table):
+        b = 4 * (len(operator_table) - i)
+        for operator in level:
+            match operator:
+                case Prefix(op):
+                    prefix_ops.append(op.fmap(lambda f, bp=b + 3: (f, bp)))
+                case Postfix(op):
+                    other_ops.append(
+                        op.fmap(lambda f, bp=b + 2: (f, bp, None, b, None))
+                    )
+                case Infix(op, assoc):
+                    lbp = b if assoc is Assoc.LEFT else b + 1
+                    other_ops.append(
+                        op.fmap(
+                            lambda f, lbp=lbp, b=b, a=assoc: (f, lbp, b + 1, b, a)
+                        )
+                    )
+    prefix = choice(prefix_ops) if prefix_ops else None
+    operator = choice(other_ops)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        # A frame is (kind, f, lhs, right power, level, assoc), on a stack of
+        # (frame, rest) pairs ending in None
+        def operand(s, frames, consumed, err):
+            def prefix_ok(d, s_, err_):
+                f, bp = d
+                frame = (_PREFIX, f, None, bp, None, None)
+                return operand(s_, (frame, frames), True, err_)
+
+            def term_(err_):
+                def term_ok(x, s_, e):
+                    return after(x, s_, frames, True, e)
+
+                def term_empty(x, s_, e):
+                    return after(x, s_, frames, consumed, _merge(err_, e))
+
+                def term_err(e):
+                    e = _merge(err_, e)
+                    return Bounce(cerr, e) if consumed else Bounce(eerr, e)
+
+                return Bounce(term.un_parser, s, term_ok, cerr, term_empty, term_err)
+
+            if prefix is None:
+                return term_(err)
+            return Bounce(
+                prefix.un_parser,
+                s,
+                prefix_ok,
+                cerr,
+                _empty_operator,
+                lambda err_: term_(_merge(err, err_)),
+            )
+
+        def after(x, s, frames, consumed, err):
+            def operator_ok(d, s_, err_):
+                f, lbp, rbp, level, assoc = d
+                x_ = x
+                frames_ = frames
+                while frames_ is not None:
+                    kind, g, lhs, min_bp, level_, assoc_ = frames_[0]
+                    if (
+                        rbp is not None
+                        and kind == _INFIX
+                        and level_ == level
+                        and (assoc_ is Assoc.NONE or assoc_ is not assoc)
+                    ):
+                        return Bounce(cerr, _ambiguous(assoc, s))
+                    if lbp >= min_bp:
+                        break
+                    x_ = g(x_) if kind == _PREFIX else g(lhs, x_)
+                    frames_ = frames_[1]
+
+                if rbp is None:
+                    return after(f(x_), s_, frames_, True, err_)
+                frame = (_INFIX, f, x_, rbp, level, assoc)
+                return operand(s_, (frame, frames_), True, err_)
+
+            def operator_none(err_):
+                x_ = x
+                frames_ = frames
+                while frames_ is not None:
+                    kind, g, lhs, _, _, _ = frames_[0]
+                    x_ = g(x_) if kind == _PREFIX else g(lhs, x_)
+                    frames_ = frames_[1]
+                k = cok if consumed else eok
+                return Bounce(k, x_, s, _merge(err, err_))
+
+            return Bounce(
+                operator.un_parser, s, operator_ok, cerr, _empty_operator, operator_none
+            )
+
+        return operand(s, None, False, None)
+
+    return Parsec(_un_parser)
+
+
+def _merge(e1: ParseError | None, e2: ParseError) -> ParseError:
+    return e2 if e1 is None else merge_error(e1, e2)
+
+
+def _empty_operator(_0: Any, _1: Any, _2: Any) -> Any:
+    raise Exception("expression_parser: an operator accepted an empty string.")
+
+
+def _test_expression_parser():
+    def op(s, f):
+        return string(s).skip(spaces).fmap(lambda _: f)
+
+    number = many1(digit).skip(spaces).fmap(lambda ds: int("".join(ds)))
+    table = [
+        [Prefix(op("-", lambda x: -x)), Postfix(op("!", lambda x: ("!", x)))],
+        [Infix(op("^", lambda x, y: ("^", x, y)), Assoc.RIGHT)],
+        [
+            Infix(op("*", lambda x, y: ("*", x, y)), Assoc.LEFT),
+            Infix(op("/", lambda x, y: ("/", x, y)), Assoc.LEFT),
+        ],
+        [
+            Infix(op("+", lambda x, y: ("+", x, y)), Assoc.LEFT),
+            Infix(op("-", lambda x, y: ("-", x, y)), Assoc.LEFT),
+        ],
+        [Infix(op("==", lambda x, y: ("==", x, y)), Assoc.NONE)],
+    ]
+    expr = expression_parser(number, table)
+
+    assert parse(expr, "", "1") == 1
+    assert parse(expr, "", "1 - 2 - 3") == ("-", ("-", 1, 2), 3)
+    assert parse(expr, "", "1 ^ 2 ^ 3") == ("^", 1, ("^", 2, 3))
+    assert parse(expr, "", "1 + 2 * 3 ^ 4") == ("+", 1, ("*", 2, ("^", 3, 4)))
+    assert parse(expr, "", "1 * 2 + 3 / 4") == ("+", ("*", 1, 2), ("/", 3, 4))
+    assert parse(expr, "", "-1 ^ 2") == ("^", -1, 2)
+    assert parse(expr, "", "-1 !") == ("!", -1)
+    assert parse(expr, "", "2 ^ 3 ! * --4") == ("*", ("^", 2, ("!", 3)), 4)
+    assert parse(expr, "", "1 + 2 == 3") == ("==", ("+", 1, 2), 3)
+    assert parse(expr, "", "1 == 2 == 3") == ParseError(
+        SourcePos("", 1, 8), [RawMessage("ambiguous use of a non associative operator")]
+    )
+
+    err = parse(expr, "", "")
+    assert err.source_pos == SourcePos("", 1, 1) and Expect("-") in err.message
+    err = parse(expr, "", "1 +")
+    assert err.source_pos == SourcePos("", 1, 4) and Expect("-") in err.message
+    err = parse(expr.then(char(")")), "", "1 x")
+    assert err.source_pos == SourcePos("", 1, 3)
+    assert {Expect("!"), Expect("^"), Expect("+"), Expect("==")} <= set(err.message)
+
+
+def _test_expression_parser_mixed_assoc():
+    def op(c, f):
+        return char(c).fmap(lambda _: f)
+
+    table = [
+        [
+            Infix(op("<", lambda x, y: f"({x}<{y})"), Assoc.LEFT),
+            Infix(op(">", lambda x, y: f"({x}>{y})"), Assoc.RIGHT),
+        ]
+    ]
+    expr = expression_parser(digit, table)
+    assert parse(expr, "", "1<2<3") == "((1<2)<3)"
+    assert parse(expr, "", "1>2>3") == "(1>(2>3))"
+    assert parse(expr, "", "1<2>3") == ParseError(
+        SourcePos("", 1, 4),
+        [RawMessage("ambiguous use of a right associative operator")],
+    )
+
+    deep = expression_parser(digit, [[Prefix(op("-", lambda x: f"-{x}"))]] * 10)
+    assert parse(deep, "", "-" * 10_000 + "1") == "-" * 10_000 + "1"
+    assert parse(try_(expr).mplus(string("x")), "", "x") == "x"
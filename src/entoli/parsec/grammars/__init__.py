@@ -0,0 +1,31 @@
+from typing import Any
+
+from entoli.parsec.prim import Parsec, UNKNOWN_ERROR, partial_input
+
+# Imported for testing
+from entoli.parsec.char import regex
+from entoli.parsec.prim import parse, run_partial
+
+# ! The grammars parse whole texts. Their tokens are regexes, which cannot
+# ! run with run_partial. Each of them starts with whole_input, which
+# ! rejects partial input with a ValueError up front, whatever the first
+# ! token is.
+
+
+def _whole_input(s, _cok, _cerr, eok, _eerr):
+    if partial_input(s):
+        raise ValueError("grammars parse whole texts and cannot run with run_partial")
+    return eok(None, s, UNKNOWN_ERROR)
+
+
+whole_input: Parsec[Any, Any, None] = Parsec(_whole_input)
+
+
+def _test_whole_input():
+    p = whole_input.then(regex("ab"))
+    assert parse(p, "", "ab") == "ab"
+    try:
+        run_partial(p, None, "", "a")
+        assert False
+    except ValueError as e:
+        assert "run_partial" in str(e)
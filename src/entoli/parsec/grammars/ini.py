@@ -0,0 +1,132 @@
+from typing import Any
+
+from entoli.parsec.char import regex, regex_groups
+from entoli.parsec.combinator import many
+from entoli.parsec.grammars import whole_input
+from entoli.parsec.interp import interpret
+from entoli.parsec.prim import Parsec, ParseError, lift_a2, run_pt
+
+# Imported for testing
+import configparser
+from entoli.parsec.grammars.throughput import benchmarking, relative_time
+from entoli.parsec.prim import Expect, SourcePos, SysUnExpect, run_partial
+
+# ! INI files: [section] headers followed by key = value or key: value
+# ! entries, one per line. Blank lines and lines starting with ; or # are
+# ! skipped, by one regex for any run of them. Entries before the first
+# ! header belong to the section "". Keys and values are stripped, values
+# ! run to the end of the line, and a repeated section or key updates the
+# ! earlier one, as configparser does without strict mode. Unlike
+# ! configparser, keys keep their case and values do not continue on
+# ! indented lines.
+
+# ! Throughput target: parse_ini within TARGET times the time of
+# ! configparser.ConfigParser.read_string.
+
+TARGET = 3.0
+
+_EOL = r"(?:\r\n|\n|\r|\Z)"
+
+_skip = regex(rf"(?:[ \t]*(?:[;#][^\r\n]*)?(?:\r\n|\n|\r))*")
+_header = regex_groups(rf"[ \t]*\[[ \t]*([^\]\r\n]*?)[ \t]*\][ \t]*{_EOL}").label(
+    "section header"
+)
+_entry = regex_groups(
+    rf"[ \t]*([^=:;#\[\s][^=:\r\n]*?)[ \t]*[=:][ \t]*([^\r\n]*?)[ \t]*{_EOL}"
+).label("entry")
+
+_entries = many(_entry.skip(_skip)).fmap(dict)
+_section = lift_a2(lambda header, entries: (header[0], entries), _header, _entries)
+
+
+def _sections(
+    globals_: dict[str, str], sections: list[tuple[str, dict[str, str]]]
+) -> dict[str, dict[str, str]]:
+    result = {"": globals_} if globals_ else {}
+    for name, entries in sections:
+        result.setdefault(name, {}).update(entries)
+    return result
+
+
+ini_file: Parsec[str, Any, dict[str, dict[str, str]]] = interpret(
+    whole_input.then(_skip)
+    .then(lift_a2(_sections, _entries, many(_section.skip(_skip))))
+    .skip(regex(r"\Z").label("end of input"))
+)
+
+
+def parse_ini(text: str, name: str = "") -> dict[str, dict[str, str]] | ParseError:
+    """
+    The entries of each section of the INI text, or the error
+    """
+    return run_pt(ini_file, None, name, text, lazy_positions=True)
+
+
+def _test_parse_ini():
+    text = """; settings
+top = level
+
+[server]
+host = example.org
+Port: 8080
+# comment
+empty =
+
+  [ paths ]
+root=/srv/www  
+server = a = b
+[server]
+host = override
+"""
+    assert parse_ini(text) == {
+        "": {"top": "level"},
+        "server": {"host": "override", "Port": "8080", "empty": ""},
+        "paths": {"root": "/srv/www", "server": "a = b"},
+    }
+    assert parse_ini("") == {} and parse_ini("\n; only\n\n") == {}
+    assert parse_ini("[a]\r\nk=v") == {"a": {"k": "v"}}
+
+    assert parse_ini("[a]\nk = v\nnot an entry\n", "f.ini") == ParseError(
+        SourcePos("f.ini", 3, 1),
+        [
+            Expect("section header"),
+            SysUnExpect("n"),
+            Expect("end of input"),
+            SysUnExpect("n"),
+        ],
+    )
+    try:
+        run_partial(ini_file, None, "", "[a]\nk = v")
+        assert False
+    except ValueError:
+        pass
+
+
+def _test_parse_ini_long_line():
+    # A long value with tabs, where positions are costly to find
+    value = "v\t" * 50_000 + "v"
+    text = f"[s]\nkey =\t{value}\t\n"
+    assert parse_ini(text) == {"s": {"key": value}}
+
+    err = parse_ini(f"[s]\n\t{value}\t= v\n\t[")
+    assert err.source_pos == SourcePos("", 3, 1)
+    err = parse_ini(f"[s]\n{value}\n")
+    assert err.source_pos == SourcePos("", 2, 1) and SysUnExpect("v") in err.message
+
+
+def _test_parse_ini_throughput():
+    sections = [
+        f"[section{i}]\n" + "".join(f"key{j} = value {i} {j}\n" for j in range(10))
+        for i in range(200)
+    ]
+    text = "; generated\n\n" + "\n".join(sections)
+
+    def reference():
+        config = configparser.ConfigParser(interpolation=None)
+        config.optionxform = str  # type: ignore
+        config.read_string(text)
+        return {s: dict(config[s]) for s in config.sections()}
+
+    assert parse_ini(text) == reference()
+    if benchmarking():
+        assert relative_time(lambda: parse_ini(text), reference) < TARGET
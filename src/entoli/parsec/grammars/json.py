@@ -0,0 +1,165 @@
+import re
+from typing import Any
+
+from entoli.parsec.char import CharSet, regex, skip_while
+from entoli.parsec.combinator import choice, sep_by
+from entoli.parsec.grammars import whole_input
+from entoli.parsec.interp import interpret
+from entoli.parsec.prim import Parsec, ParseError, fix, lift_a2, run_pt
+
+# Imported for testing
+import json
+import random
+from entoli.parsec.grammars.throughput import benchmarking, relative_time
+from entoli.parsec.prim import Expect, SourcePos, SysUnExpect, run_partial
+
+# ! JSON (RFC 8259). Every token is one regex match which also skips the
+# ! whitespace after it, and value dispatches on its first character, so no
+# ! alternative is tried and rolled back. The grammar is built once, value
+# ! refers to itself through fix, and it runs on the interpreter, whose
+# ! explicit stack also takes deeply nested documents.
+
+# ! Throughput target: parse_json within TARGET times the time of json.loads.
+
+TARGET = 250.0
+
+_WS = "[ \t\n\r]*"
+
+_ESCAPE = re.compile(
+    r"\\u([dD][89abAB][0-9a-fA-F]{2})\\u([dD][c-fC-F][0-9a-fA-F]{2})"
+    r"|\\u([0-9a-fA-F]{4})|\\(.)"
+)
+_SIMPLE = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n"}
+_SIMPLE.update(r="\r", t="\t")
+
+
+def _unescape(m: re.Match) -> str:
+    hi, lo, code, c = m.groups()
+    if c is not None:
+        return _SIMPLE[c]
+    if code is not None:
+        return chr(int(code, 16))
+    return chr(0x10000 + ((int(hi, 16) - 0xD800) << 10) + (int(lo, 16) - 0xDC00))
+
+
+def _string_value(token: str) -> str:
+    body = token[1 : token.rindex('"')]
+    return _ESCAPE.sub(_unescape, body) if "\\" in body else body
+
+
+def _number_value(token: str) -> int | float:
+    if "." in token or "e" in token or "E" in token:
+        return float(token)
+    return int(token)
+
+
+def _lexeme(pattern: str, first: str, name: str) -> Parsec[str, Any, str]:
+    return regex(pattern + _WS).with_first(first).label(name)
+
+
+json_string = _lexeme(
+    r'"(?:[^"\\\x00-\x1f]|\\["\\/bfnrt]|\\u[0-9a-fA-F]{4})*"', '"', "string"
+).fmap(_string_value)
+
+json_number = _lexeme(
+    r"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?", "-0123456789", "number"
+).fmap(_number_value)
+
+
+def _literal(name: str, x: Any) -> Parsec[str, Any, Any]:
+    return _lexeme(name, name[0], name).fmap(lambda _: x)
+
+
+def _value(value: Parsec[str, Any, Any]) -> Parsec[str, Any, Any]:
+    comma = _lexeme(",", ",", "','")
+    member = lift_a2(
+        lambda k, v: (k, v), json_string.skip(_lexeme(":", ":", "':'")), value
+    )
+    obj = _lexeme("{", "{", "'{'").then(sep_by(member, comma))
+    array = _lexeme(r"\[", "[", "'['").then(sep_by(value, comma))
+    return choice(
+        [
+            obj.skip(_lexeme("}", "}", "'}'")).fmap(dict),
+            array.skip(_lexeme(r"\]", "]", "']'")),
+            json_string,
+            json_number,
+            _literal("true", True),
+            _literal("false", False),
+            _literal("null", None),
+        ]
+    )
+
+
+json_value = fix(_value)
+
+_end = regex(r"\Z").label("end of input")
+
+json_document = interpret(
+    whole_input.then(skip_while(CharSet(" \t\n\r"))).then(json_value).skip(_end)
+)
+
+
+def parse_json(text: str, name: str = "") -> Any | ParseError:
+    """
+    The value of the JSON text, as json.loads returns it, or the error
+    """
+    return run_pt(json_document, None, name, text, lazy_positions=True)
+
+
+def _test_parse_json():
+    texts = [
+        '{"a": [1, -2.5e3, 0, 1E+2, true, false, null], "b": {}, "c": []}',
+        ' "\\u00e9\\ud83d\\ude00 \\"q\\" \\\\ \\/ \\b\\f\\n\\r\\t" ',
+        "[[[[]]], [{}], -0, 0.5, 123456789012345678901234567890]",
+        '{"a": {"a": {"a": "a"}}, "a": 1}',
+        "\n\t 42 \r\n",
+    ]
+    for text in texts:
+        assert parse_json(text) == json.loads(text)
+
+    err = parse_json("[1, 2,]")
+    assert err.source_pos == SourcePos("", 1, 7) and SysUnExpect("]") in err.message
+    assert {Expect("'['"), Expect("string"), Expect("null")} <= set(err.message)
+    err = parse_json('{"a" 1}', "doc.json")
+    assert err.source_pos == SourcePos("doc.json", 1, 6)
+    assert Expect("':'") in err.message
+    assert parse_json('"\\x"').source_pos == SourcePos("", 1, 1)
+    assert parse_json("[] [") == ParseError(
+        SourcePos("", 1, 4), [Expect("end of input"), SysUnExpect("[")]
+    )
+    assert parse_json("[" * 10_000 + "]" * 10_000) is not None
+    try:
+        run_partial(json_document, None, "", "[1, 2]")
+        assert False
+    except ValueError:
+        pass
+
+
+def _test_parse_json_long_line():
+    # One line of tab-separated values, where positions are costly to find
+    values = [{"id": i, "tags": ["a\tb", i * 0.5]} for i in range(1500)]
+    text = json.dumps(values, separators=(",\t", ":\t"))
+    assert "\n" not in text and parse_json(text) == values
+
+    bad = text[:-1] + ",\t]"
+    err = parse_json(bad)
+    assert err.source_pos == SourcePos("", 1, len(bad[:-1].expandtabs()) + 1)
+    assert SysUnExpect("]") in err.message
+
+
+def _test_parse_json_throughput():
+    rng = random.Random(0)
+
+    def value(depth):
+        r = rng.random()
+        if depth > 3 or r < 0.3:
+            return rng.choice([1, -2.5e3, "text \\u00e9 \"q\"", True, None, 12345])
+        if r < 0.65:
+            return [value(depth + 1) for _ in range(rng.randint(0, 6))]
+        return {f"key{i}": value(depth + 1) for i in range(rng.randint(0, 6))}
+
+    text = json.dumps([value(0) for _ in range(40)], indent=1)
+    assert parse_json(text) == json.loads(text)
+    if benchmarking():
+        ratio = relative_time(lambda: parse_json(text), lambda: json.loads(text))
+        assert ratio < TARGET
@@ -0,0 +1,133 @@
+import re
+from typing import Any
+
+from entoli.parsec.char import regex, regex_groups
+from entoli.parsec.combinator import choice, many
+from entoli.parsec.grammars import whole_input
+from entoli.parsec.interp import interpret
+from entoli.parsec.prim import Parsec, ParseError, run_pt
+
+# Imported for testing
+import shlex
+from entoli.parsec.grammars.throughput import benchmarking, relative_time
+from entoli.parsec.prim import Expect, SourcePos, SysUnExpect, run_partial
+
+# ! logfmt: one record per line, of space separated key=value pairs. A value
+# ! is bare, or quoted with backslash escapes, and a key without = has the
+# ! value None. Blank lines are skipped. A well-formed line is matched by one
+# ! regex and its pairs are read by finditer; the pair by pair parser only
+# ! runs to report the error of a bad line.
+
+# ! Throughput target: parse_logfmt within TARGET times the time of splitting
+# ! the lines with shlex.split and str.partition.
+
+TARGET = 1.0
+
+_KEY = r'[^ \t="\r\n]+'
+_VALUE = r'"(?:[^"\\\r\n]|\\.)*"|[^ \t"\r\n]*'
+_PAIR = rf"({_KEY})(?:=({_VALUE}))?[ \t]*"
+
+_pairs = re.compile(_PAIR).finditer
+_ESCAPE = re.compile(r"\\(.)")
+_SIMPLE = {"n": "\n", "r": "\r", "t": "\t"}
+
+
+def _value(value: str | None) -> str | None:
+    if value is None or not value.startswith('"'):
+        return value
+    body = value[1:-1]
+    if "\\" not in body:
+        return body
+    return _ESCAPE.sub(lambda m: _SIMPLE.get(m.group(1), m.group(1)), body)
+
+
+def _record(line: str) -> dict[str, str | None]:
+    return {m.group(1): _value(m.group(2)) for m in _pairs(line)}
+
+
+_line_end = regex(r"\r\n|\n|\r|\Z").label("end of line")
+# Not at the end of the input, so that every line consumes
+_more = regex(r"(?=[\s\S])")
+# Pairs are separated by blanks here, so that a bad line fails without
+# trying every split of its keys
+_whole_line = regex(
+    rf"[ \t]*(?:{_KEY}(?:=(?:{_VALUE}))?(?:[ \t]+|(?=[\r\n]|\Z)))*(?=[\r\n]|\Z)"
+).fmap(_record)
+_pair = regex_groups(_PAIR).label("key").fmap(lambda kv: (kv[0], _value(kv[1])))
+_by_pair = regex(r"[ \t]*").then(many(_pair)).fmap(dict)
+_line = _more.then(choice([_whole_line, _by_pair])).skip(_line_end)
+
+logfmt_file: Parsec[str, Any, list[dict[str, str | None]]] = interpret(
+    whole_input.then(many(_line))
+    .fmap(lambda records: [r for r in records if r])
+    .skip(regex(r"\Z").label("end of input"))
+)
+
+
+def parse_logfmt(text: str, name: str = "") -> list[dict[str, Any]] | ParseError:
+    """
+    The records of the non-blank lines of the logfmt text, or the error
+    """
+    return run_pt(logfmt_file, None, name, text, lazy_positions=True)
+
+
+def _test_parse_logfmt():
+    text = (
+        'level=info msg="request done" path=/a?b=c status=200 cached\n'
+        "\n"
+        '  ts=1.5 msg="say \\"hi\\"\\n" empty= \r\n'
+    )
+    assert parse_logfmt(text) == [
+        {
+            "level": "info",
+            "msg": "request done",
+            "path": "/a?b=c",
+            "status": "200",
+            "cached": None,
+        },
+        {"ts": "1.5", "msg": 'say "hi"\n', "empty": ""},
+    ]
+    assert parse_logfmt("") == [] and parse_logfmt(" \n\t\n") == []
+
+    assert parse_logfmt('a=1\nb="open', "app.log") == ParseError(
+        SourcePos("app.log", 2, 3),
+        [Expect("key"), SysUnExpect('"'), Expect("end of line"), SysUnExpect('"')],
+    )
+    try:
+        run_partial(logfmt_file, None, "", "a=1")
+        assert False
+    except ValueError:
+        pass
+
+
+def _test_parse_logfmt_long_line():
+    # One line of tab-separated pairs, where positions are costly to find
+    text = "\t".join(f'k{i}="v\t{i}"' for i in range(20_000))
+    assert parse_logfmt(text) == [{f"k{i}": f"v\t{i}" for i in range(20_000)}]
+
+    bad = text + '\tz="open'
+    err = parse_logfmt(bad)
+    column = len((text + "\tz=").expandtabs()) + 1
+    assert err.source_pos == SourcePos("", 1, column)
+
+
+def _test_parse_logfmt_throughput():
+    text = "".join(
+        f'ts=2024-01-01T00:00:{i % 60:02} level=info msg="request {i}" '
+        f"path=/items/{i} status=200 took=0.{i % 97}ms\n"
+        for i in range(500)
+    )
+
+    def reference():
+        records = []
+        for line in text.splitlines():
+            record = {}
+            for word in shlex.split(line):
+                key, eq, value = word.partition("=")
+                record[key] = value if eq else None
+            records.append(record)
+        return records
+
+    assert parse_logfmt(text) == reference()
+    if benchmarking():
+        assert relative_time(lambda: parse_logfmt(text), reference, 3) < TARGET
@@ -0,0 +1,51 @@
+import os
+from time import perf_counter
+from typing import Any, Callable
+
+# ! Every grammar of this package states its throughput target as a ratio:
+# ! how many times longer it may take than a reference parser, usually from
+# ! the standard library, on the same input. Ratios track the parser itself
+# ! rather than the speed of the machine running it. They still vary with
+# ! the load of the machine, so tests only check them when the ENTOLI_BENCH
+# ! environment variable is set.
+
+
+def _best(run: Callable[[], Any], repeat: int, clock: Callable[[], float]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = clock()
+        run()
+        best = min(best, clock() - start)
+    return best
+
+
+def relative_time(
+    run: Callable[[], Any],
+    reference: Callable[[], Any],
+    repeat: int = 5,
+    clock: Callable[[], float] = perf_counter,
+) -> float:
+    """
+    How many times longer run takes than reference, best of repeat runs each
+    """
+    return _best(run, repeat, clock) / max(_best(reference, repeat, clock), 1e-9)
+
+
+def benchmarking() -> bool:
+    """
+    Whether throughput targets are checked, as ENTOLI_BENCH asks
+    """
+    return os.environ.get("ENTOLI_BENCH", "") not in ("", "0")
+
+
+def _test_relative_time():
+    ticks = iter([0.0, 4.0, 10.0, 13.0, 20.0, 21.0, 30.0, 32.0])
+    assert relative_time(lambda: None, lambda: None, 2, lambda: next(ticks)) == 3.0
+
+
+def _test_benchmarking(monkeypatch):
+    for value, expected in [("", False), ("0", False), ("1", True)]:
+        monkeypatch.setenv("ENTOLI_BENCH", value)
+        assert benchmarking() == expected
+    monkeypatch.delenv("ENTOLI_BENCH")
+    assert not benchmarking()
@@ -0,0 +1,883 @@
+from mmap import mmap
+from typing import Any, Callable, TypeVar
+
+from entoli.parsec.node import (
+    Alt,
+    Bind,
+    Dispatch,
+    Fail,
+    First,
+    Label,
+    Leaf,
+    Literal,
+    Many,
+    Map,
+    Node,
+    Pure,
+    Ref,
+    Then,
+    Token,
+    Tokens,
+    Try,
+    node_of,
+)
+from entoli.parsec.prim import (
+    Bounce,
+    Expect,
+    ParseError,
+    Parsec,
+    SourcePos,
+    State,
+    Suspend,
+    SysUnExpect,
+    UNKNOWN_ERROR,
+    enter_label,
+    error_is_unknown,
+    exit_label,
+    fix,
+    hold,
+    many,
+    many_err,
+    merge_error,
+    label,
+    lift_a2,
+    offset_in,
+    parse,
+    partial_input,
+    release,
+    run_pt,
+    set_expect_errors,
+    try_,
+    unknown_error,
+    with_unknown_pos,
+)
+
+# Imported for testing
+from entoli.parsec.char import char, digit, one_of, satisfy, spaces, string
+from entoli.parsec.combinator import choice, count, eof, sep_by
+from entoli.parsec.prim import Done, feed, run_partial
+
+_S = TypeVar("_S")
+_U = TypeVar("_U")
+_A = TypeVar("_A")
+
+# ! The interpreter runs a node tree in a single loop. Instead of passing
+# ! continuations, it pushes a frame for every combinator on an explicit
+# ! stack and feeds each reply to the frame on top. A reply is a tuple of
+# ! (kind, value, state, error), and the frames follow the continuation
+# ! plumbing of the closures in prim exactly.
+
+_COK = 0
+_CERR = 1
+_EOK = 2
+_EERR = 3
+
+_F_MAP = 0
+_F_THEN = 1
+_F_BIND = 2
+_F_CONT = 3
+_F_ALT = 4
+_F_TRY = 5
+_F_MANY = 6
+_F_DISPATCH = 7
+_F_LABEL = 8
+_F_SKIPPED = 9
+
+
+def _leaf_cok(x: Any, s: State, err: ParseError) -> tuple:
+    return (_COK, x, s, err)
+
+
+def _leaf_cerr(err: ParseError) -> tuple:
+    return (_CERR, None, None, err)
+
+
+def _leaf_eok(x: Any, s: State, err: ParseError) -> tuple:
+    return (_EOK, x, s, err)
+
+
+def _leaf_eerr(err: ParseError) -> tuple:
+    return (_EERR, None, None, err)
+
+
+def _run(node: Node, s: State) -> tuple | Suspend:
+    return _resume_run([], node, s, None)
+
+
+def _resume_run(
+    stack: list[tuple], node: Node, s: State, reply: Any
+) -> tuple | Suspend:
+    # Runs node from s on top of stack, or feeds reply to stack if there is one
+    while True:
+        if reply is None:
+            # Descend until a node replies
+            while True:
+                t = type(node)
+                if t is Token or t is Tokens:
+                    reply = node.un_parser(
+                        s, _leaf_cok, _leaf_cerr, _leaf_eok, _leaf_eerr
+                    )
+                    break
+                if t is Map:
+                    stack.append((_F_MAP, node.f))
+                    node = node.p
+                elif t is Then:
+                    kept = () if node.keep is None else None
+                    stack.append((_F_THEN, node, 0, False, UNKNOWN_ERROR, kept))
+                    node = node.ps[0]
+                elif t is Alt:
+                    stack.append((_F_ALT, node.ps, 0, None, s))
+                    node = node.ps[0]
+                elif t is Bind:
+                    stack.append((_F_BIND, node.k))
+                    node = node.p
+                elif t is Many:
+                    stack.append((_F_MANY, node, [] if node.collect else None, s, True))
+                    node = node.p
+                elif t is Try:
+                    ctx = s.ctx
+                    key = None
+                    if ctx is not None and ctx.packrat:
+                        # Memoized by the node, as try_ is by its closure
+                        hit = ctx.memo.get(node, s)  # type: ignore
+                        if hit is not None:
+                            reply = hit[1]
+                            break
+                        key = node
+                    held = hold(s) if ctx is not None and ctx.partial else None
+                    stack.append((_F_TRY, s, held, key))
+                    node = node.p
+                elif t is First:
+                    node = node.p
+                elif t is Ref:
+                    p = node.cell[0]
+                    if p is None:
+                        raise ValueError("forward parser used before define")
+                    node = node_of(p)
+                elif t is Label:
+                    ctx = s.ctx
+                    entered = None
+                    if ctx is not None and (
+                        ctx.profile is not None or ctx.trace is not None
+                    ):
+                        entered = enter_label(ctx, ", ".join(node.names))
+                    stack.append((_F_LABEL, node.names, entered, s))
+                    node = node.p
+                elif t is Literal:
+                    input = s.input
+                    o = s.offset
+                    if type(input) is str and input.startswith(node.text, o):
+                        pos = s._pos
+                        if pos is not None:
+                            for part in node.parts:
+                                pos = part.next_pos(pos, part.tts)
+                        s_ = State(input, pos, s.user_state, o + len(node.text), s.ctx)
+                        reply = (_COK, node.parts[node.keep].tts, s_, UNKNOWN_ERROR)
+                        break
+                    node = node.reference
+                elif t is Dispatch:
+                    input = s.input
+                    o = s.offset
+                    runs = node.default
+                    if o < len(input):
+                        try:
+                            runs = node.table.get(input[o], runs)
+                        except TypeError:
+                            pass
+                    elif partial_input(s):
+                        # The next token is not known yet
+                        runs = (True,) * len(node.full.ps)
+                    r = _dispatch_step(stack, node.full.ps, runs, 0, {}, s)
+                    if type(r) is tuple:
+                        reply = r
+                        break
+                    node = r
+                elif t is Pure:
+                    reply = (_EOK, node.value, s, UNKNOWN_ERROR)
+                    break
+                elif t is Fail:
+                    reply = (_EERR, None, None, unknown_error(s))
+                    break
+                else:
+                    reply = node.parser.un_parser(
+                        s, _leaf_cok, _leaf_cerr, _leaf_eok, _leaf_eerr
+                    )
+                    while type(reply) is Bounce:
+                        reply = reply.f(*reply.args)
+                    break
+
+            if type(reply) is Suspend:
+                return _suspended(stack, reply)
+
+        # Feed the reply to the frames until one of them descends again
+        while stack:
+            frame = stack.pop()
+            tag = frame[0]
+            kind, x, s_, err = reply
+
+            if tag == _F_MAP:
+                if kind == _COK or kind == _EOK:
+                    reply = (kind, frame[1](x), s_, err)
+
+            elif tag == _F_THEN:
+                _, then, i, consumed, err0, kept = frame
+                if kind == _CERR:
+                    continue
+                if kind == _COK:
+                    consumed = True
+                elif not error_is_unknown(err0):
+                    err = merge_error(err0, err)
+                if kind == _EERR:
+                    reply = (_CERR if consumed else _EERR, None, None, err)
+                    continue
+                if then.keep is None:
+                    kept += (x,)
+                elif i == then.keep:
+                    kept = x
+                i += 1
+                if i < len(then.ps):
+                    stack.append((_F_THEN, then, i, consumed, err, kept))
+                    node = then.ps[i]
+                    s = s_
+                    break
+                reply = (_COK if consumed else _EOK, kept, s_, err)
+
+            elif tag == _F_ALT:
+                _, ps, i, acc, s0 = frame
+                if kind == _EERR:
+                    acc = err if i == 0 else merge_error(acc, err)
+                    i += 1
+                    if i < len(ps):
+                        stack.append((_F_ALT, ps, i, acc, s0))
+                        node = ps[i]
+                        s = s0
+                        break
+                    reply = (_EERR, None, None, acc)
+                elif kind == _EOK and i > 0:
+                    reply = (_EOK, x, s_, merge_error(acc, with_unknown_pos(err, s_)))
+
+            elif tag == _F_BIND:
+                if kind == _COK or kind == _EOK:
+                    stack.append((_F_CONT, kind == _COK, err))
+                    node = node_of(frame[1](x))
+                    s = s_
+                    break
+
+            elif tag == _F_CONT:
+                _, consumed, err0 = frame
+                if kind == _EOK or kind == _EERR:
+                    if not error_is_unknown(err0):
+                        err = merge_error(err0, err)
+                    if kind == _EOK:
+                        reply = (_COK if consumed else _EOK, x, s_, err)
+                    else:
+                        reply = (_CERR if consumed else _EERR, None, None, err)
+
+            elif tag == _F_MANY:
+                _, many_, xs, last, first = frame
+                if kind == _COK:
+                    if xs is not None:
+                        xs.append(x)
+                    stack.append((_F_MANY, many_, xs, s_, False))
+                    node = many_.p
+                    s = s_
+                    break
+                if kind == _EOK:
+                    return many_err()
+                if kind == _EERR:
+                    if not first:
+                        reply = (_COK, xs, last, err)
+                    elif not many_.at_least_one:
+                        reply = (_EOK, xs, last, err)
+
+            elif tag == _F_TRY:
+                _, s0, held, key = frame
+                if held is not None:
+                    release(s0, held)
+                if kind == _CERR:
+                    if s0.ctx is not None and s0.ctx.trace is not None:
+                        s0.ctx.trace.rollback(s0.offset, s0.pos, err.source_pos)
+                    reply = (_EERR, None, None, err)
+                if key is not None:
+                    s0.ctx.memo.put(key, s0, reply[0], reply)  # type: ignore
+
+            elif tag == _F_LABEL:
+                _, names, entered, s0 = frame
+                if kind == _EERR or (kind == _EOK and not error_is_unknown(err)):
+                    reply = (kind, x, s_, set_expect_errors(err, names))
+                if entered is not None:
+                    consumed = s_.offset - s0.offset if kind == _COK else 0
+                    ok = kind == _COK or kind == _EOK
+                    exit_label(s0.ctx, entered, ok, consumed)
+
+            elif tag == _F_DISPATCH:
+                _, ps, runs, i, errs, s0 = frame
+                if kind == _EERR:
+                    errs[i] = err
+                    r = _dispatch_step(stack, ps, runs, i + 1, errs, s0)
+                elif kind == _EOK:
+                    r = _dispatch_merge(stack, ps, runs, 0, i, errs, s0, None, reply)
+                else:
+                    continue
+                if type(r) is not tuple:
+                    node = r
+                    s = s0
+                    break
+                reply = r
+
+            else:
+                _, ps, runs, j, end, errs, s0, acc, ok = frame
+                if kind == _EOK:
+                    if j > 0:
+                        err = merge_error(acc, with_unknown_pos(err, s_))
+                    reply = (_EOK, x, s_, err)
+                elif kind == _EERR:
+                    acc = err if j == 0 else merge_error(acc, err)
+                    r = _dispatch_merge(stack, ps, runs, j + 1, end, errs, s0, acc, ok)
+                    if type(r) is not tuple:
+                        node = r
+                        s = s0
+                        break
+                    reply = r
+        else:
+            return reply
+        reply = None
+
+
+# ! A Dispatch runs its candidates in order, as an Alt would, and keeps the
+# ! errors of those which fail empty. Once a candidate succeeds empty, or
+# ! none is left, the skipped alternatives before it are run for their
+# ! errors, which are merged in the original order. The reply is then that
+# ! of the full Alt, and no alternative runs twice.
+
+
+def _dispatch_step(
+    stack: list[tuple],
+    ps: tuple[Node, ...],
+    runs: tuple[bool, ...],
+    i: int,
+    errs: dict[int, ParseError],
+    s0: State,
+) -> Node | tuple:
+    # The next candidate from i to run, or the reply once none is left
+    while i < len(ps) and not runs[i]:
+        i += 1
+    if i < len(ps):
+        stack.append((_F_DISPATCH, ps, runs, i, errs, s0))
+        return ps[i]
+    return _dispatch_merge(stack, ps, runs, 0, len(ps), errs, s0, None, None)
+
+
+def _dispatch_merge(
+    stack: list[tuple],
+    ps: tuple[Node, ...],
+    runs: tuple[bool, ...],
+    j: int,
+    end: int,
+    errs: dict[int, ParseError],
+    s0: State,
+    acc: ParseError | None,
+    ok: tuple | None,
+) -> Node | tuple:
+    # Merges the errors of ps[j:end] into acc, and returns the next skipped
+    # alternative to run for its error, or the reply. ok is the empty success
+    # of ps[end], if there is one.
+    while j < end:
+        if not runs[j]:
+            stack.append((_F_SKIPPED, ps, runs, j, end, errs, s0, acc, ok))
+            return ps[j]
+        acc = errs[j] if j == 0 else merge_error(acc, errs[j])  # type: ignore
+        j += 1
+    if ok is None:
+        return (_EERR, None, None, acc)
+    _, x, s_, err = ok
+    if end > 0:
+        err = merge_error(acc, with_unknown_pos(err, s_))  # type: ignore
+    return (_EOK, x, s_, err)
+
+
+def _suspended(stack: list[tuple], r: Suspend) -> Suspend:
+    # The frames wait for the reply of a primitive, which waits for input
+    def resume(input, shift):
+        reply = r.resume(input, shift)
+        while type(reply) is Bounce:
+            reply = reply.f(*reply.args)
+        if type(reply) is Suspend:
+            return _suspended(stack, reply)
+        return _resume_run(stack, None, None, reply)  # type: ignore
+
+    return Suspend(resume, r.state)
+
+
+def _answer(r: tuple | Suspend, k: Callable[[tuple], Any]) -> Any:
+    # Passes the reply of _run to k, once it has all the input it needs
+    if type(r) is Suspend:
+        return Suspend(lambda input, shift: _answer(r.resume(input, shift), k), r.state)
+    return k(r)
+
+
+# ! The optimizer rewrites a tree into an equivalent one. It fuses fmap
+# ! chains, flattens nested then and mplus, merges adjacent str literals and
+# ! turns alternatives with first sets into a Dispatch, as choice does.
+# ! Shared subtrees are rewritten once.
+
+
+def optimize(node: Node) -> Node:
+    done: dict[int, Node] = {}
+
+    def go(n: Node) -> Node:
+        key = id(n)
+        if key not in done:
+            if type(n) is Ref:
+                return _rebuild_ref(n, done, go)
+            done[key] = _optimize(n, go)
+        return done[key]
+
+    return go(node)
+
+
+def _rebuild_ref(
+    n: Ref, done: dict[int, Node], go: Callable[[Node], Node]
+) -> Node:
+    # The copy is registered before its target is rebuilt, which closes the
+    # cycles through n. An undefined Ref is kept, so that define still works.
+    p = n.cell[0]
+    if p is None:
+        done[id(n)] = n
+        return n
+    ref = done[id(n)] = Ref([None])
+    ref.cell[0] = Parsec(p.un_parser, p.first, go(node_of(p)))
+    return ref
+
+
+def _optimize(n: Node, go: Callable[[Node], Node]) -> Node:
+    t = type(n)
+    if t is Map:
+        p = go(n.p)
+        if type(p) is Map:
+            f, g = n.f, p.f
+            return Map(lambda x: f(g(x)), p.p)
+        return Map(n.f, p)
+    if t is Then:
+        return _optimize_then(n, go)
+    if t is Alt:
+        return _optimize_alt(n, go)
+    if t is Bind:
+        return Bind(go(n.p), n.k)
+    if t is Try:
+        return Try(go(n.p))
+    if t is Label:
+        return Label(n.names, go(n.p))
+    if t is Many:
+        return Many(go(n.p), n.collect, n.at_least_one)
+    if t is First:
+        return First(n.first, go(n.p))
+    return n
+
+
+def _optimize_then(n: Then, go: Callable[[Node], Node]) -> Node:
+    if n.keep is None:
+        return Then(tuple(go(p) for p in n.ps), None)
+
+    ps: list[Node] = []
+    keep = 0
+    for i, p in enumerate(n.ps):
+        p = go(p)
+        if type(p) is Literal:
+            p = p.reference
+        flat = type(p) is Then and (p.keep is not None or i != n.keep)
+        if i == n.keep:
+            keep = len(ps) + (p.keep if flat else 0)
+        if flat:
+            ps.extend(p.ps)
+        else:
+            ps.append(p)
+
+    merged: list[Node] = []
+    i = 0
+    while i < len(ps):
+        j = i
+        while j < len(ps) and _is_literal(ps[j]):
+            j += 1
+        if j - i < 2:
+            merged.append(ps[i])
+            if i == keep:
+                keep = len(merged) - 1
+            i += 1
+            continue
+
+        parts = tuple(ps[i:j])
+        part_keep = keep - i if i <= keep < j else len(parts) - 1
+        if i <= keep < j:
+            keep = len(merged)
+        elif keep >= j:
+            keep -= len(parts) - 1
+        text = "".join(p.tts for p in parts)
+        merged.append(Literal(text, parts, part_keep, Then(parts, part_keep)))
+        i = j
+
+    if len(merged) == 1:
+        return merged[0]
+    return Then(tuple(merged), keep)
+
+
+def _is_literal(n: Node) -> bool:
+    return type(n) is Tokens and n.consume and type(n.tts) is str and len(n.tts) > 0
+
+
+def _optimize_alt(n: Alt, go: Callable[[Node], Node]) -> Node:
+    ps: list[Node] = []
+    for p in n.ps:
+        p = go(p)
+        if type(p) is Alt:
+            ps.extend(p.ps)
+        else:
+            ps.append(p)
+    full = Alt(tuple(ps))
+
+    firsts = [_first(p) for p in ps]
+    if sum(f is not None for f in firsts) < 2:
+        return full
+
+    # Tokens with the same candidates share one tuple
+    plans: dict[tuple[bool, ...], tuple[bool, ...]] = {}
+    table: dict[Any, tuple[bool, ...]] = {}
+    for f in firsts:
+        for c in f or ():
+            if c not in table:
+                runs = tuple(f_ is None or c in f_ for f_ in firsts)
+                table[c] = plans.setdefault(runs, runs)
+    default = tuple(f is None for f in firsts)
+    return Dispatch(table, default, full)
+
+
+def _first(n: Node) -> frozenset | None:
+    """
+    The first set of a node, or None if it is unknown or it can succeed empty.
+    """
+    t = type(n)
+    if t is First:
+        return n.first
+    if t is Tokens or t is Literal:
+        tts = n.tts if t is Tokens else n.text
+        try:
+            return frozenset([tts[0]]) if len(tts) > 0 else None
+        except TypeError:
+            return None
+    if t is Map or t is Try or t is Bind or t is Label:
+        return _first(n.p)
+    if t is Then:
+        return _first(n.ps[0])
+    if t is Many:
+        return _first(n.p) if n.at_least_one else None
+    if t is Fail:
+        return frozenset()
+    if t is Alt or t is Dispatch:
+        ps = n.ps if t is Alt else n.full.ps
+        firsts = [_first(p) for p in ps]
+        if any(f is None for f in firsts):
+            return None
+        return frozenset().union(*firsts)
+    if t is Leaf:
+        return n.parser.first
+    # A Ref may be left recursive, so it is unknown
+    return None
+
+
+# -- | @interpret p@ runs @p@ by the interpreter over its optimized node tree.
+# -- Parts of @p@ built from bare closures still run as closures. Under
+# -- packrat, the replies of its 'try_' nodes are memoized as by 'try_'.
+
+
+def interpret(
+    p: Parsec[_S, _U, _A],
+    optimized: bool = True,
+) -> Parsec[_S, _U, _A]:
+    node = optimize(node_of(p)) if optimized else node_of(p)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        def answer(reply):
+            kind, x, s_, err = reply
+            if kind == _COK:
+                return cok(x, s_, err)
+            if kind == _CERR:
+                return cerr(err)
+            if kind == _EOK:
+                return eok(x, s_, err)
+            return eerr(err)
+
+        return _answer(_run(node, s), answer)
+
+    return Parsec(_un_parser, p.first, node)
+
+
+# ! A recognizer only needs to know where a parser stops. Values are only
+# ! looked at by the continuations of and_then, so outside of them the tree
+# ! is run without fmap functions, collected lists and tuples. Parts built
+# ! from bare closures still build their values.
+
+
+def _strip(node: Node, done: dict[int, Node]) -> Node:
+    key = id(node)
+    if key in done:
+        return done[key]
+    t = type(node)
+    if t is Map:
+        n = _strip(node.p, done)
+    elif t is Many:
+        n = Many(_strip(node.p, done), False, node.at_least_one)
+    elif t is Then:
+        n = Then(tuple(_strip(p, done) for p in node.ps), 0)
+    elif t is Alt:
+        n = Alt(tuple(_strip(p, done) for p in node.ps))
+    elif t is Try:
+        n = Try(_strip(node.p, done))
+    elif t is First:
+        n = First(node.first, _strip(node.p, done))
+    elif t is Label:
+        n = Label(node.names, _strip(node.p, done))
+    elif t is Ref:
+        return _rebuild_ref(node, done, lambda n: _strip(n, done))
+    else:
+        n = node
+    done[key] = n
+    return n
+
+
+def _consumed(input: Any, start: int, end: int) -> Any:
+    if isinstance(input, (bytes, bytearray, mmap)):
+        return memoryview(input)[start:end]
+    return input[start:end]
+
+
+# -- | @recognize p@ runs @p@ and returns the input it consumed instead of its
+# -- value. Byte input is returned as a memoryview into it, without copying.
+
+
+def recognize(p: Parsec[_S, _U, Any]) -> Parsec[_S, _U, Any]:
+    node = optimize(_strip(node_of(p), {}))
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        # Over partial input, the consumed input is kept until it is returned
+        ctx = s.ctx
+        held = hold(s) if ctx is not None and ctx.partial else None
+
+        def answer(reply):
+            kind, _, s_, err = reply
+            if held is not None:
+                release(s, held)
+            if kind == _COK:
+                input = s_.input
+                return cok(_consumed(input, offset_in(s, input), s_.offset), s_, err)
+            if kind == _CERR:
+                return cerr(err)
+            if kind == _EOK:
+                return eok(_consumed(s.input, s.offset, s.offset), s_, err)
+            return eerr(err)
+
+        return _answer(_run(node, s), answer)
+
+    return Parsec(_un_parser, p.first)
+
+
+def _test_recognize():
+    number = many(digit).fmap(lambda ds: int("".join(ds)))
+    pair = lift_a2(lambda x, y: (x, y), number.skip(char(",")), number)
+    assert parse(recognize(pair).skip(char(";")), "", "12,345;") == "12,345"
+    assert parse(recognize(pair), "", "12;") == parse(pair, "", "12;")
+    assert parse(recognize(many(char("a"))), "", "b") == ""
+
+    view = parse(recognize(many(one_of(b"ab"))), "", b"abba!")
+    assert isinstance(view, memoryview) and view == b"abba"
+
+    counted = digit.and_then(lambda n: count(int(n), char("x")))
+    assert parse(recognize(counted), "", "3xxxx") == "3xxx"
+    assert parse(recognize(counted), "", "3xx") == parse(counted, "", "3xx")
+
+
+# -- | @validate p input@ checks that @p@ parses @input@, as by 'recognize'.
+# -- It returns @None@, or the error @p@ would fail with.
+
+
+def validate(
+    p: Parsec[Any, _U, Any],
+    input: Any,
+    name: str = "",
+    u: _U = None,
+    *,
+    lazy_positions: bool = False,
+) -> ParseError | None:
+    """
+    With lazy_positions, positions are only computed for the error, as by
+    run_pt.
+    """
+    r = run_pt(recognize(p), u, name, input, lazy_positions=lazy_positions)
+    return r if isinstance(r, ParseError) else None
+
+
+def _test_validate():
+    g = _grammar().skip(eof)
+    for input in ["let, 12, x", "let ,loop,if, 7 -> ", "lo", "12,,", "x\n, 1 q"]:
+        r = parse(g, "", input)
+        assert validate(g, input) == (r if isinstance(r, ParseError) else None)
+    assert validate(g, "x, y", "f") is None
+    err = validate(g, "x,\n y 1", lazy_positions=True)
+    assert err.source_pos == parse(g, "", "x,\n y 1").source_pos
+
+
+def _grammar() -> Parsec:
+    number = many(digit).and_then(
+        lambda ds: Parsec.pure(int("".join(ds))) if ds else Parsec.mzero()
+    )
+    keyword = choice([try_(string("let")), try_(string("loop")), string("if")])
+    arrow = string("-").then(string(">")).then(string(" ")).skip(spaces)
+    item = choice([keyword, number.fmap(str).fmap(len), one_of("xyz")]).label("item")
+    return sep_by(item.skip(spaces), char(",").skip(spaces)).skip(arrow.mplus(spaces))
+
+
+def _test_interpret():
+    g = _grammar()
+    inputs = [
+        "",
+        "let, 12, x",
+        "let ,loop,if, 7 -> ",
+        "lo",
+        "let, ",
+        "q",
+        "12,,",
+        "-",
+        "- >",
+        "if, 1234, z ->  ",
+        "if, 1234, z -> q",
+    ]
+    for input in inputs:
+        assert parse(interpret(g), "", input) == parse(g, "", input)
+        assert parse(interpret(g, optimized=False), "", input) == parse(g, "", input)
+
+
+def _test_interpret_fix():
+    def tree(self):
+        items = sep_by(self.mplus(digit), char(","))
+        return char("[").then(items).skip(char("]")).fmap(tuple)
+
+    g = fix(tree)
+    for input in ["[]", "[1,[2,[]],3]", "[1,[2", "[[[[x]]]]", "[1,2]]"]:
+        assert parse(interpret(g), "", input) == parse(g, "", input)
+        assert parse(interpret(g, optimized=False), "", input) == parse(g, "", input)
+    assert parse(recognize(g), "", "[1,[2]]!") == "[1,[2]]"
+    deep = "[" * 3000 + "]" * 3000
+    assert parse(recognize(g), "", deep) == deep
+
+
+def _test_interpret_profile():
+    g = _grammar()
+    input = "let, 12, x, loop -> "
+    reference = run_pt(g, None, "", input, profile=True)[1]["item"]
+    r, report = run_pt(interpret(g), None, "", input, profile=True)
+    assert r == parse(g, "", input)
+    item = report["item"]
+    assert (item.calls, item.ok, item.failed, item.consumed) == (
+        reference.calls,
+        reference.ok,
+        reference.failed,
+        reference.consumed,
+    )
+
+
+def _test_interpret_partial():
+    def tree(self):
+        items = sep_by(self.mplus(digit), char(","))
+        return char("[").then(items).skip(char("]")).fmap(tuple)
+
+    g = fix(tree)
+    input = "[1,[2,[]],[[3],4]]!"
+    for p in [interpret(g), interpret(g, optimized=False), recognize(g)]:
+        r = run_partial(p, None, "", "")
+        for i in range(0, len(input), 2):
+            r = feed(r, input[i : i + 2])
+        assert feed(r, "") == Done(parse(p, "", input), "!")
+
+    alt = try_(string("ab").then(string("c"))).mplus(string("abd"))
+    r = run_partial(recognize(many(alt)), None, "", "a")
+    for chunk in ["b", "ca", "bd", "a", "bc"]:
+        r = feed(r, chunk)
+    assert feed(r, "") == Done("abcabdabc", "")
+    r = run_partial(interpret(_grammar()), None, "", "let, 1")
+    expected = parse(_grammar(), "", "let, 12, x -> ")
+    assert r.feed("2, x -> ").close() == Done(expected, "")
+
+
+def _test_interpret_packrat():
+    tests = []
+
+    def is_a(c):
+        tests.append(c)
+        return c == "a"
+
+    a = satisfy(is_a).with_first("a")
+    aa = try_(a.then(a))
+    p = try_(aa.then(char("x"))).mplus(aa.then(char("y")))
+    for optimized in [False, True]:
+        for input in ["aay", "aax", "aaz", "ab"]:
+            expected = parse(p, "", input)
+            tests.clear()
+            assert run_pt(interpret(p, optimized), None, "", input, packrat=True) == (
+                expected
+            )
+            assert len(tests) == 2
+
+
+def _test_interpret_many():
+    n = 10_000
+    ab = interpret(many(string("a").then(string("b"))))
+    assert parse(ab, "", "ab" * n) == ["b"] * n
+    assert parse(ab, "", "ab" * n + "ac") == ParseError(
+        SourcePos("", 1, 2 * n + 2), [Expect("b"), SysUnExpect("c")]
+    )
+
+
+def _test_optimize():
+    p = string("a").then(string("b")).skip(string("c")).fmap(str.upper).fmap(len)
+    node = optimize(node_of(p))
+    assert type(node) is Map and type(node.p) is Literal
+    assert node.p.text == "abc" and node.p.parts[node.p.keep].tts == "b"
+    assert parse(interpret(p), "", "abc") == 1
+    assert parse(interpret(p), "", "abd") == parse(p, "", "abd")
+
+    nested = char("a").then(char("b").then(char("c"))).skip(char("d"))
+    node = optimize(node_of(nested))
+    assert type(node) is Then and len(node.ps) == 4 and node.keep == 2
+    assert parse(interpret(nested), "", "abcd") == "c"
+
+    alts = char("a").mplus(char("b").mplus(many(char("c")).fmap("".join)))
+    node = optimize(node_of(alts))
+    assert type(node) is Dispatch and len(node.full.ps) == 3
+    for input in ["a", "b", "cc", "", "d"]:
+        assert parse(interpret(alts), "", input) == parse(alts, "", input)
+
+
+def _test_interpret_dispatch_once():
+    tests = []
+
+    def is_a(c):
+        tests.append(c)
+        return c == "a"
+
+    a = satisfy(is_a).with_first("a")
+    p = char("b")
+    for _ in range(16):
+        p = try_(a.then(p)).mplus(char("b"))
+    assert type(optimize(node_of(p))) is Dispatch
+
+    for input in ["a" * 16 + "c", "a" * 8 + "b", "b", "c", ""]:
+        tests.clear()
+        expected = parse(p, "", input)
+        reference = len(tests)
+        tests.clear()
+        assert parse(interpret(p), "", input) == expected
+        assert len(tests) <= reference
+
+    # Skipped alternatives still contribute their errors, in order
+    q = char("x").mplus(string("").label("nothing")).mplus(char("y"))
+    for input in ["x", "y", "z", ""]:
+        assert parse(interpret(q), "", input) == parse(q, "", input)
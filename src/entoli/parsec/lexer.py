@@ -0,0 +1,259 @@
+from array import array
+from collections.abc import Sequence
+import re
+from typing import Any, Iterable, TypeVar
+from entoli.parsec.prim import (
+    Expect,
+    LineIndex,
+    MemoTable,
+    ParseContext,
+    Parsec,
+    SourcePos,
+    State,
+    SysUnExpect,
+    run_state,
+    ParseError,
+    UNKNOWN_ERROR,
+    update_pos_string,
+)
+from entoli.base.either import Either
+
+# Imported for testing
+from entoli.parsec.combinator import choice, eof, sep_by
+from entoli.parsec.prim import get_position, many, parse, lift_a2, set_position
+
+_U = TypeVar("_U")
+_A = TypeVar("_A")
+
+# ! A separate lexing stage. All rules are joined into one master pattern, and
+# ! a single finditer over the text fills parallel arrays of token kinds and
+# ! offsets. Parsers then run over token indices, so a grammar rule costs one
+# ! step per token instead of one per character. The stream indexes as its
+# ! kinds, so first sets and choice dispatch work on kind ids.
+
+
+class TokenStream(Sequence):
+    """
+    The tokens of a text. Token i has kind kinds[i] and spans
+    text[starts[i]:ends[i]].
+    """
+
+    __slots__ = ("text", "name", "names", "kinds", "starts", "ends", "_lines")
+
+    def __init__(self, text: str, name: str, names: Sequence[str]):
+        self.text = text
+        self.name = name
+        self.names = names
+        self.kinds = array("H")
+        self.starts = array("I")
+        self.ends = array("I")
+        self._lines: _TokenLines | None = None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, idx):
+        return self.kinds[idx]
+
+    def __repr__(self) -> str:
+        return f"TokenStream({len(self.kinds)} tokens)"
+
+    def text_at(self, i: int) -> str:
+        return self.text[self.starts[i] : self.ends[i]]
+
+    def show(self, i: int) -> str:
+        return self.text_at(i) if i < len(self.kinds) else ""
+
+    def lines(self) -> LineIndex:
+        """
+        The positions of the tokens, indexed on first use
+        """
+        if self._lines is None:
+            self._lines = _TokenLines(self)
+        return self._lines
+
+
+class _TokenLines(LineIndex):
+    """
+    A LineIndex of the text, looked up by token index
+    """
+
+    __slots__ = ("_starts",)
+
+    def __init__(self, tokens: TokenStream):
+        super().__init__(tokens.text, tokens.name)
+        self._starts = tokens.starts
+
+    def pos_at(self, offset: int) -> SourcePos:
+        starts = self._starts
+        if offset < len(starts):
+            return super().pos_at(starts[offset])
+        return super().pos_at(len(self.input))
+
+
+class Lexer:
+    """
+    A tokenizer of (name, pattern) rules, tried in order at each offset.
+    Tokens of the skip kinds are dropped. A Lexer is reusable across texts.
+    """
+
+    __slots__ = ("names", "kinds", "_skip", "_finditer")
+
+    def __init__(
+        self,
+        rules: Iterable[tuple[str, str]],
+        skip: Iterable[str] = (),
+        flags: int = 0,
+    ):
+        rules = list(rules)
+        self.names = tuple(name for name, _ in rules)
+        self.kinds = {name: kind for kind, name in enumerate(self.names)}
+        self._skip = frozenset(self.kinds[name] for name in skip)
+        master = re.compile(
+            "|".join(f"(?P<{name}>{pattern})" for name, pattern in rules), flags
+        )
+        self._finditer = master.finditer
+
+    def tokenize(self, text: str, name: str = "") -> TokenStream | ParseError:
+        """
+        Splits text into tokens, or fails at the first offset no rule matches
+        """
+        tokens = TokenStream(text, name, self.names)
+        kinds = tokens.kinds
+        starts = tokens.starts
+        ends = tokens.ends
+        ids = self.kinds
+        skip = self._skip
+
+        end = 0
+        for m in self._finditer(text):
+            start, stop = m.span()
+            if start != end or start == stop:
+                break
+            end = stop
+            kind = ids[m.lastgroup]
+            if kind not in skip:
+                kinds.append(kind)
+                starts.append(start)
+                ends.append(stop)
+
+        if end != len(text):
+            return ParseError(
+                LineIndex(text, name).pos_at(end), [SysUnExpect(text[end])]
+            )
+        return tokens
+
+    def token(self, name: str, text: str | None = None) -> Parsec[Any, _U, str]:
+        """
+        Parses a token of kind name, and only one reading text if given.
+        Returns the text of the token.
+        """
+        kind = self.kinds[name]
+        label = name if text is None else repr(text)
+
+        def _un_parser(s, cok, _cerr, _eok, eerr):
+            tokens = s.input
+            o = s.offset
+            kinds = tokens.kinds
+            if o < len(kinds) and kinds[o] == kind:
+                starts = tokens.starts
+                value = tokens.text[starts[o] : tokens.ends[o]]
+                if text is None or value == text:
+                    pos = s._pos
+                    if pos is not None:
+                        # Advanced over the text up to the next token
+                        start = starts[o] if o else 0
+                        end = starts[o + 1] if o + 1 < len(kinds) else None
+                        pos = update_pos_string(pos, tokens.text[start:end])
+                    s_ = State(tokens, pos, s.user_state, o + 1, s.ctx)
+                    return cok(value, s_, UNKNOWN_ERROR)
+            return eerr(
+                ParseError.lazy(
+                    s.error_pos(),
+                    lambda: [Expect(label), SysUnExpect(tokens.show(o))],
+                )
+            )
+
+        return Parsec(_un_parser).with_first([kind])
+
+
+def _test_lexer():
+    lexer = Lexer(
+        [("ws", r"\s+"), ("num", r"\d+"), ("ident", r"[a-z]+"), ("op", r"[-+*=]")],
+        skip=["ws"],
+    )
+    tokens = lexer.tokenize("x = 12\n + y")
+    assert isinstance(tokens, TokenStream)
+    assert list(tokens.kinds) == [2, 3, 1, 3, 2]
+    assert [tokens.text_at(i) for i in range(len(tokens))] == ["x", "=", "12", "+", "y"]
+    assert tokens.kinds.typecode == "H" and tokens.starts.typecode == "I"
+
+    assert lexer.tokenize("x = 1$", "f") == ParseError(
+        SourcePos("f", 1, 6), [SysUnExpect("$")]
+    )
+    assert len(lexer.tokenize("")) == 0
+
+
+# ! Token positions come from the offsets of the tokens in the source text,
+# ! and eager positions advance over the text from one token to the next, so
+# ! a position set with set_position carries over to the tokens after it. The
+# ! end of the stream is at the end of the text.
+
+
+def parse_tokens(
+    p: Parsec[Any, _U, _A],
+    tokens: TokenStream,
+    u: _U = None,
+    *,
+    packrat: bool = False,
+    memo_window: int = 4096,
+) -> Either[ParseError, _A]:
+    """
+    Runs p over tokens. Errors are reported at the source position of the
+    offending token.
+    """
+    ctx = ParseContext(MemoTable(memo_window), packrat, tokens.lines())
+    return run_state(p, State(tokens, None, u, 0, ctx))
+
+
+def _test_parse_tokens():
+    lexer = Lexer(
+        [("ws", r"\s+"), ("num", r"\d+"), ("ident", r"[a-z]+"), ("sym", r"[(),=]")],
+        skip=["ws"],
+    )
+    num = lexer.token("num").fmap(int)
+    ident = lexer.token("ident")
+    sym = lexer.token
+
+    call = lift_a2(
+        lambda f, args: (f, args),
+        ident,
+        sym("sym", "(").then(sep_by(num, sym("sym", ","))).skip(sym("sym", ")")),
+    )
+    stmt = choice([call, num])
+    program = many(stmt).skip(eof)
+
+    tokens = lexer.tokenize("f(1, 2)\n 3 g()")
+    assert parse_tokens(program, tokens) == [("f", [1, 2]), 3, ("g", [])]
+
+    tokens = lexer.tokenize("f(1,\n  = 2)", "src")
+    assert parse_tokens(program, tokens) == ParseError(
+        SourcePos("src", 2, 3), [Expect("num"), SysUnExpect("=")]
+    )
+    tokens = lexer.tokenize("f(1", "src")
+    assert parse_tokens(program, tokens) == ParseError(
+        SourcePos("src", 1, 4),
+        [Expect("','"), SysUnExpect(""), Expect("')'"), SysUnExpect("")],
+    )
+    assert parse(ident.then(ident).then(num), "", lexer.tokenize("ab c")) == (
+        ParseError(SourcePos("", 1, 5), [Expect("num"), SysUnExpect("")])
+    )
+
+    at_end = many(stmt).then(get_position())
+    assert parse(at_end, "src", lexer.tokenize(" f(1,\n\t 2) 3")) == SourcePos(
+        "src", 2, 14
+    )
+    moved = set_position(SourcePos("src", 10, 1)).then(at_end)
+    assert parse(moved, "src", lexer.tokenize("f(1)\n 3")) == SourcePos("src", 11, 3)
+    line = "1" + "\t1" * 5000
+    assert parse(program, "", lexer.tokenize(line)) == [1] * 5001
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable
+
+if TYPE_CHECKING:
+    from entoli.parsec.prim import Parsec
+
+
+# ! Reified form of a parser. The combinators of prim build a node next to
+# ! their closure, which stays the reference semantics. Parsers written as
+# ! bare closures appear as Leaf. Nodes compare by identity, since they hold
+# ! functions and arbitrary values.
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Node:
+    pass
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Leaf(Node):
+    """
+    A parser which is only known as a closure
+    """
+
+    parser: Parsec
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class InputLeaf(Leaf):
+    """
+    The closure of set_input, which replaces the input
+    """
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Pure(Node):
+    value: Any
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Fail(Node):
+    """
+    mzero, failing with an unknown error
+    """
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Map(Node):
+    f: Callable[[Any], Any]
+    p: Node
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Bind(Node):
+    p: Node
+    k: Callable[[Any], Parsec]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Then(Node):
+    """
+    Runs ps in sequence as by then, returning the result of ps[keep],
+    or the tuple of all results if keep is None
+    """
+
+    ps: tuple[Node, ...]
+    keep: int | None
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Alt(Node):
+    """
+    Tries ps in order as by mplus
+    """
+
+    ps: tuple[Node, ...]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Try(Node):
+    p: Node
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Label(Node):
+    """
+    Replaces the expected messages of p with names, as by labels
+    """
+
+    names: tuple[str, ...]
+    p: Node
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Many(Node):
+    p: Node
+    collect: bool
+    at_least_one: bool
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Token(Node):
+    """
+    token_prim_ex, with next_state as a Maybe.
+    un_parser is the primitive itself, which never returns a Bounce.
+    """
+
+    show: Callable[[Any], str]
+    next_pos: Callable[..., Any]
+    next_state: Any
+    test: Callable[[Any], Any]
+    un_parser: Callable[..., Any]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Tokens(Node):
+    """
+    tokens, or tokens_ when consume is False
+    """
+
+    show: Callable[[Any], str]
+    next_pos: Callable[..., Any]
+    tts: Any
+    consume: bool
+    un_parser: Callable[..., Any]
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class First(Node):
+    """
+    Annotates p with its first set, as declared by Parsec.with_first
+    """
+
+    first: frozenset
+    p: Node
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Literal(Node):
+    """
+    Adjacent str literals of a Then merged into one.
+    The result is the literal of parts[keep], and reference reports errors.
+    """
+
+    text: str
+    parts: tuple[Tokens, ...]
+    keep: int
+    reference: Node
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Dispatch(Node):
+    """
+    An Alt which picks its candidates by the next token, as choice does.
+    table maps a token, and default any other, to whether each of full.ps
+    can start with it. The others are only run for their errors once the
+    candidates do not consume.
+    """
+
+    table: dict[Any, tuple[bool, ...]]
+    default: tuple[bool, ...]
+    full: Alt
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Ref(Node):
+    """
+    A forward reference, from forward. cell[0] is the parser it refers to
+    once defined, and None before. The only mutable node, so the only way for
+    a tree to have cycles.
+    """
+
+    cell: list[Parsec | None]
+
+
+def node_of(p: Parsec) -> Node:
+    return p.node if p.node is not None else Leaf(p)
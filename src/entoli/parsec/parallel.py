@@ -0,0 +1,197 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from multiprocessing import get_all_start_methods, get_context
+import os
+from typing import Any, Iterator, TypeVar
+from entoli.base.either import Either
+from entoli.base.seq import Seq
+from entoli.parsec.prim import (
+    MemoTable,
+    ParseContext,
+    Parsec,
+    SourcePos,
+    State,
+    initial_pos,
+    run_state,
+    update_pos_string,
+    ParseError,
+)
+
+# Imported for testing
+from entoli.parsec.char import any_char, char, digit, spaces
+from entoli.parsec.combinator import eof, many, many1, sep_by
+from entoli.parsec.prim import SysUnExpect
+
+_U = TypeVar("_U")
+_A = TypeVar("_A")
+
+# ! Records are independent, so a source split at its separators can be parsed
+# ! in worker processes. Parsers are closures which cannot be pickled, so the
+# ! job is registered in _JOBS before the pool forks its workers, which inherit
+# ! it. Chunks of records are sent to the workers and each record is parsed
+# ! from its global position, so errors need no adjustment. Without fork, the
+# ! records are parsed in this process.
+
+_JOBS: dict[int, tuple[Parsec, Any, str]] = {}
+_keys = count()
+_END = object()
+
+
+def _chunks(
+    source: str, sep: str, chunk_size: int, name: str
+) -> Iterator[tuple[str, SourcePos]]:
+    # Chunks end right after a separator, except the last one. The search
+    # never starts before the chunk. A separator which can overlap itself, as
+    # "aa", only splits where split would, so it is searched from the start
+    # of the chunk
+    n = len(sep)
+    overlapping = any(sep[k:] == sep[: n - k] for k in range(1, n))
+    pos = initial_pos(name)
+    start = 0
+    end = len(source)
+    while start < end:
+        at = max(min(start + chunk_size, end) - n, start)
+        if overlapping:
+            i = source.find(sep, start)
+            while 0 <= i < at:
+                i = source.find(sep, i + n)
+        else:
+            i = source.find(sep, at)
+        stop = end if i < 0 else i + n
+        chunk = source[start:stop]
+        yield chunk, pos
+        pos = update_pos_string(pos, chunk)
+        start = stop
+
+
+def _parse_chunk_with(
+    p: Parsec[str, _U, _A], u: _U, chunk: str, sep: str, pos: SourcePos
+) -> list[Either[ParseError, _A]]:
+    records = chunk.split(sep)
+    if chunk.endswith(sep):
+        records.pop()
+
+    results = []
+    for record in records:
+        state = State(record, pos, u, 0, ParseContext(MemoTable(4096), False))
+        results.append(run_state(p, state))
+        pos = update_pos_string(update_pos_string(pos, record), sep)
+    return results
+
+
+def _parse_chunk(
+    key: int, chunk: str, sep: str, pos: SourcePos
+) -> list[Either[ParseError, Any]]:
+    p, u, _ = _JOBS[key]
+    return _parse_chunk_with(p, u, chunk, sep, pos)
+
+
+def _parse_all(
+    p: Parsec[str, _U, _A],
+    u: _U,
+    name: str,
+    source: str,
+    sep: str,
+    workers: int,
+    chunk_size: int,
+) -> Iterator[Either[ParseError, _A]]:
+    chunks = _chunks(source, sep, chunk_size, name)
+    if workers <= 1 or "fork" not in get_all_start_methods():
+        for chunk, pos in chunks:
+            yield from _parse_chunk_with(p, u, chunk, sep, pos)
+        return
+
+    key = next(_keys)
+    _JOBS[key] = (p, u, name)
+    try:
+        with ProcessPoolExecutor(workers, mp_context=get_context("fork")) as pool:
+            # Submission stays a few chunks ahead of the consumer
+            pending = deque()
+            for chunk, pos in chunks:
+                pending.append(pool.submit(_parse_chunk, key, chunk, sep, pos))
+                if len(pending) > 2 * workers:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+    finally:
+        del _JOBS[key]
+
+
+# -- | @parseRecords p source sep@ parses every record of @source@ separated by
+# -- @sep@ with @p@, and returns the result or error of each record in order.
+
+
+def parse_records(
+    p: Parsec[str, _U, _A],
+    source: str,
+    sep: str = "\n",
+    workers: int | None = None,
+    *,
+    u: _U = None,
+    name: str = "",
+    chunk_size: int = 1 << 20,
+) -> Seq[Either[ParseError, _A]]:
+    """
+    Records are parsed in chunks of about chunk_size characters by workers
+    processes, os.cpu_count() by default. The Seq is lazy: parsing starts on
+    first iteration and runs a few chunks ahead of it. Results are kept, so
+    iterating again does not parse again. A trailing sep ends the last record.
+    """
+    if not sep:
+        raise ValueError("parse_records needs a non-empty separator")
+    n = workers if workers is not None else os.cpu_count() or 1
+    cache: list[Either[ParseError, _A]] = []
+    results: list[Iterator[Either[ParseError, _A]]] = []
+
+    def generator() -> Iterator[Either[ParseError, _A]]:
+        if not results:
+            results.append(_parse_all(p, u, name, source, sep, n, chunk_size))
+        i = 0
+        while True:
+            if i == len(cache):
+                x = next(results[0], _END)
+                if x is _END:
+                    return
+                cache.append(x)
+            yield cache[i]
+            i += 1
+
+    return Seq(generator)
+
+
+def _test_parse_records():
+    row = sep_by(many1(digit).fmap(lambda ds: int("".join(ds))), char(","))
+    record = spaces.then(row)
+    source = "1,2\n3\n\n 4,x\n5,6\n7\n"
+
+    expected = [
+        [1, 2],
+        [3],
+        [],
+        ParseError(SourcePos("f", 4, 4), [SysUnExpect("x")]),
+        [5, 6],
+        [7],
+    ]
+    for workers, chunk_size in [(1, 1 << 20), (2, 1), (3, 5)]:
+        results = parse_records(
+            record, source, workers=workers, name="f", chunk_size=chunk_size
+        )
+        assert list(results) == expected
+        assert list(results) == expected
+
+    same_line = parse_records(
+        record.skip(eof), "1;2;\tx", ";", workers=2, chunk_size=2
+    )
+    assert list(same_line)[:2] == [[1], [2]]
+    assert list(same_line)[2].source_pos == SourcePos("", 1, 9)
+    assert list(parse_records(record, "", workers=2)) == []
+
+    # Chunks smaller than a separator, which may overlap itself
+    text = many(any_char).fmap("".join)
+    for source, sep in [("x\r\ny\r\n\r\nz\r", "\r\n"), ("xaaaaayaaaaaaz", "aa")]:
+        for workers, chunk_size in [(1, 1), (1, 2), (2, 3)]:
+            results = parse_records(
+                text, source, sep, workers=workers, chunk_size=chunk_size
+            )
+            assert list(results) == source.split(sep)
@@ -1,5 +1,13 @@
 from __future__ import annotations
+from bisect import bisect_left
+import codecs
+from collections.abc import Sequence
 from dataclasses import dataclass
+from itertools import islice
+from mmap import ACCESS_READ, mmap
+import os
+import re
+import sys
 from typing import (
     Any,
     Callable,
@@ -18,6 +26,30 @@ from entoli.base.either import Either
 from entoli.base.io import Io
 from entoli.base.maybe import Just, Maybe, Nothing
 from entoli.base.typeclass import _A, _B, _A_co, Alternative, Functor, Monad, MonadPlus
+from entoli.parsec.node import (
+    Alt,
+    Bind,
+    Fail,
+    First,
+    InputLeaf,
+    Label,
+    Many,
+    Map,
+    Node,
+    Pure,
+    Ref,
+    Then,
+    Token,
+    Tokens,
+    Try,
+    node_of,
+)
+from entoli.parsec.profiling import (
+    BacktrackReport,
+    BacktrackTracer,
+    Profiler,
+    ProfileReport,
+)
 from entoli.prelude import (
     append,
     fst,
@@ -39,6 +71,7 @@ _U = TypeVar("_U")
 _M = TypeVar("_M", bound=Monad)
 _A = TypeVar("_A")
 _B = TypeVar("_B")
+_C = TypeVar("_C")
 
 _T = TypeVar("_T")
 
@@ -55,6 +88,131 @@ _T = TypeVar("_T")
 #              }
 #      deriving ( Typeable )
 
+# ! Every continuation call of the combinators below is returned as a Bounce
+# ! instead of being called directly. run_parsec_t unwinds the Python stack
+# ! after each step and calls the next one from a loop, so stack depth stays
+# ! constant however long the input is. Primitive parsers may still call their
+# ! continuations directly, since they never nest.
+
+
+class Bounce:
+    """
+    A suspended continuation call, resumed by the trampoline of run_parsec_t.
+    Combinators return Bounce(k, *args) instead of calling k(*args).
+    """
+
+    __slots__ = ("f", "args")
+
+    def __init__(self, f: Callable[..., Any], *args: Any):
+        self.f = f
+        self.args = args
+
+
+def _trampoline(r: Any) -> Any:
+    while type(r) is Bounce:
+        r = r.f(*r.args)
+    return r
+
+
+# ! Incremental parsing. While a run_partial feed is open, a primitive which
+# ! reaches the end of the buffered input returns a Suspend instead of
+# ! deciding. It falls out of the trampoline like any final answer, and the
+# ! feed resumes it on a state over the longer buffer. Consumed input is never
+# ! scanned again, since every other parser only ever sees what a primitive
+# ! has already decided.
+# ! A parser can only go back to a state it has not consumed input since, or
+# ! to the start of a running try_, which holds it in ctx.holds. So each feed
+# ! drops the input before the oldest of those and the suspended state, and
+# ! offsets of older buffers are moved by the difference of their bases.
+# ! ctx.buffers tells the buffers apart by identity.
+# ! A state a parser went back to may still be over an older buffer. Its
+# ! primitives suspend at the end of that buffer, even after the last feed,
+# ! and are resumed over the current one.
+
+
+class Suspend:
+    """
+    A primitive waiting for more input. resume(input, shift) runs it again
+    from state over input, with the offsets of state.input moved by shift.
+    """
+
+    __slots__ = ("resume", "state")
+
+    def __init__(self, resume: Callable[[Any], Any], state: State):
+        self.resume = resume
+        self.state = state
+
+
+def partial_input(s: State) -> bool:
+    """
+    Whether more input may follow the end of s.input. It may while feeds are
+    open, and always when s.input is an older buffer of the run, as for a
+    state a parser went back to.
+    """
+    ctx = s.ctx
+    if ctx is None:
+        return False
+    if ctx.partial:
+        return True
+    buffers = ctx.buffers
+    return len(buffers) > 1 and any(b is s.input for b, _, _ in buffers[:-1])
+
+
+def suspend(
+    un_parser: Callable[..., Any],
+    s: State,
+    cok: Callable[..., Any],
+    cerr: Callable[..., Any],
+    eok: Callable[..., Any],
+    eerr: Callable[..., Any],
+) -> Suspend:
+    def resume(input, shift):
+        s_ = State(input, s._pos, s.user_state, s.offset + shift, s.ctx)
+        return un_parser(s_, cok, cerr, eok, eerr)
+
+    return Suspend(resume, s)
+
+
+def hold(s: State) -> object:
+    """
+    Keeps the input of a partial run from s on until release(s, key) is
+    called with the key returned. Parsers which may go back to s after
+    consuming input, as try_ does, hold it.
+    """
+    key = object()
+    s.ctx.holds[key] = s  # type: ignore
+    return key
+
+
+def release(s: State, key: object) -> None:
+    s.ctx.holds.pop(key, None)  # type: ignore
+
+
+def _base(ctx: ParseContext, input: Any) -> int:
+    for buffer, base, _ in ctx.buffers:
+        if buffer is input:
+            return base
+    raise ValueError("parser resumed from input which has been dropped")
+
+
+def offset_in(s: State, input: Any) -> int:
+    """
+    The offset of s in input, a later buffer of the same partial run
+    """
+    if s.input is input:
+        return s.offset
+    offset = s.offset + _base(s.ctx, s.input) - _base(s.ctx, input)  # type: ignore
+    if offset < 0:
+        raise ValueError("parser resumed from input which has been dropped")
+    return offset
+
+
+# ! first optionally lists the tokens a parser can start with. A parser with
+# ! a first set must fail without consuming input when the next token is not
+# ! in it, including at the end of input. None means unknown. choice uses it
+# ! to dispatch on the next token instead of trying every alternative.
+# ! node is the reified form of the parser, see entoli.parsec.node.
+
 
 @dataclass(frozen=True, slots=True)
 class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
@@ -68,6 +226,15 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
         ],
         Any,
     ]
+    first: frozenset | None = None
+    node: Node | None = None
+
+    def with_first(self, first: Iterable[Any]) -> "Parsec[_S, _U, _A]":
+        """
+        Declare the tokens this parser can start with. See Parsec.first.
+        """
+        first = frozenset(first)
+        return Parsec(self.un_parser, first, First(first, node_of(self)))
 
     # parsecMap :: (a -> b) -> ParsecT s u m a -> ParsecT s u m b
     # parsecMap f p
@@ -78,11 +245,13 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
         return Parsec(
             lambda s, cok, cerr, eok, eerr: self.un_parser(
                 s,
-                lambda a, s_, err: cok(f(a), s_, err),
+                lambda a, s_, err: Bounce(cok, f(a), s_, err),
                 cerr,
-                lambda a, s_, err: eok(f(a), s_, err),
+                lambda a, s_, err: Bounce(eok, f(a), s_, err),
                 eerr,
-            )
+            ),
+            self.first,
+            Map(f, node_of(self)),
         )
 
     # parserReturn :: a -> ParsecT s u m a
@@ -92,7 +261,9 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
 
     @staticmethod
     def pure(x: _A) -> "Parsec[_S, _U, _A]":
-        return Parsec(lambda s, _0, _1, eok, _2: eok(x, s, unknown_error(s)))
+        return Parsec(
+            lambda s, _0, _1, eok, _2: eok(x, s, UNKNOWN_ERROR), None, Pure(x)
+        )
 
     def ap(self, f: "Parsec[_S, _U, Callable[[_A], _B]]") -> "Parsec[_S, _U, _B]":
         return f.and_then(lambda f_: self.and_then(lambda x_: Parsec.pure(f_(x_))))
@@ -141,51 +312,17 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
     #     in unParser m s mcok mcerr meok meerr
 
     def and_then(self, f: Callable[[_A], "Parsec[_S, _U, _B]"]) -> "Parsec[_S, _U, _B]":
-        def _un_parser(
-            s: State[_S, _U],
-            cok: Callable[[_B, State[_S, _U], ParseError], Any],
-            cerr: Callable[[ParseError], Any],
-            eok: Callable[[_B, State[_S, _U], ParseError], Any],
-            eerr: Callable[[ParseError], Any],
-        ) -> Any:
-            def mcok(x, s, err):
-                if err == unknown_error(s):
-                    return f(x).un_parser(s, cok, cerr, cok, cerr)
-                else:
-                    pcok = cok
-                    pcerr = cerr
-
-                    def peok(x, s, err_):
-                        return cok(x, s, merge_error(err, err_))
-
-                    def peerr(err_):
-                        return cerr(merge_error(err, err_))
-
-                    return f(x).un_parser(s, pcok, pcerr, peok, peerr)
-
-            def meok(x, s, err):
-                if err == unknown_error(s):
-                    return f(x).un_parser(s, cok, cerr, eok, eerr)
-                else:
-                    pcok = cok
-
-                    def peok(x, s, err_):
-                        return eok(x, s, merge_error(err, err_))
-
-                    pcerr = cerr
-
-                    def peerr(err_):
-                        return eerr(merge_error(err, err_))
-
-                    return f(x).un_parser(s, pcok, pcerr, peok, peerr)
-
-            return self.un_parser(s, mcok, cerr, meok, eerr)
-
-        return Parsec(_un_parser)
+        return _bind(
+            self,
+            lambda x, s, cok, cerr, eok, eerr: f(x).un_parser(s, cok, cerr, eok, eerr),
+            Bind(node_of(self), f),
+        )
 
     @staticmethod
     def mzero() -> "Parsec[_S, _U, _A]":
-        return Parsec(lambda s, _0, _1, _2, eerr: eerr(unknown_error(s)))
+        return Parsec(
+            lambda s, _0, _1, _2, eerr: eerr(unknown_error(s)), frozenset(), Fail()
+        )
 
     # parserPlus :: ParsecT s u m a -> ParsecT s u m a -> ParsecT s u m a
     # {-# INLINE parserPlus #-}
@@ -209,26 +346,49 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
         ) -> Any:
             def meerr(err):
                 def neok(y, s_, err_):
-                    return eok(y, s_, merge_error(err, err_))
+                    return Bounce(
+                        eok, y, s_, merge_error(err, with_unknown_pos(err_, s_))
+                    )
 
                 def neerr(err_):
-                    return eerr(merge_error(err, err_))
+                    return Bounce(eerr, merge_error(err, err_))
 
-                return other.un_parser(s, cok, cerr, neok, neerr)
+                return Bounce(other.un_parser, s, cok, cerr, neok, neerr)
 
             return self.un_parser(s, cok, cerr, eok, meerr)
 
-        return Parsec(_un_parser)
+        node = Alt((node_of(self), node_of(other)))
+        if self.first is None or other.first is None:
+            return Parsec(_un_parser, None, node)
+        return Parsec(_un_parser, self.first | other.first, node)
 
     @staticmethod
     def empty() -> "Parsec[_S, _U, _A]":
-        return Parsec(lambda s, _0, _1, _2, eerr: eerr(unknown_error(s)))
+        return Parsec.mzero()
 
     def or_else(self, other: "Parsec[_S, _U, _A]") -> "Parsec[_S, _U, _A]":
         return self.mplus(other)
 
     def then(self, x: "Parsec[_S, _U, _B]") -> "Parsec[_S, _U, _B]":
-        return self.and_then(lambda _: x)
+        return _bind(
+            self,
+            lambda _, s, cok, cerr, eok, eerr: x.un_parser(s, cok, cerr, eok, eerr),
+            Then((node_of(self), node_of(x)), 1),
+        )
+
+    # (<*) :: f a -> f b -> f a
+
+    def skip(self, x: "Parsec[_S, _U, _B]") -> "Parsec[_S, _U, _A]":
+        def k(a, s, cok, cerr, eok, eerr):
+            return x.un_parser(
+                s,
+                lambda _, s_, err: Bounce(cok, a, s_, err),
+                cerr,
+                lambda _, s_, err: Bounce(eok, a, s_, err),
+                eerr,
+            )
+
+        return _bind(self, k, Then((node_of(self), node_of(x)), 0))
 
     # some :: f a -> f [a]
     # some v = some_v
@@ -243,14 +403,98 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
     #     some_v = (:) <$> v <*> many_v
 
     def some(self) -> "Parsec[_S, _U, Iterable[_A]]":
-        return self.and_then(
-            lambda x: self.some()
-            .fmap(lambda xs: append([x], xs))
-            .mplus(Parsec.pure([x]))
-        )
+        return many1(self)
 
     def many(self) -> "Parsec[_S, _U, Iterable[_A]]":
-        return self.some().mplus(Parsec.pure([]))
+        return many(self)
+
+    # (<?>) :: (ParsecT s u m a) -> String -> (ParsecT s u m a)
+    # p <?> msg = label p msg
+
+    def label(self, name: str) -> "Parsec[_S, _U, _A]":
+        return label(name, self)
+
+
+# ! parserBind, with the continuation given as k(x, s, cok, cerr, eok, eerr),
+# ! so that then and skip can continue without building a parser from x.
+
+
+def _bind(
+    m: Parsec[_S, _U, _A],
+    k: Callable[..., Any],
+    node: Node,
+) -> Parsec[_S, _U, _B]:
+    def _un_parser(
+        s: State[_S, _U],
+        cok: Callable[[_B, State[_S, _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[_B, State[_S, _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        def mcok(x, s, err):
+            if error_is_unknown(err):
+                return Bounce(k, x, s, cok, cerr, cok, cerr)
+            else:
+                pcok = cok
+                pcerr = cerr
+
+                def peok(x, s, err_):
+                    return Bounce(cok, x, s, merge_error(err, err_))
+
+                def peerr(err_):
+                    return Bounce(cerr, merge_error(err, err_))
+
+                return Bounce(k, x, s, pcok, pcerr, peok, peerr)
+
+        def meok(x, s, err):
+            if error_is_unknown(err):
+                return Bounce(k, x, s, cok, cerr, eok, eerr)
+            else:
+                pcok = cok
+
+                def peok(x, s, err_):
+                    return Bounce(eok, x, s, merge_error(err, err_))
+
+                pcerr = cerr
+
+                def peerr(err_):
+                    return Bounce(eerr, merge_error(err, err_))
+
+                return Bounce(k, x, s, pcok, pcerr, peok, peerr)
+
+        return m.un_parser(s, mcok, cerr, meok, eerr)
+
+    return Parsec(_un_parser, m.first, node)
+
+
+# liftA2 :: (a -> b -> c) -> f a -> f b -> f c
+
+
+def lift_a2(
+    f: Callable[[_A, _B], _C],
+    pa: Parsec[_S, _U, _A],
+    pb: Parsec[_S, _U, _B],
+) -> Parsec[_S, _U, _C]:
+    def k(a, s, cok, cerr, eok, eerr):
+        return pb.un_parser(
+            s,
+            lambda b, s_, err: Bounce(cok, f(a, b), s_, err),
+            cerr,
+            lambda b, s_, err: Bounce(eok, f(a, b), s_, err),
+            eerr,
+        )
+
+    node = Map(lambda ab: f(*ab), Then((node_of(pa), node_of(pb)), None))
+    return _bind(pa, k, node)
+
+
+def _test_lift_a2():
+    a = tokens("".join, update_pos_string, "a")
+    b = tokens("".join, update_pos_string, "b")
+    assert parse(lift_a2(lambda x, y: x + y, a, b), "", "ab") == "ab"
+    assert parse(lift_a2(lambda x, y: x + y, a, b), "", "ac") == ParseError(
+        SourcePos("", 1, 2), [Expect("b"), SysUnExpect("c")]
+    )
 
 
 # -- | The parser @unexpected msg@ always fails with an unexpected error
@@ -269,10 +513,255 @@ class Parsec(Generic[_S, _U, _A], MonadPlus[_A], Alternative[_A]):
 
 def unexpected(msg: str) -> Parsec[_S, _U, _A]:
     return Parsec(
-        lambda s, _0, _1, _2, eerr: eerr(new_error_message(UnExpect(msg), s.pos))
+        lambda s, _0, _1, _2, eerr: eerr(
+            new_error_message(UnExpect(msg), s.error_pos())
+        )
     )
 
 
+# -- | The parser @p \<?> msg@ behaves as parser @p@, but whenever the
+# -- parser @p@ fails /without consuming any input/, it replaces expect
+# -- error messages with the expect error message @msg@.
+# --
+# -- This is normally used at the end of a set alternatives where we want
+# -- to return an error message in terms of a higher level construct
+# -- rather than returning all possible characters. For example, if the
+# -- @expr@ parser from the 'try' example would fail, the error
+# -- message is: '...: expecting expression'. Without the @(\<?>)@
+# -- combinator, the message would be like '...: expecting \"let\" or
+# -- letter', which is less friendly.
+
+# label :: ParsecT s u m a -> String -> ParsecT s u m a
+# label p msg
+#   = labels p [msg]
+
+
+def label(name: str, p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
+    """
+    p, expecting name when it fails without consuming input.
+    Under run_pt(..., profile=True), the runs of p are profiled as name, and
+    under run_pt(..., trace=True) its rollbacks are attributed to name.
+    """
+    return labels([name], p)
+
+
+# labels :: ParsecT s u m a -> [String] -> ParsecT s u m a
+# labels p msgs =
+#     ParsecT $ \s cok cerr eok eerr ->
+#     let eok' x s' error = eok x s' $ if errorIsUnknown error
+#                   then error
+#                   else setExpectErrors error msgs
+#         eerr' err = eerr $ setExpectErrors err msgs
+
+#     in unParser p s cok cerr eok' eerr'
+
+
+def labels(names: Iterable[str], p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
+    names = tuple(names)
+    name = ", ".join(names)
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        def peok(x, s_, err):
+            if not error_is_unknown(err):
+                err = set_expect_errors(err, names)
+            return Bounce(eok, x, s_, err)
+
+        def peerr(err):
+            return Bounce(eerr, set_expect_errors(err, names))
+
+        ctx = s.ctx
+        if ctx is None or (ctx.profile is None and ctx.trace is None):
+            return p.un_parser(s, cok, cerr, peok, peerr)
+        return _observed(ctx, name, p, s, cok, cerr, peok, peerr)
+
+    return Parsec(_un_parser, p.first, Label(names, node_of(p)))
+
+
+# ! Messages compare by value here, while setErrorMessage of Parsec drops
+# ! every message of the same constructor. All Expect messages are dropped
+# ! explicitly instead.
+
+#     where
+#       setExpectErrors err []         = setErrorMessage (Expect "") err
+#       setExpectErrors err [msg]      = setErrorMessage (Expect msg) err
+#       setExpectErrors err (msg:msgs)
+#           = foldr (\msg' err' -> addErrorMessage (Expect msg') err')
+#                   (setErrorMessage (Expect msg) err) msgs
+
+
+def set_expect_errors(err: ParseError, names: tuple[str, ...]) -> ParseError:
+    expects = [Expect(name) for name in names] if names else [Expect("")]
+    return ParseError.lazy(
+        err.source_pos,
+        lambda: expects + [m for m in err.message if type(m) is not Expect],
+    )
+
+
+def enter_label(ctx: ParseContext, name: str) -> tuple[Any, Any]:
+    """
+    Enters a run of the label name in the profiler and tracer of ctx
+    """
+    profile = ctx.profile
+    trace = ctx.trace
+    return (
+        profile.enter(name) if profile is not None else None,
+        trace.enter(name) if trace is not None else None,
+    )
+
+
+def exit_label(
+    ctx: ParseContext, entered: tuple[Any, Any], ok: bool, consumed: int
+) -> None:
+    profile_frame, trace_frame = entered
+    if profile_frame is not None:
+        ctx.profile.exit(profile_frame, ok, consumed)  # type: ignore
+    if trace_frame is not None:
+        ctx.trace.exit(trace_frame, ok, consumed)  # type: ignore
+
+
+def _observed(
+    ctx: ParseContext,
+    name: str,
+    p: Parsec[_S, _U, _A],
+    s: State[_S, _U],
+    cok: Callable[[_A, State[_S, _U], ParseError], Any],
+    cerr: Callable[[ParseError], Any],
+    eok: Callable[[_A, State[_S, _U], ParseError], Any],
+    eerr: Callable[[ParseError], Any],
+) -> Any:
+    entered = enter_label(ctx, name)
+    o = s.offset
+
+    def pcok(x, s_, err):
+        exit_label(ctx, entered, True, s_.offset - o)
+        return Bounce(cok, x, s_, err)
+
+    def pcerr(err):
+        exit_label(ctx, entered, False, 0)
+        return Bounce(cerr, err)
+
+    def peok(x, s_, err):
+        exit_label(ctx, entered, True, 0)
+        return eok(x, s_, err)
+
+    def peerr(err):
+        exit_label(ctx, entered, False, 0)
+        return eerr(err)
+
+    return p.un_parser(s, pcok, pcerr, peok, peerr)
+
+
+def _test_labels():
+    def string(s: str) -> Parsec[Iterable[str], _U, Iterable[str]]:
+        return tokens("".join, update_pos_string, s)
+
+    keyword = label("keyword", string("let").mplus(string("in")))
+    assert parse(keyword, "", "x") == ParseError(
+        SourcePos("", 1, 1),
+        [Expect("keyword"), SysUnExpect("x"), SysUnExpect("x")],
+    )
+    assert parse(keyword, "", "lex") == ParseError(
+        SourcePos("", 1, 1), [Expect("let"), SysUnExpect("x")]
+    )
+    assert parse(labels(["a", "b"], string("c")), "", "") == ParseError(
+        SourcePos("", 1, 1), [Expect("a"), Expect("b"), SysUnExpect("")]
+    )
+    assert parse(labels([], string("c")), "", "d") == ParseError(
+        SourcePos("", 1, 1), [Expect(""), SysUnExpect("d")]
+    )
+
+    spaces = label("spaces", many(string(" ")))
+    assert parse(spaces.then(string("x")), "", "y") == ParseError(
+        SourcePos("", 1, 1),
+        [Expect("spaces"), SysUnExpect("y"), Expect("x"), SysUnExpect("y")],
+    )
+    assert parse(string("a").label("a").then(get_position()), "", "a") == (
+        SourcePos("", 1, 2)
+    )
+
+
+# ! Recursive grammars. A rule which refers to itself through a Python
+# ! function is built again at every use. forward makes a placeholder parser
+# ! which runs the parser later given to define, so a recursive grammar is
+# ! built once and its node tree is a graph with a Ref at each cycle.
+
+
+def forward() -> Parsec[_S, _U, _A]:
+    """
+    A parser which runs the parser given to define, once defined
+    """
+    cell: list[Parsec[_S, _U, _A] | None] = [None]
+
+    def _un_parser(s, cok, cerr, eok, eerr):
+        p = cell[0]
+        if p is None:
+            raise ValueError("forward parser used before define")
+        return Bounce(p.un_parser, s, cok, cerr, eok, eerr)
+
+    return Parsec(_un_parser, None, Ref(cell))
+
+
+def define(fwd: Parsec[_S, _U, _A], p: Parsec[_S, _U, _A]) -> None:
+    """
+    Makes the forward parser fwd run p. A forward parser is defined once.
+    """
+    if type(fwd.node) is not Ref:
+        raise TypeError("define needs a parser made by forward")
+    if fwd.node.cell[0] is not None:
+        raise ValueError("forward parser defined twice")
+    fwd.node.cell[0] = p
+
+
+# -- | @fix f@ is the parser @p = f p@, built once.
+
+
+def fix(
+    f: Callable[[Parsec[_S, _U, _A]], Parsec[_S, _U, _A]],
+) -> Parsec[_S, _U, _A]:
+    fwd: Parsec[_S, _U, _A] = forward()
+    p = f(fwd)
+    define(fwd, p)
+    return p
+
+
+def _test_fix():
+    def string(s: str) -> Parsec[Iterable[str], _U, Iterable[str]]:
+        return tokens("".join, update_pos_string, s)
+
+    # nested ::= "(" nested* ")"
+    built = []
+
+    def nested_(self):
+        built.append(self)
+        group = string("(").then(many(self)).skip(string(")"))
+        return group.fmap(lambda xs: len(xs) + sum(xs))
+
+    nested = fix(nested_)
+    assert len(built) == 1
+    assert parse(nested, "", "(()(()))") == 3
+    assert parse(nested, "", "(()") == ParseError(
+        SourcePos("", 1, 4),
+        [Expect("("), SysUnExpect(""), Expect(")"), SysUnExpect("")],
+    )
+    assert parse(nested, "", "(" * 5000 + ")" * 5000) == 4999
+
+    expr = forward()
+    atom = string("x").mplus(string("[").then(expr).skip(string("]")))
+    define(expr, many(atom).fmap("".join))
+    assert parse(expr, "", "x[x[]]x") == "xxx"
+
+    try:
+        parse(forward(), "", "")
+        assert False
+    except ValueError:
+        pass
+    try:
+        define(expr, atom)
+        assert False
+    except ValueError:
+        pass
+
+
 # runParsecT :: Monad m => ParsecT s u m a -> State s u -> m (Consumed (m (Reply s u a)))
 # {-# INLINABLE runParsecT #-}
 # runParsecT p s = unParser p s cok cerr eok eerr
@@ -287,18 +776,18 @@ def run_parsec_t(
     state: State[_S, _U],
 ) -> MbConsumed[Reply[_S, _U, _A]]:
     def cok(a, s_, err):
-        return Consumed(Reply_Ok(a, s_, err))
+        return Consumed(Reply_Ok(a, s_, with_unknown_pos(err, s_)))
 
     def cerr(err):
         return Consumed(Reply_Error(err))
 
     def eok(a, s_, err):
-        return Empty(Reply_Ok(a, s_, err))
+        return Empty(Reply_Ok(a, s_, with_unknown_pos(err, s_)))
 
     def eerr(err):
         return Empty(Reply_Error(err))
 
-    return parser.un_parser(state, cok, cerr, eok, eerr)
+    return _trampoline(parser.un_parser(state, cok, cerr, eok, eerr))
 
 
 # mkPT :: Monad m => (State s u -> m (Consumed (m (Reply s u a)))) -> ParsecT s u m a
@@ -334,25 +823,424 @@ def make_parser(
                 rep = mrep
                 match rep:
                     case Reply_Ok(x, s_, err):
-                        cok(x, s_, err)
+                        return cok(x, s_, err)
                     case Reply_Error(err):
-                        cerr(err)
+                        return cerr(err)
             case Empty(mrep):
                 rep = mrep
                 match rep:
                     case Reply_Ok(x, s_, err):
-                        eok(x, s_, err)
+                        return eok(x, s_, err)
                     case Reply_Error(err):
-                        eerr(err)
+                        return eerr(err)
 
     return Parsec(_un_parser)
 
 
+# data State s u = State { stateInput :: s,
+#                          statePos   :: !SourcePos,
+#                          stateUser  :: !u
+#                        }
+
+# ! Instead of carrying the remaining stream, the state keeps the original
+# ! indexable input and an offset into it. Advancing, snapshotting and
+# ! backtracking are integer operations, and no token is ever re-iterated.
+# ! ctx is shared by every state of one run and must be passed along.
+# ! A _pos of None means the position is derived from the offset through
+# ! ctx.lines. Primitives then skip next_pos, and an explicit position set by
+# ! set_position is advanced as usual from there on.
+
+
 @dataclass(frozen=True, slots=True)
 class State(Generic[_S, _U]):
     input: _S
-    pos: SourcePos
+    _pos: SourcePos | None
     user_state: _U
+    offset: int = 0
+    ctx: ParseContext | None = None
+
+    @property
+    def pos(self) -> SourcePos:
+        pos = self._pos
+        if pos is None:
+            return self.ctx.lines.pos_at(self.offset)  # type: ignore
+        return pos
+
+    def error_pos(self, offset: int | None = None) -> SourcePos | OffsetPos:
+        """
+        The position of an error at offset, by default the current one.
+        A lazy position is only resolved if the error is read.
+        """
+        if offset is None:
+            offset = self.offset
+        pos = self._pos
+        if pos is None:
+            return OffsetPos(self.ctx.lines, offset)  # type: ignore
+        if offset == self.offset:
+            return pos
+        return update_pos_string(pos, self.input[self.offset : offset])
+
+
+class ParseContext:
+    """Mutable data of a single run, shared by all of its states"""
+
+    __slots__ = (
+        "memo",
+        "packrat",
+        "lines",
+        "partial",
+        "profile",
+        "trace",
+        "compiled",
+        "holds",
+        "buffers",
+    )
+
+    def __init__(
+        self,
+        memo: MemoTable | None = None,
+        packrat: bool = False,
+        lines: LineIndex | None = None,
+        partial: bool = False,
+        profile: Profiler | None = None,
+        trace: BacktrackTracer | None = None,
+    ):
+        self.memo = memo
+        self.packrat = packrat
+        self.lines = lines
+        self.partial = partial
+        self.profile = profile
+        self.trace = trace
+        # The functions of compiled parsers, built for the input of this run
+        self.compiled: dict[Any, tuple[Any, Any]] = {}
+        # Over partial input, the states which may be rolled back to, and
+        # each buffer still in use with its base and end offsets
+        self.holds: dict[object, State] = {}
+        self.buffers: list[tuple[Any, int, int]] = []
+
+
+class LineIndex:
+    """
+    Recovers the SourcePos of an offset into a str or MappedText input.
+    Newline and tab offsets are indexed on the first lookup and bisected
+    afterwards, so a lookup does not walk its line.
+    """
+
+    __slots__ = (
+        "input",
+        "name",
+        "_width",
+        "_newlines",
+        "_tabs",
+        "_tab_cols",
+        "_last",
+    )
+
+    def __init__(self, input: str, name: str):
+        self.input = input
+        self.name = name
+        # Columns of a multibyte MappedText count characters, not bytes
+        self._width = (
+            input.width
+            if isinstance(input, MappedText) and not input._single
+            else None
+        )
+        self._newlines: list[int] | None = None
+        self._tabs: list[int] = []
+        self._tab_cols: list[int] = []
+        self._last: tuple[int, SourcePos] | None = None
+
+    def _index(self) -> list[int]:
+        input = self.input
+        if isinstance(input, MappedText):
+            find, nl, tab = input.buffer.find, b"\n", b"\t"
+        else:
+            find, nl, tab = input.find, "\n", "\t"
+
+        newlines = []
+        i = find(nl)
+        while i >= 0:
+            newlines.append(i)
+            i = find(nl, i + 1)
+
+        # The column just after each tab, counted from the previous tab
+        # of its line if there is one
+        tabs, tab_cols = self._tabs, self._tab_cols
+        width = self._width
+        i = find(tab)
+        while i >= 0:
+            line = bisect_left(newlines, i)
+            start = newlines[line - 1] + 1 if line else 0
+            if tabs and tabs[-1] >= start:
+                after = tabs[-1] + 1
+                col = tab_cols[-1] - 1
+            else:
+                after = start
+                col = 0
+            col += (i - after if width is None else width(after, i)) + 1
+            tabs.append(i)
+            tab_cols.append(col + 8 - ((col - 1) % 8))
+            i = find(tab, i + 1)
+
+        self._newlines = newlines
+        return newlines
+
+    def pos_at(self, offset: int) -> SourcePos:
+        last = self._last
+        if last is not None and last[0] == offset:
+            return last[1]
+
+        newlines = self._newlines
+        if newlines is None:
+            newlines = self._index()
+
+        line = bisect_left(newlines, offset)
+        start = newlines[line - 1] + 1 if line else 0
+        tabs = self._tabs
+        t = bisect_left(tabs, offset) - 1
+        if t >= 0 and tabs[t] >= start:
+            start = tabs[t] + 1
+            col = self._tab_cols[t]
+        else:
+            col = 1
+        width = self._width
+        col += offset - start if width is None else width(start, offset)
+        pos = new_pos(self.name, line + 1, col)
+        self._last = (offset, pos)
+        return pos
+
+
+class OffsetPos:
+    """
+    The position of an offset of a lazy_positions run, kept in a ParseError
+    in place of a SourcePos until the error is read
+    """
+
+    __slots__ = ("lines", "offset")
+
+    def __init__(self, lines: LineIndex, offset: int):
+        self.lines = lines
+        self.offset = offset
+
+    def resolve(self) -> SourcePos:
+        return self.lines.pos_at(self.offset)
+
+
+def _test_line_index():
+    for input in ["ab\n\tc\n\nx\ty", "\t\ta\tbcdefghij\tk\n\t", "x\t" * 20]:
+        lines = LineIndex(input, "f")
+        for o in range(len(input) + 1):
+            expected = update_pos_string(initial_pos("f"), input[:o])
+            assert lines.pos_at(o) == expected
+            assert lines.pos_at(o) == expected
+            assert OffsetPos(lines, o).resolve() == expected
+
+    assert LineIndex("", "").pos_at(0) == initial_pos("")
+
+    lines = LineIndex("ab\n\tc", "f")
+    lazy = State("ab\n\tc", None, None, 4, ParseContext(lines=lines))
+    assert lazy.pos == SourcePos("f", 2, 9)
+    assert lazy.error_pos(5).resolve() == SourcePos("f", 2, 10)  # type: ignore
+    eager = State("ab\n\tc", SourcePos("f", 1, 2), None, 1)
+    assert eager.error_pos() == SourcePos("f", 1, 2)
+    assert eager.error_pos(4) == SourcePos("f", 2, 9)
+
+
+# ! A memory-mapped file is parsed in place. Offsets into a MappedText are
+# ! byte offsets, and only the slices a parser returns are decoded, with the
+# ! encoding of the file. A single item is the character its byte decodes to
+# ! on its own, so str primitives work on ASCII-compatible text; a byte of a
+# ! multibyte character reads as its surrogate escape, as a slice splitting
+# ! the character does. Patterns are matched on the encoded bytes, where \w
+# ! and friends only match ASCII. Columns count decoded characters, except
+# ! that character primitives over a multibyte encoding other than UTF-8
+# ! count bytes unless positions are lazy.
+
+
+class MappedText(Sequence):
+    """
+    A read-only str view of a bytes-like buffer, typically an mmap
+    """
+
+    __slots__ = ("buffer", "encoding", "_chars", "_single", "_multibyte", "_patterns")
+
+    def __init__(self, buffer: Any, encoding: str = "utf-8"):
+        chars = [bytes([b]).decode(encoding, "surrogateescape") for b in range(256)]
+        if chars[:128] != [chr(b) for b in range(128)]:
+            raise ValueError(f"{encoding} is not an ASCII-compatible encoding")
+        self.buffer = buffer
+        self.encoding = codecs.lookup(encoding).name
+        self._chars = chars
+        self._single = all(not "\udc80" <= c <= "\udcff" for c in chars)
+        self._multibyte: list[int] | None = None
+        self._patterns: dict[re.Pattern, re.Pattern] = {}
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.buffer[idx].decode(self.encoding, "surrogateescape")
+        return self._chars[self.buffer[idx]]
+
+    def __repr__(self) -> str:
+        return f"MappedText({len(self.buffer)} bytes)"
+
+    def startswith(self, prefix: str, start: int = 0) -> bool:
+        try:
+            b = prefix.encode(self.encoding, "surrogateescape")
+        except UnicodeEncodeError:
+            return False
+        return self.buffer[start : start + len(b)] == b
+
+    def find(self, sub: str, start: int = 0, end: int | None = None) -> int:
+        if end is None:
+            end = len(self.buffer)
+        try:
+            b = sub.encode(self.encoding, "surrogateescape")
+        except UnicodeEncodeError:
+            return -1
+        return self.buffer.find(b, start, end)
+
+    def size(self, text: str) -> int:
+        """
+        The number of bytes text encodes to
+        """
+        if self._single:
+            return len(text)
+        return len(text.encode(self.encoding, "surrogateescape"))
+
+    def width(self, start: int, end: int) -> int:
+        """
+        The number of characters the bytes from start to end decode to
+        """
+        if self._single:
+            return end - start
+        if self.encoding != "utf-8":
+            return len(self[start:end])
+        # Every byte but the continuation bytes starts a UTF-8 character
+        multibyte = self._multibyte
+        if multibyte is None:
+            found = re.finditer(rb"[\x80-\xbf]", self.buffer)
+            multibyte = self._multibyte = [m.start() for m in found]
+        if not multibyte:
+            return end - start
+        inner = bisect_left(multibyte, end) - bisect_left(multibyte, start)
+        return end - start - inner
+
+    def bytes_pattern(self, pattern: re.Pattern) -> re.Pattern:
+        """
+        The str pattern compiled for the bytes of the buffer
+        """
+        compiled = self._patterns.get(pattern)
+        if compiled is None:
+            compiled = re.compile(
+                pattern.pattern.encode(self.encoding), pattern.flags & ~re.UNICODE
+            )
+            self._patterns[pattern] = compiled
+        return compiled
+
+
+def _test_mapped_text():
+    input = MappedText(b"ab\n\tc")
+    assert len(input) == 5 and input[1] == "b" and input[1:4] == "b\n\t"
+    assert input.startswith("b\n", 1) and not input.startswith("bc", 1)
+    assert input.find("\t", 0, 5) == 3
+    pattern = input.bytes_pattern(re.compile(r"(a)\tb", re.IGNORECASE))
+    assert pattern.pattern == rb"(a)\tb" and pattern.flags & re.IGNORECASE
+    assert pattern is input.bytes_pattern(re.compile(r"(a)\tb", re.IGNORECASE))
+
+    input = MappedText("name=José!".encode())
+    assert input[5:10] == "José" and input[10:] == "!"
+    assert input[8] == "\udcc3" and input[8:9] == "\udcc3"
+    assert input.startswith("é!", 8) and input.find("é") == 8
+    assert input.width(0, 11) == 10 and input.width(9, 10) == 0
+    latin = MappedText("José".encode("latin-1"), "latin-1")
+    assert latin[3] == "é" and latin[:] == "José" and latin.width(0, 4) == 4
+    assert MappedText("José".encode("cp1252"), "cp1252")[3] == "é"
+    try:
+        MappedText(b"", "utf-16")
+        assert False
+    except ValueError:
+        pass
+
+
+# Input types which can be indexed in O(1) and are used as-is
+_INDEXABLE = (
+    str,
+    bytes,
+    bytearray,
+    memoryview,
+    mmap,
+    list,
+    tuple,
+    range,
+)
+
+
+def as_stream(s: Iterable[_T]) -> Sequence[_T]:
+    """
+    Return an input which supports O(1) indexing.
+    Strings, bytes, lists and subclasses of Sequence are used as-is, other
+    iterables are evaluated once.
+    """
+    # Registered Sequences such as deque do not index in O(1)
+    if isinstance(s, _INDEXABLE) or Sequence in type(s).__mro__:
+        return s  # type: ignore
+    return list(s)
+
+
+def _test_as_stream():
+    from collections import deque
+
+    assert as_stream("abc") == "abc"
+    assert as_stream(b"abc") == b"abc"
+    assert as_stream([1, 2]) == [1, 2]
+    assert as_stream(iter("ab")) == ["a", "b"]
+    rest = _Rest("abc", 1)
+    assert as_stream(rest) is rest
+    assert as_stream(deque("ab")) == ["a", "b"]
+
+
+class _Rest(Sequence):
+    """A view of the input after an offset, used as the remaining stream"""
+
+    __slots__ = ("_input", "_offset")
+
+    def __init__(self, input: Sequence[_T], offset: int):
+        self._input = input
+        self._offset = offset
+
+    def __len__(self) -> int:
+        return max(len(self._input) - self._offset, 0)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self._input[self._offset :][idx]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("_Rest index out of range")
+        return self._input[self._offset + idx]
+
+    def __iter__(self):
+        return islice(self._input, self._offset, None)
+
+    def __bool__(self) -> bool:
+        return self._offset < len(self._input)
+
+    def __repr__(self) -> str:
+        return f"_Rest({self._input[self._offset :]!r})"
+
+
+def _test_rest():
+    rest = _Rest("abc", 1)
+    assert len(rest) == 2
+    assert list(rest) == ["b", "c"]
+    assert rest[0] == "b"
+    assert rest[-1] == "c"
+    assert rest[1:] == "c"
+    assert not _Rest("abc", 3)
 
 
 @dataclass(frozen=True, slots=True)
@@ -402,7 +1290,72 @@ def update_pos_string(
     pos: SourcePos,
     string: Iterable[str],
 ) -> SourcePos:
-    return foldl(update_pos_char, pos, string)
+    if isinstance(string, str):
+        nl, tab = "\n", "\t"
+    elif isinstance(string, (bytes, bytearray)):
+        nl, tab = b"\n", b"\t"
+    else:
+        return foldl(update_pos_char, pos, string)
+
+    # Same as the fold, but only the last line is walked, and only if it has tabs
+    line = pos.line
+    col = pos.col
+    start = 0
+    newlines = string.count(nl)
+    if newlines:
+        line += newlines
+        col = 1
+        start = string.rfind(nl) + 1
+
+    if string.find(tab, start) < 0:
+        return new_pos(pos.name, line, col + len(string) - start)
+
+    for i in range(start, len(string)):
+        if string[i : i + 1] == tab:
+            col += 8 - ((col - 1) % 8)
+        else:
+            col += 1
+    return new_pos(pos.name, line, col)
+
+
+def _test_update_pos_string():
+    pos = initial_pos("")
+    for string in ["", "abc", "a\nbc", "a\tb", "ab\n\tc\td", "\n\n", ["a", "\n"]]:
+        assert update_pos_string(pos, string) == foldl(update_pos_char, pos, string)
+    assert update_pos_string(pos, b"ab\n\tc") == update_pos_string(pos, "ab\n\tc")
+
+
+# ! A literal always moves the position by the same newline/column delta, so
+# ! it is computed once when the parser is built rather than on every match.
+# ! A tab on the last line depends on the starting column, and such literals
+# ! fall back to update_pos_string.
+
+
+def literal_next_pos(
+    lit: Iterable[str],
+) -> Callable[[SourcePos, Iterable[str]], SourcePos]:
+    if isinstance(lit, str):
+        nl, tab = "\n", "\t"
+    elif isinstance(lit, (bytes, bytearray)):
+        nl, tab = b"\n", b"\t"
+    else:
+        return update_pos_string
+
+    start = lit.rfind(nl) + 1
+    if lit.find(tab, start) >= 0:
+        return update_pos_string
+
+    newlines = lit.count(nl)
+    width = len(lit) - start
+    if newlines:
+        return lambda pos, _: new_pos(pos.name, pos.line + newlines, 1 + width)
+    return lambda pos, _: new_pos(pos.name, pos.line, pos.col + width)
+
+
+def _test_literal_next_pos():
+    pos = new_pos("", 3, 5)
+    for lit in ["", "abc", "a\nbc", "\tb", "a\n\tb", "x\t\ny", b"a\nbc", ["a"]]:
+        assert literal_next_pos(lit)(pos, lit) == update_pos_string(pos, lit)
 
 
 # updatePosChar   :: SourcePos -> Char -> SourcePos
@@ -426,6 +1379,19 @@ def update_pos_char(
             return new_pos(pos.name, pos.line, pos.col + 1)
 
 
+def next_pos_char(pos: SourcePos, c: str, cs: Any) -> SourcePos:
+    """
+    update_pos_char as the next_pos of a character token. A byte which
+    continues a UTF-8 character of a MappedText keeps the column, so that
+    columns count decoded characters there too.
+    """
+    if type(c) is str and "\udc80" <= c < "\udcc0" and type(cs) is _Rest:
+        input = cs._input
+        if type(input) is MappedText and input.encoding == "utf-8":
+            return pos
+    return update_pos_char(pos, c)
+
+
 type Message = SysUnExpect | UnExpect | Expect | RawMessage
 
 # SysUnExpect = NewType("SysUnExpect", str)
@@ -464,10 +1430,117 @@ class _TestMessage:
         assert RawMessage("a") == RawMessage("a")
 
 
-@dataclass(frozen=True, slots=True)
+# data ParseError = ParseError !SourcePos [Message]
+
+# ! Messages may be given as a thunk, which is only evaluated when they are
+# ! read, e.g. when the error is shown or compared. Failing alternatives which
+# ! get merged away therefore never format their messages.
+
+
 class ParseError:
-    source_pos: SourcePos
-    message: Iterable[Message]
+    __slots__ = ("_pos", "_message", "_thunk")
+    __match_args__ = ("source_pos", "message")
+
+    def __init__(self, source_pos: SourcePos | OffsetPos, message: Iterable[Message]):
+        self._pos = source_pos
+        self._message = message
+        self._thunk: Callable[[], Iterable[Message]] | None = None
+
+    @staticmethod
+    def lazy(
+        source_pos: SourcePos | OffsetPos,
+        thunk: Callable[[], Iterable[Message]],
+    ) -> ParseError:
+        """
+        Error whose messages are built by thunk on first access.
+        The thunk must return at least one message.
+        """
+        e = ParseError(source_pos, ())
+        e._thunk = thunk
+        return e
+
+    @property
+    def source_pos(self) -> SourcePos:
+        pos = self._pos
+        if type(pos) is OffsetPos:
+            pos = self._pos = pos.resolve()
+        return pos  # type: ignore
+
+    @property
+    def message(self) -> Iterable[Message]:
+        if self._thunk is not None:
+            self._message = self._thunk()
+            self._thunk = None
+        return self._message
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ParseError):
+            return NotImplemented
+        return self.source_pos == other.source_pos and list(self.message) == list(
+            other.message
+        )
+
+    def __repr__(self) -> str:
+        return f"ParseError(source_pos={self.source_pos!r}, message={self.message!r})"
+
+    def __reduce__(self):
+        # Lazy and merged messages hold closures, so they are pickled as a list
+        return (ParseError, (self.source_pos, list(self.message)))
+
+
+def _test_parse_error():
+    calls = []
+
+    def thunk():
+        calls.append(None)
+        return [Expect("a")]
+
+    e = ParseError.lazy(SourcePos("", 1, 1), thunk)
+    assert not error_is_unknown(e)
+    assert not calls
+    assert e == ParseError(SourcePos("", 1, 1), [Expect("a")])
+    assert e == ParseError(SourcePos("", 1, 1), [Expect("a")])
+    assert len(calls) == 1
+    assert e != ParseError(SourcePos("", 1, 2), [Expect("a")])
+    assert error_is_unknown(new_error_unknown(SourcePos("", 1, 1)))
+
+    import pickle
+
+    merged = merge_error(e, ParseError(SourcePos("", 1, 1), [Expect("b")]))
+    assert pickle.loads(pickle.dumps(merged)) == merged
+
+    lines = LineIndex("a\n\tb", "f")
+    e1 = new_error_message(Expect("a"), OffsetPos(lines, 3))
+    e2 = new_error_message(Expect("b"), OffsetPos(lines, 1))
+    assert merge_error(e1, e2) is e2
+    assert lines._newlines is None
+    assert e1.source_pos == SourcePos("f", 2, 9)
+
+
+# ! In ok continuations an unknown error is passed as the shared UNKNOWN_ERROR,
+# ! meaning "unknown at the position of the reply state". Nothing is allocated
+# ! for it on success. It is resolved to a positioned error with
+# ! with_unknown_pos when it leaves an ok continuation.
+
+UNKNOWN_ERROR = ParseError(initial_pos(""), ())
+
+
+def with_unknown_pos(
+    err: ParseError,
+    state: State[_S, _U],
+) -> ParseError:
+    return unknown_error(state) if err is UNKNOWN_ERROR else err
+
+
+# errorIsUnknown :: ParseError -> Bool
+# errorIsUnknown (ParseError _ msgs)
+#     = null msgs
+
+
+def error_is_unknown(
+    e: ParseError,
+) -> bool:
+    return e._thunk is None and not e._message
 
 
 # newErrorUnknown :: SourcePos -> ParseError
@@ -476,9 +1549,9 @@ class ParseError:
 
 
 def new_error_unknown(
-    pos: SourcePos,
+    pos: SourcePos | OffsetPos,
 ) -> ParseError:
-    return ParseError(pos, [])
+    return ParseError(pos, ())
 
 
 # newErrorMessage :: Message -> SourcePos -> ParseError
@@ -488,7 +1561,7 @@ def new_error_unknown(
 
 def new_error_message(
     msg: Message,
-    pos: SourcePos,
+    pos: SourcePos | OffsetPos,
 ) -> ParseError:
     return ParseError(pos, [msg])
 
@@ -502,8 +1575,8 @@ def set_error_message(
     msg: Message,
     e: ParseError,
 ) -> ParseError:
-    return ParseError(
-        e.source_pos, append([msg], filter(lambda m: m != msg, e.message))
+    return ParseError.lazy(
+        e._pos, lambda: append([msg], filter(lambda m: m != msg, e.message))
     )
 
 
@@ -526,13 +1599,27 @@ def merge_error(
     e1: ParseError,
     e2: ParseError,
 ) -> ParseError:
-    if not e2.message and e1.message:
+    unknown1 = error_is_unknown(e1)
+    unknown2 = error_is_unknown(e2)
+    if unknown2 and not unknown1:
         return e1
-    if not e1.message and e2.message:
+    if unknown1 and not unknown2:
         return e2
-    if e1.source_pos == e2.source_pos:
-        return ParseError(e1.source_pos, append(e1.message, e2.message))
-    if e1.source_pos < e2.source_pos:
+    # Offsets of the same run compare like the positions they resolve to
+    pos1, pos2 = e1._pos, e2._pos
+    if (
+        type(pos1) is OffsetPos
+        and type(pos2) is OffsetPos
+        and pos1.lines is pos2.lines
+    ):
+        pos1, pos2 = pos1.offset, pos2.offset
+    else:
+        pos1, pos2 = e1.source_pos, e2.source_pos
+    if pos1 == pos2:
+        if unknown1:
+            return e1
+        return ParseError.lazy(e1._pos, lambda: append(e1.message, e2.message))
+    if pos1 < pos2:  # type: ignore
         return e1
     else:
         return e2
@@ -566,6 +1653,31 @@ class Reply_Ok(Generic[_S, _U, _A]):
     err: ParseError
 
 
+# ! When the literal and the input are both str or both bytes, a single
+# ! startswith call decides the match. The token walk is kept for other
+# ! streams and to find the offending token once a match has failed.
+
+
+def _first_of(tts: Sequence[Any]) -> frozenset | None:
+    try:
+        return frozenset([tts[0]])
+    except TypeError:
+        return None
+
+
+def _literal_stream(tts: Iterable[Any]) -> type | tuple[type, ...] | None:
+    if isinstance(tts, str):
+        return (str, MappedText)
+    if isinstance(tts, (bytes, bytearray)):
+        return (bytes, bytearray)
+    return None
+
+
+def _prefix_at(input: Sequence[Any], o: int, tts: Sequence[Any]) -> bool:
+    # Whether the rest of input from o could still grow into tts
+    return all(input[i] == t for i, t in zip(range(o, len(input)), tts))
+
+
 # tokens :: (Stream s m t, Eq t)
 #        => ([t] -> String)      -- Pretty print a list of tokens
 #        -> (SourcePos -> [t] -> SourcePos)
@@ -609,66 +1721,81 @@ def tokens(
     next_pos: Callable[[SourcePos, Iterable[_T]], SourcePos],
     tts: Iterable[_T],
 ) -> Parsec[Iterable[_T], _U, Iterable[_T]]:
-    match uncons(tts):
-        case Nothing():
-            return Parsec(lambda s, _0, _1, eok, _2: eok([], s, unknown_error(s)))
-        case Just((tok, toks)):
-            # tok = head(ts)
-            # toks = tail(ts)
-
-            def _un_parser(
-                s: State[Iterable[_T], _U],
-                cok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
-                cerr: Callable[[ParseError], Any],
-                _eok: Callable[
-                    [Iterable[_T], State[Iterable[_T], _U], ParseError], Any
-                ],
-                eerr: Callable[[ParseError], Any],
-            ) -> Any:
-                err_eof = set_error_message(
-                    Expect(show_tokens(tts)),
-                    new_error_message(SysUnExpect(""), s.pos),
-                )
-
-                def err_expect(x):
-                    return set_error_message(
-                        Expect(show_tokens(tts)),
-                        new_error_message(SysUnExpect(show_tokens([x])), s.pos),
-                    )
+    tts_ = as_stream(tts)
+    n = len(tts_)
+    literal = _literal_stream(tts_)
 
-                def walk(ts: Iterable[_T], rs: Iterable[_T]) -> Any:
-                    # match ts:
-                    match uncons(ts):
-                        case Nothing():
-                            return ok(rs)
-                        case Just((t, ts)):
-                            sr = uncons(rs)
-                            match sr:
-                                case Nothing():
-                                    return cerr(err_eof)
-                                case Just((x, xs)):
-                                    if t == x:
-                                        return walk(ts, xs)
-                                    else:
-                                        return cerr(err_expect(x))
-
-                def ok(rs: Iterable[_T]) -> Any:
-                    pos_ = next_pos(s.pos, tts)
-                    s_ = State(rs, pos_, s.user_state)
-                    return cok(tts, s_, new_error_unknown(pos_))
-
-                sr = uncons(s.input)
-
-                match sr:
-                    case Nothing():
-                        return eerr(err_eof)
-                    case Just((x, xs)):
-                        if tok == x:
-                            return walk(toks, xs)
-                        else:
-                            return eerr(err_expect(x))
-
-            return Parsec(_un_parser)
+    if n == 0:
+        return Parsec(lambda s, _0, _1, eok, _2: eok([], s, UNKNOWN_ERROR))
+
+    def _un_parser(
+        s: State[Iterable[_T], _U],
+        cok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        _eok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        def err_eof():
+            return ParseError.lazy(
+                s.error_pos(), lambda: [Expect(show_tokens(tts)), SysUnExpect("")]
+            )
+
+        def err_expect(x):
+            return ParseError.lazy(
+                s.error_pos(),
+                lambda: [Expect(show_tokens(tts)), SysUnExpect(show_tokens([x]))],
+            )
+
+        input = s.input
+        o = s.offset
+
+        if literal is not None and isinstance(input, literal):
+            if input.startswith(tts_, o):
+                pos_ = s._pos and next_pos(s._pos, tts)
+                size = n if type(input) is not MappedText else input.size(tts_)
+                s_ = State(input, pos_, s.user_state, o + size, s.ctx)
+                return cok(tts, s_, UNKNOWN_ERROR)
+
+        end = len(input)
+        if o + n > end and partial_input(s) and _prefix_at(input, o, tts_):
+            return suspend(_un_parser, s, cok, cerr, _eok, eerr)
+        if o >= end:
+            return eerr(err_eof())
+        if input[o] != tts_[0]:
+            return eerr(err_expect(input[o]))
+
+        for i in range(1, n):
+            if o + i >= end:
+                return cerr(err_eof())
+            if input[o + i] != tts_[i]:
+                return cerr(err_expect(input[o + i]))
+
+        pos_ = s._pos and next_pos(s._pos, tts)
+        s_ = State(input, pos_, s.user_state, o + n, s.ctx)
+        return cok(tts, s_, UNKNOWN_ERROR)
+
+    return Parsec(
+        _un_parser,
+        _first_of(tts_),
+        Tokens(show_tokens, next_pos, tts, True, _un_parser),
+    )
+
+
+def _test_tokens():
+    def string(s):
+        return tokens("".join, literal_next_pos(s), s)
+
+    assert parse(string("ab\ncd").then(get_position()), "", "ab\ncde") == (
+        SourcePos("", 2, 3)
+    )
+    assert parse(string("abc"), "", "abd") == ParseError(
+        SourcePos("", 1, 1), [Expect("abc"), SysUnExpect("d")]
+    )
+    assert parse(string("abc"), "", "ab") == ParseError(
+        SourcePos("", 1, 1), [Expect("abc"), SysUnExpect("")]
+    )
+    assert parse(string(["a", "b"]), "", "ab") == ["a", "b"]
+    assert parse(string(b"ab"), "", bytearray(b"abc")) == b"ab"
 
 
 # -- | Like 'tokens', but doesn't consume matching prefix.
@@ -717,64 +1844,59 @@ def tokens_(
     next_pos: Callable[[SourcePos, Iterable[_T]], SourcePos],
     tts: Iterable[_T],
 ) -> Parsec[Iterable[_T], _U, Iterable[_T]]:
-    # match tts:
-    match uncons(tts):
-        case Nothing():
-            return Parsec(lambda s, _0, _1, eok, _2: eok([], s, unknown_error(s)))
-        case Just((tok, toks)):
-
-            def _un_parser(
-                s: State[Iterable[_T], _U],
-                cok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
-                _cerr: Callable[[ParseError], Any],
-                _eok: Callable[
-                    [Iterable[_T], State[Iterable[_T], _U], ParseError], Any
-                ],
-                eerr: Callable[[ParseError], Any],
-            ) -> Any:
-                err_eof = set_error_message(
-                    Expect(show_tokens(tts)),
-                    new_error_message(SysUnExpect(""), s.pos),
-                )
-
-                def err_expect(x):
-                    return set_error_message(
-                        Expect(show_tokens(tts)),
-                        new_error_message(SysUnExpect(show_tokens([x])), s.pos),
-                    )
+    tts_ = as_stream(tts)
+    n = len(tts_)
+    literal = _literal_stream(tts_)
+
+    if n == 0:
+        return Parsec(lambda s, _0, _1, eok, _2: eok([], s, UNKNOWN_ERROR))
+
+    def _un_parser(
+        s: State[Iterable[_T], _U],
+        cok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
+        _cerr: Callable[[ParseError], Any],
+        _eok: Callable[[Iterable[_T], State[Iterable[_T], _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        def err_eof():
+            return ParseError.lazy(
+                s.error_pos(), lambda: [Expect(show_tokens(tts)), SysUnExpect("")]
+            )
+
+        def err_expect(x):
+            return ParseError.lazy(
+                s.error_pos(),
+                lambda: [Expect(show_tokens(tts)), SysUnExpect(show_tokens([x]))],
+            )
+
+        input = s.input
+        o = s.offset
+
+        if literal is not None and isinstance(input, literal):
+            if input.startswith(tts_, o):
+                pos_ = s._pos and next_pos(s._pos, tts)
+                size = n if type(input) is not MappedText else input.size(tts_)
+                s_ = State(input, pos_, s.user_state, o + size, s.ctx)
+                return cok(tts, s_, UNKNOWN_ERROR)
+
+        end = len(input)
+        if o + n > end and partial_input(s) and _prefix_at(input, o, tts_):
+            return suspend(_un_parser, s, cok, _cerr, _eok, eerr)
+        for i in range(n):
+            if o + i >= end:
+                return eerr(err_eof())
+            if input[o + i] != tts_[i]:
+                return eerr(err_expect(input[o + i]))
+
+        pos_ = s._pos and next_pos(s._pos, tts)
+        s_ = State(input, pos_, s.user_state, o + n, s.ctx)
+        return cok(tts, s_, UNKNOWN_ERROR)
 
-                def walk(ts: Iterable[_T], rs: Iterable[_T]) -> Any:
-                    match uncons(ts):
-                        case Nothing():
-                            return ok(rs)
-                        case Just((t, ts)):
-                            sr = uncons(rs)
-                            match sr:
-                                case Nothing():
-                                    return eerr(err_eof)
-                                case Just((x, xs)):
-                                    if t == x:
-                                        return walk(ts, xs)
-                                    else:
-                                        return eerr(err_expect(x))
-
-                def ok(rs: Iterable[_T]) -> Any:
-                    pos_ = next_pos(s.pos, tts)
-                    s_ = State(rs, pos_, s.user_state)
-                    return cok(tts, s_, new_error_unknown(pos_))
-
-                sr = uncons(s.input)
-
-                match sr:
-                    case Nothing():
-                        return eerr(err_eof)
-                    case Just((x, xs)):
-                        if tok == x:
-                            return walk(toks, xs)
-                        else:
-                            return eerr(err_expect(x))
-
-            return Parsec(_un_parser)
+    return Parsec(
+        _un_parser,
+        _first_of(tts_),
+        Tokens(show_tokens, next_pos, tts, False, _un_parser),
+    )
 
 
 # tokenPrim :: (Stream s m t)
@@ -841,22 +1963,37 @@ def token_prim_ex(
         _eok: Callable[[_A, State[Iterable[_T], _U], ParseError], Any],
         eerr: Callable[[ParseError], Any],
     ) -> Any:
-        r = uncons(s.input)
-        match r:
-            case Nothing():
-                return eerr(new_error_message(SysUnExpect(""), s.pos))
-            case Just((c, cs)):
-                match test(c):
-                    case Nothing():
-                        return eerr(
-                            new_error_message(SysUnExpect(show_token(c)), s.pos)
-                        )
-                    case Just(x):
-                        new_pos = next_pos(s.pos, c, cs)
-                        new_state = State(cs, new_pos, s.user_state)
-                        return cok(x, new_state, new_error_unknown(new_pos))
+        input = s.input
+        o = s.offset
+
+        if o >= len(input):
+            if partial_input(s):
+                return suspend(_un_parser, s, cok, _cerr, _eok, eerr)
+            return eerr(ParseError.lazy(s.error_pos(), lambda: [SysUnExpect("")]))
+
+        c = input[o]
+        # ! Truthiness instead of match, which goes through the slow Protocol
+        # ! isinstance check for every token
+        r = test(c)
+        if not r:
+            return eerr(
+                ParseError.lazy(s.error_pos(), lambda: [SysUnExpect(show_token(c))])
+            )
 
-    return Parsec(_un_parser)
+        cs = _Rest(input, o + 1)
+        new_pos = s._pos
+        if new_pos is not None:
+            new_pos = next_pos(new_pos, c, cs)
+        if next_state:
+            new_user = next_state.value(s.pos, c, cs, s.user_state)
+        else:
+            new_user = s.user_state
+        new_state = State(input, new_pos, new_user, o + 1, s.ctx)
+        return cok(r.value, new_state, UNKNOWN_ERROR)
+
+    return Parsec(
+        _un_parser, None, Token(show_token, next_pos, next_state, test, _un_parser)
+    )
 
 
 # token :: (Stream s Identity t)
@@ -887,7 +2024,7 @@ def token(
 def unknown_error(
     state: State[_S, _U],
 ) -> ParseError:
-    return new_error_unknown(state.pos)
+    return new_error_unknown(state.error_pos())
 
 
 # many :: ParsecT s u m a -> ParsecT s u m [a]
@@ -899,7 +2036,7 @@ def unknown_error(
 def many(
     p: Parsec[_S, _U, _A],
 ) -> Parsec[_S, _U, Iterable[_A]]:
-    return p.many()
+    return _many_loop(p, True, False)
 
 
 # many1 :: ParsecT s u m a -> ParsecT s u m [a]
@@ -910,10 +2047,7 @@ def many(
 def many1(
     p: Parsec[_S, _U, _A],
 ) -> Parsec[_S, _U, Iterable[_A]]:
-    # return Parsec.bind(
-    #     p, lambda x: Parsec.bind(many(p), lambda xs: Parsec.pure([x] + xs))
-    # )
-    return p.and_then(lambda x: p.many().fmap(lambda xs: append([x], xs)))
+    return _many_loop(p, True, True)
 
 
 # skipMany :: ParsecT s u m a -> ParsecT s u m ()
@@ -925,8 +2059,64 @@ def many1(
 def skip_many(
     p: Parsec[_S, _U, _A],
 ) -> Parsec[_S, _U, None]:
-    # return Parsec.bind(many_accum(lambda _0, _1: [], p), lambda _: Parsec.pure(None))
-    return many_accum(lambda _0, _1: [], p).then(Parsec.pure(None))
+    return _many_loop(p, False, False)
+
+
+# ! many, many1 and skip_many run p in a loop which appends to one list, so
+# ! neither a parser nor a Seq node is built per element.
+
+
+def _many_loop(
+    p: Parsec[_S, _U, _A],
+    collect: bool,
+    at_least_one: bool,
+) -> Parsec[_S, _U, Any]:
+    def _un_parser(
+        s: State[_S, _U],
+        cok: Callable[[Any, State[_S, _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[Any, State[_S, _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        xs: list[_A] | None = [] if collect else None
+        last = s
+
+        def walk(x: _A, s_: State[_S, _U], _err: ParseError) -> Any:
+            nonlocal last
+            if xs is not None:
+                xs.append(x)
+            last = s_
+            return Bounce(p.un_parser, s_, walk, cerr, _many_err, stop)
+
+        def stop(e: ParseError) -> Any:
+            return Bounce(cok, xs, last, e)
+
+        if at_least_one:
+            return p.un_parser(s, walk, cerr, _many_err, eerr)
+        return p.un_parser(s, walk, cerr, _many_err, lambda e: Bounce(eok, xs, s, e))
+
+    return Parsec(
+        _un_parser,
+        p.first if at_least_one else None,
+        Many(node_of(p), collect, at_least_one),
+    )
+
+
+def _test_many_loop():
+    any_token = token_prim(str, lambda pos, _c, _cs: pos, Just)
+    n = 10_000
+
+    xs = parse(many(any_token), "", "a" * n)
+    assert type(xs) is list and len(xs) == n
+    assert parse(many1(any_token), "", "") == ParseError(
+        SourcePos("", 1, 1), [SysUnExpect("")]
+    )
+    assert parse(many(any_token), "", "") == []
+    assert parse(skip_many(any_token), "", "a" * n) is None
+
+
+def _many_err(_0: Any, _1: Any, _2: Any) -> Any:
+    return many_err()
 
 
 # manyAccum :: (a -> [a] -> [a])
@@ -962,23 +2152,37 @@ def many_accum(
         ) -> Any:
             return p.un_parser(
                 s_,
-                lambda x_, s_, err: walk(acc(x, xs), x_, s_, err),
+                lambda x_, s_, err: Bounce(walk, acc(x, xs), x_, s_, err),
                 cerr,
                 lambda _0, _1, _2: many_err(),
-                lambda e: cok(acc(x, xs), s_, e),
+                lambda e: Bounce(cok, acc(x, xs), s_, e),
             )
 
         return p.un_parser(
             s,
-            lambda x, s_, err: walk([], x, s_, err),
+            lambda x, s_, err: Bounce(walk, [], x, s_, err),
             cerr,
             lambda _0, _1, _2: many_err(),
-            lambda e: eok([], s, e),
+            lambda e: Bounce(eok, [], s, e),
         )
 
     return Parsec(_un_parser)
 
 
+def _test_many_accum():
+    any_token = token_prim(str, lambda pos, _c, _cs: pos, Just)
+    n = 10 * sys.getrecursionlimit()
+
+    assert parse(skip_many(any_token), "", "a" * n) is None
+
+    def length() -> Parsec[Iterable[str], _U, int]:
+        return any_token.and_then(lambda _: length().fmap(lambda k: k + 1)).mplus(
+            Parsec.pure(0)
+        )
+
+    assert parse(length(), "", "a" * n) == n
+
+
 def many_err() -> Any:
     raise Exception(
         "combinator 'many' is applied to a parser that accepts an empty string."
@@ -1006,8 +2210,51 @@ def run_pt(
     u: _U,
     name: str,
     s: Iterable[_T],
+    *,
+    packrat: bool = False,
+    memo_window: int = 4096,
+    lazy_positions: bool = False,
+    profile: bool = False,
+    trace: bool = False,
+) -> Either[ParseError, _A] | tuple[Any, ...]:
+    """
+    With packrat, the reply of every try_ is memoized as by memo.
+    memo_window bounds how far behind the furthest offset replies are kept.
+    With lazy_positions, a str or MappedText input is parsed without position
+    bookkeeping and positions are recovered from offsets by the update_pos_char
+    rules. Custom next_pos functions are then ignored until a position is set
+    explicitly.
+    With profile, the runs of labeled parsers are profiled, and with trace,
+    the input rolled back by try_ is traced. The result is then returned with
+    the ProfileReport and the BacktrackReport asked for, in this order.
+    """
+    input = as_stream(s)
+    ctx = ParseContext(MemoTable(memo_window), packrat)
+    if profile:
+        ctx.profile = Profiler()
+    if trace:
+        ctx.trace = BacktrackTracer(input)
+    if lazy_positions and isinstance(input, (str, MappedText)):
+        ctx.lines = LineIndex(input, name)
+        state = State(input, None, u, 0, ctx)
+    else:
+        state = State(input, initial_pos(name), u, 0, ctx)
+
+    r = run_state(p, state)
+    if not (profile or trace):
+        return r
+    reports = [x.report() for x in (ctx.profile, ctx.trace) if x is not None]
+    return (r, *reports)
+
+
+def run_state(
+    p: Parsec[Iterable[_T], _U, _A],
+    state: State[Iterable[_T], _U],
 ) -> Either[ParseError, _A]:
-    res = run_parsec_t(p, State(s, initial_pos(name), u))
+    """
+    Runs p from state, as run_pt does from the initial state
+    """
+    res = run_parsec_t(p, state)
 
     def parser_reply(
         res: MbConsumed[Reply[Iterable[_T], _U, _A]],
@@ -1027,6 +2274,282 @@ def run_pt(
             return err
 
 
+def _test_run_pt_lazy_positions():
+    letter = token_prim(
+        str,
+        lambda pos, c, _: update_pos_char(pos, c),
+        lambda c: Just(c) if c != "!" else Nothing(),
+    )
+    input = "ab\n\tcd\n x!"
+    p = many(letter).then(get_position())
+    assert run_pt(p, None, "f", input, lazy_positions=True) == SourcePos("f", 3, 3)
+    assert run_pt(p, None, "f", input, lazy_positions=True) == run_pt(
+        p, None, "f", input
+    )
+
+    err = many(letter).then(letter)
+    assert run_pt(err, None, "f", input, lazy_positions=True) == run_pt(
+        err, None, "f", input
+    )
+
+    lit = tokens("".join, update_pos_string, "ab\n")
+    moved = set_position(SourcePos("g", 10, 1)).then(lit).then(get_position())
+    assert run_pt(moved, None, "f", input, lazy_positions=True) == SourcePos("g", 11, 1)
+
+
+def _test_run_pt_profile():
+    def string(s: str) -> Parsec[Iterable[str], _U, Iterable[str]]:
+        return tokens("".join, update_pos_string, s)
+
+    item = label("item", string("ab").mplus(string("c")))
+    items = label("items", many(item))
+    p = items.then(string("!"))
+    r, report = run_pt(p, None, "", "abcab!", profile=True)
+    assert r == run_pt(p, None, "", "abcab!") == "!"
+    item = report["item"]
+    assert (item.calls, item.ok, item.failed, item.consumed) == (4, 3, 1, 5)
+    assert report["items"].consumed == 5
+    assert report["items"].cumtime >= report["item"].cumtime
+    assert report["items"].tottime <= report["items"].cumtime
+
+    # Recursive labels count their cumulative time once
+    nested: Parsec = label("nested", string("(").and_then(lambda _: nested))
+    report = run_pt(nested, None, "", "((x", profile=True)[1]
+    assert (report["nested"].calls, report["nested"].primitive) == (3, 1)
+
+
+def _test_run_pt_trace():
+    def string(s: str) -> Parsec[Iterable[str], _U, Iterable[str]]:
+        return tokens("".join, update_pos_string, s)
+
+    a = string("a")
+    # Each of the n alternatives scans the rest of the input before failing
+    ending = [label(f"end{i}", many(a).then(string(f"{i}"))) for i in range(3)]
+    alternatives = try_(ending[0]).mplus(try_(ending[1])).mplus(ending[2])
+    p = label("line", string("\n").then(alternatives))
+    input = "\n" + "a" * 5 + "2"
+
+    r, report = run_pt(p, None, "", input, trace=True)
+    assert r == "2"
+    assert report.heatmap() == [0, 2, 2, 2, 2, 2, 2]
+    assert [site.labels for site in report.sites] == [("line",)]
+    assert (report.sites[0].rollbacks, report.sites[0].rolled_back) == (2, 12)
+    [region] = report.hot_regions()
+    assert (region.first_line, region.last_line, region.peak) == (2, 2, 2)
+
+    r, profiled, traced = run_pt(p, None, "", input, profile=True, trace=True)
+    assert profiled["line"].calls == 1 and traced.heatmap() == report.heatmap()
+    r, traced = run_pt(p, None, "", input, trace=True, packrat=True)
+    assert traced.heatmap() == report.heatmap()
+
+
+@dataclass(frozen=True, slots=True)
+class Done(Generic[_A]):
+    """
+    The result of an incremental parse, with the input it did not consume
+    """
+
+    value: _A
+    rest: Any
+
+
+class NeedMoreInput(Generic[_A]):
+    """
+    An incremental parse suspended at the end of the input fed so far.
+    Each suspension is fed exactly once. An empty chunk ends the input.
+    """
+
+    __slots__ = ("suspended", "_buffer", "_ctx")
+
+    def __init__(self, suspended: Suspend, buffer: Any, ctx: ParseContext):
+        self.suspended = suspended
+        self._buffer = buffer
+        self._ctx = ctx
+
+    def feed(self, chunk: Any) -> NeedMoreInput[_A] | Done[_A] | ParseError:
+        suspended = self.suspended
+        if suspended is None:
+            raise ValueError("feed on a suspension which has already been fed")
+        self.suspended = None
+
+        buffer = self._buffer
+        ctx = self._ctx
+        if len(chunk) == 0:
+            ctx.partial = False
+        else:
+            buffer = _refill(buffer, chunk, suspended, ctx)
+        return _drive(_resume(suspended, buffer), buffer, ctx)
+
+    def close(self) -> Done[_A] | ParseError:
+        return self.feed(self._buffer[:0])
+
+
+def _refill(buffer: Any, chunk: Any, suspended: Suspend, ctx: ParseContext) -> Any:
+    buffers = ctx.buffers
+    base, end = buffers[-1][1:]
+    states = [suspended.state, *ctx.holds.values()]
+    start = min(_base(ctx, s.input) + s.offset for s in states)
+    # One item before start is kept when there is one, so that the new
+    # buffer is a new object rather than chunk itself or a cached str
+    start = max(start - 1, base)
+    new = buffer[start - base :] + chunk
+    buffers[:] = [b for b in buffers if b[2] >= start]
+    buffers.append((new, start, end + len(chunk)))
+    if ctx.packrat and start > base:
+        # Memo entries are by offset, which moved
+        ctx.memo = MemoTable(ctx.memo.window)  # type: ignore
+    return new
+
+
+def _resume(r: Suspend, buffer: Any) -> Any:
+    return r.resume(buffer, offset_in(r.state, buffer) - r.state.offset)
+
+
+def _drive(r: Any, buffer: Any, ctx: ParseContext) -> Any:
+    r = _trampoline(r)
+    # A suspension holding another input was taken before the last chunk,
+    # by a parser resumed through a backtracking point
+    while type(r) is Suspend:
+        if ctx.partial and r.state.input is buffer:
+            return NeedMoreInput(r, buffer, ctx)
+        r = _trampoline(_resume(r, buffer))
+
+    match r:
+        case (a, s_):
+            return Done(a, buffer[offset_in(s_, buffer) :])
+        case err:
+            return err
+
+
+# ! Like run_pt, but over input which arrives in chunks. Parsers built from
+# ! closures and interpret and recognize results can be suspended, while
+# ! compile_parser results raise a ValueError, and so do regex and
+# ! regex_groups, which cannot tell a failed match from one cut short.
+
+
+def run_partial(
+    p: Parsec[Iterable[_T], _U, _A],
+    u: _U,
+    name: str,
+    s: Any = "",
+    *,
+    packrat: bool = False,
+    memo_window: int = 4096,
+) -> NeedMoreInput[_A] | Done[_A] | ParseError:
+    """
+    Starts p on s, a str or bytes prefix of the input. Feed the rest with
+    NeedMoreInput.feed, which returns the next suspension or the outcome.
+    """
+    buffer = as_stream(s)
+    ctx = ParseContext(MemoTable(memo_window), packrat, partial=True)
+    ctx.buffers.append((buffer, 0, len(buffer)))
+    state = State(buffer, initial_pos(name), u, 0, ctx)
+
+    def ok(a, s_, _err):
+        return (a, s_)
+
+    def error(err):
+        return err
+
+    return _drive(p.un_parser(state, ok, error, ok, error), buffer, ctx)
+
+
+def feed(
+    r: NeedMoreInput[_A] | Done[_A] | ParseError, chunk: Any
+) -> NeedMoreInput[_A] | Done[_A] | ParseError:
+    """
+    Feeds chunk to a suspended parse. A finished parse keeps chunk as rest.
+    """
+    match r:
+        case NeedMoreInput():
+            return r.feed(chunk)
+        case Done(a, rest):
+            return Done(a, rest + chunk)
+        case err:
+            return err
+
+
+def _test_run_partial():
+    from entoli.parsec.char import char, digit, spaces, string, take_while
+
+    number = take_while(str.isdigit)
+    p = many(number.skip(char(","))).then(string("end"))
+
+    r = run_partial(p, None, "f", "12,3")
+    assert isinstance(r, NeedMoreInput)
+    r = feed(r, "4,5")
+    assert isinstance(r, NeedMoreInput)
+    r = feed(feed(r, ",e"), "nd!")
+    assert r == Done("end", "!")
+    assert feed(r, "?") == Done("end", "!?")
+
+    r = feed(run_partial(many(digit), None, "f", "12"), "3")
+    assert isinstance(r, NeedMoreInput)
+    assert feed(r, "") == Done(["1", "2", "3"], "")
+    assert run_partial(many(digit), None, "f", "12").close() == Done(["1", "2"], "")
+
+    r = feed(run_partial(spaces.then(string("ab")), None, "f", " \n"), "ax")
+    assert r == ParseError(
+        SourcePos("f", 2, 1), [Expect("ab"), SysUnExpect("x")]
+    )
+    alt = try_(string("abc")).mplus(string("ab"))
+    r = feed(feed(run_partial(alt, None, "f", "a"), "b"), "d")
+    assert r == Done("ab", "d")
+
+    r = run_partial(p, None, "f", "1,")
+    r.feed("2,")
+    try:
+        r.feed("end")
+        assert False
+    except ValueError:
+        pass
+
+    # Consumed input is dropped, except from the start of a running try_
+    r = run_partial(many(number.skip(char(","))), None, "f")
+    for _ in range(1000):
+        r = feed(r, "12,345,")
+    assert len(r._buffer) < 16
+    assert r.close() == Done(["12", "345"] * 1000, "")
+
+    ints = many(many1(digit).skip(char(";")))
+    line = try_(ints.then(string("end"))).mplus(ints.then(string("stop")))
+    r = run_partial(many(line), None, "f", "1;")
+    for chunk in ["2;3", "4;", "5;6", ";st", "op", "12;e", "nd"]:
+        r = feed(r, chunk)
+    assert r._buffer == "p12;end"
+    assert r.close() == Done(["stop", "end"], "")
+
+
+def _test_run_partial_backtracking():
+    from entoli.parsec.char import any_char, char, letter, satisfy, string
+    from entoli.parsec.combinator import choice, eof, many_till, sep_by
+    from entoli.parsec.interp import interpret
+
+    sat_a = satisfy(lambda c: c == "a")
+    pair = lift_a2(lambda x, y: (x, y), sat_a, sat_a)
+    grammars = [
+        try_(string("aab")).mplus(string("aa")),
+        try_(string("aab")).mplus(pair).mplus(Parsec.pure("p")),
+        many_till(any_char, try_(string("ab"))),
+        choice([try_(string("let")), try_(string("lex")), many1(letter)]),
+        many(try_(char("a").then(char("b"))).mplus(char("a").then(char("c")))),
+        sep_by(try_(string("ab")).mplus(string("a")), char(",")).skip(eof),
+    ]
+    inputs = ["", "a", "aa", "aab", "aac", "ab", "abab", "let", "lexeme", "ab,a,ac"]
+    for p, q in [(p, q) for p in grammars for q in [p, interpret(p)]]:
+        for input in inputs:
+            expected = parse(p, "f", input)
+            for size in [1, 2, 3]:
+                r = run_partial(q, None, "f", "")
+                for i in range(0, len(input), size):
+                    r = feed(r, input[i : i + size])
+                r = feed(r, "")
+                if isinstance(expected, ParseError):
+                    assert r == expected
+                else:
+                    assert isinstance(r, Done) and r.value == expected
+
+
 # runP :: (Stream s Identity t)
 #      => Parsec s u a -> u -> SourceName -> s -> Either ParseError a
 # runP p u name s = runIdentity $ runPT p u name s
@@ -1089,6 +2612,104 @@ def parse(
     return run_p(p, None, name, s)
 
 
+def parse_file(
+    p: Parsec[Any, _U, _A],
+    path: str | os.PathLike,
+    u: _U = None,
+    *,
+    text: bool = True,
+    packrat: bool = False,
+    memo_window: int = 4096,
+    lazy_positions: bool = False,
+    encoding: str = "utf-8",
+) -> Either[ParseError, _A]:
+    """
+    Parses the file at path in place through a read-only mmap, with path as the
+    source name. With text the input is a MappedText decoded with encoding,
+    otherwise the mmap itself.
+    """
+    name = os.fspath(path)
+    with open(name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            buffer: Any = b""
+        else:
+            buffer = mmap(f.fileno(), 0, access=ACCESS_READ)
+
+    try:
+        r = run_pt(
+            p,
+            u,
+            name,
+            MappedText(buffer, encoding) if text else buffer,
+            packrat=packrat,
+            memo_window=memo_window,
+            lazy_positions=lazy_positions,
+        )
+        if isinstance(r, ParseError):
+            # A lazy error reads the map, which is closed below
+            r = ParseError(r.source_pos, list(r.message))
+        return r
+    finally:
+        if isinstance(buffer, mmap):
+            try:
+                buffer.close()
+            except BufferError:
+                # Views into the map escaped through the result, and keep it open
+                pass
+
+
+def _test_parse_file(tmp_path):
+    from entoli.parsec.char import (
+        char,
+        digit,
+        regex,
+        regex_groups,
+        satisfy,
+        spaces,
+        string,
+    )
+
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"GET /a 200\nPUT /b\t404\n")
+    line = lift_a2(
+        lambda method, rest: (method, rest),
+        string("GET").mplus(string("PUT")),
+        spaces.then(regex(r"/\w+")).skip(spaces).skip(many1(digit)).skip(spaces),
+    )
+    assert parse_file(many(line), path) == [("GET", "/a"), ("PUT", "/b")]
+    assert parse_file(many(line), path, lazy_positions=True) == [
+        ("GET", "/a"),
+        ("PUT", "/b"),
+    ]
+
+    err = many(line).then(char("x"))
+    expected = parse(err, str(path), path.read_text())
+    assert expected.source_pos == SourcePos(str(path), 3, 1)
+    assert parse_file(err, path) == expected
+    assert parse_file(err, path, lazy_positions=True) == expected
+    assert parse_file(many(satisfy(str.isalpha)), path) == ["G", "E", "T"]
+    assert parse_file(regex_groups(r"(\w+) (x)?/"), path) == ("GET", None)
+
+    assert parse_file(tokens(bytes, update_pos_string, b"GET"), path, text=False) == (
+        b"GET"
+    )
+    (tmp_path / "empty").write_bytes(b"")
+    assert parse_file(many(digit), tmp_path / "empty") == []
+
+    path = tmp_path / "conf.txt"
+    path.write_text("name=José\ncity=Zürich", encoding="utf-8")
+    pair = regex_groups(r"(\w+)=([^\n]*)\n?")
+    assert parse_file(many(pair), path) == [("name", "José"), ("city", "Zürich")]
+    assert parse_file(regex(r"\w+=José"), path) == "name=José"
+    err = many(pair).then(char("x"))
+    expected = parse(err, str(path), path.read_text(encoding="utf-8"))
+    assert expected.source_pos == SourcePos(str(path), 2, 12)
+    assert parse_file(err, path) == expected
+    assert parse_file(err, path, lazy_positions=True) == expected
+    path.write_text("name=José", encoding="latin-1")
+    assert parse_file(pair, path, encoding="latin-1") == ("name", "José")
+
+
 # parseTest :: (Stream s Identity t, Show a)
 #           => Parsec s () a -> s -> IO ()
 # parseTest p input
@@ -1132,7 +2753,9 @@ def get_position() -> Parsec[Iterable[_T], _U, SourcePos]:
 
 def get_input() -> Parsec[Iterable[_T], _U, Iterable[_T]]:
     # return Parser.pure(lambda s: s.state_input)
-    return get_parser_state().and_then(lambda s: Parsec.pure(s.input))
+    return get_parser_state().and_then(
+        lambda s: Parsec.pure(s.input[s.offset :] if s.offset else s.input)
+    )
 
 
 # -- | @setPosition pos@ sets the current source position to @pos@.
@@ -1144,9 +2767,9 @@ def get_input() -> Parsec[Iterable[_T], _U, Iterable[_T]]:
 
 
 def set_position(pos: SourcePos) -> Parsec[Iterable[_T], _U, None]:
-    return update_parser_state(lambda s: State(s.input, pos, s.user_state)).then(
-        Parsec.pure(None)
-    )
+    return update_parser_state(
+        lambda s: State(s.input, pos, s.user_state, s.offset, s.ctx)
+    ).then(Parsec.pure(None))
 
 
 # -- | @setInput input@ continues parsing with @input@. The 'getInput' and
@@ -1160,9 +2783,10 @@ def set_position(pos: SourcePos) -> Parsec[Iterable[_T], _U, None]:
 
 
 def set_input(input: Iterable[_T]) -> Parsec[Iterable[_T], _U, None]:
-    return update_parser_state(lambda s: State(input, s.pos, s.user_state)).then(
-        Parsec.pure(None)
-    )
+    p = update_parser_state(
+        lambda s: State(as_stream(input), s.pos, s.user_state, 0, s.ctx)
+    ).then(Parsec.pure(None))
+    return Parsec(p.un_parser, None, InputLeaf(p))
 
 
 # -- | Returns the full parser state as a 'State' record.
@@ -1209,7 +2833,7 @@ def update_parser_state(
         _2: Any,
     ) -> Any:
         s_ = f(s)
-        return eok(s_, s_, unknown_error(s))
+        return eok(s_, s_, UNKNOWN_ERROR)
 
     return Parsec(_un_parser)
 
@@ -1236,9 +2860,9 @@ def get_state() -> Parsec[Iterable[_T], _U, _U]:
 def put_state(
     u: _U,
 ) -> Parsec[Iterable[_T], _U, None]:
-    return update_parser_state(lambda s: State(s.input, s.pos, u)).then(
-        Parsec.pure(None)
-    )
+    return update_parser_state(
+        lambda s: State(s.input, s.pos, u, s.offset, s.ctx)
+    ).then(Parsec.pure(None))
 
 
 # -- | @modifyState f@ applies function @f@ to the user state. Suppose
@@ -1259,7 +2883,7 @@ def modify_state(
     f: Callable[[_U], _U],
 ) -> Parsec[Iterable[_T], _U, None]:
     def _f(s: State[Iterable[_T], _U]) -> State[Iterable[_T], _U]:
-        return State(s.input, s.pos, f(s.user_state))
+        return State(s.input, s.pos, f(s.user_state), s.offset, s.ctx)
 
     return update_parser_state(_f).then(Parsec.pure(None))
 
@@ -1335,6 +2959,221 @@ def try_(p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
         eok: Callable[[_A, State[_S, _U], ParseError], Any],
         eerr: Callable[[ParseError], Any],
     ) -> Any:
-        return p.un_parser(s, cok, eerr, eok, eerr)
+        ctx = s.ctx
+        if ctx is None:
+            return p.un_parser(s, cok, eerr, eok, eerr)
+        q = p if ctx.trace is None else _traced(ctx.trace, p)
+        if ctx.partial:
+            q = _held(q)
+        if ctx.packrat:
+            return _memoized(_un_parser, q, s, cok, eerr, eok, eerr)
+        return q.un_parser(s, cok, eerr, eok, eerr)
+
+    return Parsec(_un_parser, p.first, Try(node_of(p)))
+
+
+def _held(p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
+    # Keeps the input from s while p runs, since try_ may roll back to it
+    def _un_parser(s, cok, cerr, eok, eerr):
+        key = hold(s)
+
+        def released(k):
+            def _k(*args):
+                release(s, key)
+                return Bounce(k, *args)
+
+            return _k
+
+        return p.un_parser(
+            s, released(cok), released(cerr), released(eok), released(eerr)
+        )
+
+    return Parsec(_un_parser)
+
+
+def _traced(trace: BacktrackTracer, p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
+    # Reports the consumed failures of p, which try_ is about to roll back.
+    # Under packrat it runs inside the memo, so replays are not reported.
+    def _un_parser(s, cok, cerr, eok, eerr):
+        def tcerr(err):
+            trace.rollback(s.offset, s.pos, err.source_pos)
+            return Bounce(cerr, err)
+
+        return p.un_parser(s, cok, tcerr, eok, eerr)
+
+    return Parsec(_un_parser)
+
+
+def _test_try_():
+    def string(s: str) -> Parsec[Iterable[str], _U, Iterable[str]]:
+        return tokens("".join, update_pos_string, s)
+
+    assert parse(try_(string("ab")).mplus(string("ac")), "", "ac") == "ac"
+    assert parse(string("ab").mplus(string("ac")), "", "ac") == ParseError(
+        SourcePos("", 1, 1), [Expect("ab"), SysUnExpect("c")]
+    )
+    assert parse(string("ab").then(get_input()), "", "abcd") == "cd"
+
+    bs = tokens(bytes, lambda pos, _: pos, b"ab").then(get_input())
+    assert parse(bs, "", b"abcd") == b"cd"
+
+
+# ! Packrat memoization. A reply is keyed by the memoized parser, the input
+# ! offset and the user state, compared by identity. User states are never
+# ! mutated in place, so a new object is a new version. Parsers are pure
+# ! functions of the state, so replaying a stored reply is the same as
+# ! running the parser again.
+
+_MEMO_COK = 0
+_MEMO_CERR = 1
+_MEMO_EOK = 2
+_MEMO_EERR = 3
+
+
+class MemoTable:
+    """
+    Replies of memoized parsers for one run.
+    Entries more than window offsets behind the furthest offset seen are
+    evicted, so memory stays bounded however long the input is.
+    """
+
+    __slots__ = ("window", "entries", "low", "high")
+
+    def __init__(self, window: int = 4096):
+        self.window = window
+        self.entries: dict[int, dict[Any, tuple]] = {}
+        self.low = 0
+        self.high = 0
+
+    def get(self, key: Any, s: State[_S, _U]) -> tuple[int, tuple] | None:
+        at = self.entries.get(s.offset)
+        if at is None:
+            return None
+        entry = at.get(key)
+        if entry is None:
+            return None
+        input, pos, user_state, kind, args = entry
+        if input is s.input and user_state is s.user_state and pos == s._pos:
+            return kind, args
+        return None
+
+    def put(self, key: Any, s: State[_S, _U], kind: int, args: tuple) -> None:
+        o = s.offset
+        if o > self.high:
+            self.high = o
+            low = o - self.window
+            if low > self.low:
+                entries = self.entries
+                if len(entries) < low - self.low:
+                    for o_ in [o_ for o_ in entries if o_ < low]:
+                        del entries[o_]
+                else:
+                    for o_ in range(self.low, low):
+                        entries.pop(o_, None)
+                self.low = low
+        if o < self.low:
+            return
+        at = self.entries.get(o)
+        if at is None:
+            at = self.entries[o] = {}
+        at[key] = (s.input, s._pos, s.user_state, kind, args)
+
+    def __len__(self) -> int:
+        return sum(len(at) for at in self.entries.values())
+
+
+def _test_memo_table():
+    table = MemoTable(window=2)
+    for o in range(5):
+        table.put("p", State("abcde", initial_pos(""), None, o), _MEMO_EOK, (o,))
+
+    assert len(table) == 3
+    assert table.get("p", State("abcde", initial_pos(""), None, 1)) is None
+    assert table.get("p", State("abcde", initial_pos(""), None, 4)) == (
+        _MEMO_EOK,
+        (4,),
+    )
+    assert table.get("p", State("abcde", initial_pos(""), 0, 4)) is None
+    assert table.get("q", State("abcde", initial_pos(""), None, 4)) is None
+
+
+def _memoized(
+    key: Any,
+    p: Parsec[_S, _U, _A],
+    s: State[_S, _U],
+    cok: Callable[[_A, State[_S, _U], ParseError], Any],
+    cerr: Callable[[ParseError], Any],
+    eok: Callable[[_A, State[_S, _U], ParseError], Any],
+    eerr: Callable[[ParseError], Any],
+) -> Any:
+    table = s.ctx.memo  # type: ignore
+    hit = table.get(key, s)
+    if hit is not None:
+        kind, args = hit
+        return Bounce((cok, cerr, eok, eerr)[kind], *args)
+
+    def record(kind: int, k: Callable[..., Any]) -> Callable[..., Any]:
+        def _k(*args: Any) -> Any:
+            table.put(key, s, kind, args)
+            return Bounce(k, *args)
+
+        return _k
+
+    return p.un_parser(
+        s,
+        record(_MEMO_COK, cok),
+        record(_MEMO_CERR, cerr),
+        record(_MEMO_EOK, eok),
+        record(_MEMO_EERR, eerr),
+    )
+
+
+def memo(p: Parsec[_S, _U, _A]) -> Parsec[_S, _U, _A]:
+    """
+    Parser which behaves like p, but runs it at most once per input offset
+    and user state within a run. Later attempts replay the stored reply.
+    """
+
+    def _un_parser(
+        s: State[_S, _U],
+        cok: Callable[[_A, State[_S, _U], ParseError], Any],
+        cerr: Callable[[ParseError], Any],
+        eok: Callable[[_A, State[_S, _U], ParseError], Any],
+        eerr: Callable[[ParseError], Any],
+    ) -> Any:
+        if s.ctx is None or s.ctx.memo is None:
+            return p.un_parser(s, cok, cerr, eok, eerr)
+        return _memoized(_un_parser, p, s, cok, cerr, eok, eerr)
 
     return Parsec(_un_parser)
+
+
+def _test_memo():
+    calls = []
+
+    def char(x: str) -> Parsec[Iterable[str], _U, str]:
+        def test(c: str) -> Maybe[str]:
+            calls.append(c)
+            return Just(c) if c == x else Nothing()
+
+        return token_prim(str, lambda pos, _c, _cs: pos, test)
+
+    a, b, c = char("a"), char("b"), char("c")
+
+    ma = memo(a.then(a))
+    p = try_(ma.then(b)).mplus(ma.then(c))
+
+    assert parse(p, "", "aac") == "c"
+    assert calls == ["a", "a", "c", "c"]
+
+    calls.clear()
+    q = try_(a.then(a).then(b)).mplus(a.then(a).then(c))
+    assert run_pt(q, None, "", "aac", packrat=True) == "c"
+    assert calls == ["a", "a", "c", "a", "a", "c"]
+
+    calls.clear()
+    aa = try_(a.then(a))
+    q = try_(aa.then(b)).mplus(aa.then(c))
+    assert run_pt(q, None, "", "aac", packrat=True) == "c"
+    assert calls == ["a", "a", "c", "c"]
+    assert run_pt(q, None, "", "aad", packrat=True) == parse(q, "", "aad")
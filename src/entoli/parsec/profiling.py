@@ -0,0 +1,475 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+import marshal
+import os
+import sys
+from time import perf_counter
+from typing import Any, Callable, Sequence, TextIO
+
+# ! Profiling of labeled parsers. A label enters a frame when it starts and
+# ! exits it when its parser calls one of its continuations, so the frames of
+# ! one run nest like calls. Self time is the time of a frame minus the time
+# ! of the frames entered below it. Cumulative time is only counted by the
+# ! outermost active frame of a label, so recursive rules are not counted
+# ! twice. Nothing here runs unless run_pt is asked to profile.
+
+
+@dataclass(slots=True)
+class LabelStats:
+    """
+    The totals of one label. primitive counts the calls which were not nested
+    in a call of the same label, as in pstats.
+    """
+
+    name: str
+    calls: int = 0
+    primitive: int = 0
+    ok: int = 0
+    failed: int = 0
+    consumed: int = 0
+    tottime: float = 0.0
+    cumtime: float = 0.0
+    callers: dict[str | None, list[Any]] = field(default_factory=dict)
+
+
+class Profiler:
+    """
+    Collects the frames of the labels of one run
+    """
+
+    __slots__ = ("clock", "stack", "active", "entries")
+
+    def __init__(self, clock: Callable[[], float] = perf_counter):
+        self.clock = clock
+        # Frames are [name, caller, start, time of nested frames]
+        self.stack: list[list[Any]] = []
+        self.active: dict[str, int] = {}
+        self.entries: dict[str, LabelStats] = {}
+
+    def enter(self, name: str) -> list[Any]:
+        stack = self.stack
+        caller = stack[-1][0] if stack else None
+        self.active[name] = self.active.get(name, 0) + 1
+        frame = [name, caller, 0.0, 0.0]
+        stack.append(frame)
+        frame[2] = self.clock()
+        return frame
+
+    def exit(self, frame: list[Any], ok: bool, consumed: int) -> None:
+        now = self.clock()
+        stack = self.stack
+        # A frame left open by an abandoned parse is closed with its parent
+        while stack and stack.pop() is not frame:
+            pass
+        name, caller, start, nested = frame
+        elapsed = now - start
+        if stack:
+            stack[-1][3] += elapsed
+
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = LabelStats(name)
+        active = self.active[name] - 1
+        self.active[name] = active
+
+        entry.calls += 1
+        if ok:
+            entry.ok += 1
+            entry.consumed += consumed
+        else:
+            entry.failed += 1
+        entry.tottime += elapsed - nested
+        edge = entry.callers.get(caller)
+        if edge is None:
+            edge = entry.callers[caller] = [0, 0, 0.0, 0.0]
+        edge[1] += 1
+        edge[2] += elapsed - nested
+        if not active:
+            entry.primitive += 1
+            entry.cumtime += elapsed
+            edge[0] += 1
+            edge[3] += elapsed
+
+    def report(self) -> "ProfileReport":
+        return ProfileReport(list(self.entries.values()))
+
+
+_SORT_KEYS: dict[str, Callable[[LabelStats], Any]] = {
+    "calls": lambda e: e.calls,
+    "ok": lambda e: e.ok,
+    "failed": lambda e: e.failed,
+    "consumed": lambda e: e.consumed,
+    "tottime": lambda e: e.tottime,
+    "cumtime": lambda e: e.cumtime,
+    "name": lambda e: e.name,
+}
+
+
+def _key(name: str) -> tuple[str, int, str]:
+    return ("<parsec>", 0, name)
+
+
+class ProfileReport:
+    """
+    The per label statistics of a profiled run.
+    pstats.Stats(report) loads it, as would a cProfile.Profile.
+    """
+
+    __slots__ = ("entries", "stats")
+
+    def __init__(self, entries: list[LabelStats]):
+        self.entries = {e.name: e for e in entries}
+        self.stats: dict[tuple[str, int, str], tuple] = {}
+
+    def __getitem__(self, name: str) -> LabelStats:
+        return self.entries[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in self.entries
+
+    def sorted(self, sort: str = "tottime") -> list[LabelStats]:
+        """
+        The entries, greatest first by sort, one of the fields of LabelStats
+        """
+        reverse = sort != "name"
+        return sorted(self.entries.values(), key=_SORT_KEYS[sort], reverse=reverse)
+
+    def print_stats(
+        self,
+        sort: str = "tottime",
+        limit: int | None = None,
+        file: TextIO | None = None,
+    ) -> None:
+        out = file if file is not None else sys.stdout
+        header = ("calls", "ok", "failed", "consumed", "tottime", "cumtime")
+        print("".join(f"{h:>10}" for h in header) + "  label", file=out)
+        for e in self.sorted(sort)[:limit]:
+            calls = str(e.calls)
+            if e.primitive != e.calls:
+                calls = f"{e.calls}/{e.primitive}"
+            print(
+                f"{calls:>10}{e.ok:>10}{e.failed:>10}{e.consumed:>10}"
+                f"{e.tottime:>10.4f}{e.cumtime:>10.4f}  {e.name}",
+                file=out,
+            )
+
+    def create_stats(self) -> None:
+        """
+        Fills stats in the format of pstats, with labels as functions
+        """
+        stats = {}
+        for e in self.entries.values():
+            callers = {
+                _key(caller): tuple(edge)
+                for caller, edge in e.callers.items()
+                if caller is not None
+            }
+            stats[_key(e.name)] = (
+                e.primitive,
+                e.calls,
+                e.tottime,
+                e.cumtime,
+                callers,
+            )
+        self.stats = stats
+
+    def dump_stats(self, path: str | os.PathLike) -> None:
+        """
+        Writes the stats in the marshal format of cProfile, for pstats and
+        snakeviz-like viewers
+        """
+        self.create_stats()
+        with open(path, "wb") as f:
+            marshal.dump(self.stats, f)
+
+
+def _test_profiler():
+    ticks = iter(range(100))
+    profiler = Profiler(lambda: float(next(ticks)))
+
+    # expr (0..7) > term (1..4) > term (2..3), then term (5..6) fails
+    expr = profiler.enter("expr")
+    outer = profiler.enter("term")
+    inner = profiler.enter("term")
+    profiler.exit(inner, True, 1)
+    profiler.exit(outer, True, 3)
+    term = profiler.enter("term")
+    profiler.exit(term, False, 0)
+    profiler.exit(expr, True, 3)
+
+    report = profiler.report()
+    e = report["expr"]
+    assert (e.calls, e.ok, e.consumed, e.tottime, e.cumtime) == (1, 1, 3, 3.0, 7.0)
+    t = report["term"]
+    assert (t.calls, t.primitive, t.ok, t.failed, t.consumed) == (3, 2, 2, 1, 4)
+    assert (t.tottime, t.cumtime) == (4.0, 4.0)
+    assert [e.name for e in report.sorted("calls")] == ["term", "expr"]
+
+    report.create_stats()
+    assert report.stats[_key("term")] == (
+        2,
+        3,
+        4.0,
+        4.0,
+        {_key("expr"): (2, 2, 3.0, 4.0), _key("term"): (0, 1, 1.0, 0.0)},
+    )
+    assert report.stats[_key("expr")][4] == {}
+
+
+def _test_profile_report_pstats(tmp_path):
+    import io
+    import pstats
+
+    ticks = iter(range(100))
+    profiler = Profiler(lambda: float(next(ticks)))
+    a = profiler.enter("a")
+    profiler.exit(profiler.enter("b"), True, 2)
+    profiler.exit(a, False, 0)
+    report = profiler.report()
+
+    out = io.StringIO()
+    report.print_stats(file=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].split() == [
+        "calls",
+        "ok",
+        "failed",
+        "consumed",
+        "tottime",
+        "cumtime",
+        "label",
+    ]
+    assert lines[1].split() == ["1", "0", "1", "0", "2.0000", "3.0000", "a"]
+
+    stats = pstats.Stats(report, stream=io.StringIO())
+    assert stats.total_calls == 2
+    report.dump_stats(tmp_path / "parse.prof")
+    loaded = pstats.Stats(str(tmp_path / "parse.prof"), stream=io.StringIO())
+    assert loaded.stats == report.stats
+
+
+# ! Backtracking analytics. A try_ which fails after consuming input rolls
+# ! back to its start, so every offset from there up to the failure will be
+# ! parsed again. Each rollback adds one to the re-parse count of those
+# ! offsets, kept as a difference map so that recording the counts costs
+# ! O(1) however long the rollback is. The failure offset is recovered from
+# ! the position of the error by walking the text from the try_ start with
+# ! the update_pos_char rules, which is O(n) in the input rolled back, the
+# ! input the try_ has already consumed. For binary input it comes from the
+# ! column. Rollbacks are attributed to the labels active at the try_, so a
+# ! grammar is best traced with its rules labeled.
+
+
+@dataclass(slots=True)
+class SiteStats:
+    """
+    The rollbacks of the try_ sites under one path of labels
+    """
+
+    labels: tuple[str, ...]
+    rollbacks: int = 0
+    rolled_back: int = 0
+    widest: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class HotRegion:
+    """
+    A run of re-parsed offsets [start, end), on lines first_line to last_line
+    """
+
+    start: int
+    end: int
+    first_line: int
+    last_line: int
+    peak: int
+    total: int
+
+
+class BacktrackTracer:
+    """
+    Collects the rollbacks of the try_ sites of one run over input
+    """
+
+    __slots__ = ("input", "labels", "diff", "sites")
+
+    def __init__(self, input: Sequence[Any]):
+        self.input = input
+        self.labels: list[str] = []
+        self.diff: dict[int, int] = {}
+        self.sites: dict[tuple[str, ...], SiteStats] = {}
+
+    def enter(self, name: str) -> int:
+        self.labels.append(name)
+        return len(self.labels) - 1
+
+    def exit(self, frame: int, ok: bool, consumed: int) -> None:
+        del self.labels[frame:]
+
+    def rollback(self, offset: int, pos: Any, failed_at: Any) -> None:
+        """
+        Records a try_ started at offset and pos, which failed at failed_at
+        after consuming input
+        """
+        end = max(self._offset_at(offset, pos, failed_at), offset) + 1
+        end = min(end, len(self.input))
+        if end > offset:
+            diff = self.diff
+            diff[offset] = diff.get(offset, 0) + 1
+            diff[end] = diff.get(end, 0) - 1
+
+        path = tuple(self.labels)
+        site = self.sites.get(path)
+        if site is None:
+            site = self.sites[path] = SiteStats(path)
+        site.rollbacks += 1
+        site.rolled_back += max(end - offset, 0)
+        site.widest = max(site.widest, end - offset)
+
+    def _offset_at(self, offset: int, pos: Any, target: Any) -> int:
+        # Walks from offset at pos to target, O(n) in the text in between
+        input = self.input
+        n = len(input)
+        if not (offset < n and isinstance(input[offset], str)):
+            if target.line != pos.line:
+                return offset
+            return offset + max(target.col - pos.col, 0)
+
+        line, col = pos.line, pos.col
+        i = offset
+        goal = (target.line, target.col)
+        while i < n and (line, col) < goal:
+            c = input[i]
+            if c == "\n":
+                line += 1
+                col = 1
+            elif c == "\t":
+                col += 8 - (col - 1) % 8
+            else:
+                col += 1
+            i += 1
+        return i
+
+    def report(self) -> "BacktrackReport":
+        return BacktrackReport(self.input, self.diff, list(self.sites.values()))
+
+
+class BacktrackReport:
+    """
+    The re-parse counts of the offsets of a traced run, and its try_ sites
+    """
+
+    __slots__ = ("input", "segments", "sites", "_newlines")
+
+    def __init__(
+        self,
+        input: Sequence[Any],
+        diff: dict[int, int],
+        sites: list[SiteStats],
+    ):
+        self.input = input
+        # Runs of offsets [start, end) re-parsed count times, in order
+        self.segments: list[tuple[int, int, int]] = []
+        count = 0
+        offsets = sorted(diff)
+        for start, end in zip(offsets, offsets[1:]):
+            count += diff[start]
+            if count:
+                self.segments.append((start, end, count))
+        self.sites = sorted(sites, key=lambda s: s.rolled_back, reverse=True)
+        self._newlines: list[int] | None = None
+
+    def heatmap(self) -> list[int]:
+        """
+        The number of times each offset of the input was parsed again
+        """
+        heat = [0] * len(self.input)
+        for start, end, count in self.segments:
+            heat[start:end] = [count] * (end - start)
+        return heat
+
+    def line_of(self, offset: int) -> int:
+        newlines = self._newlines
+        if newlines is None:
+            input = self.input
+            if len(input) and isinstance(input[0], str):
+                newlines = [i for i, c in enumerate(input) if c == "\n"]
+            else:
+                newlines = []
+            self._newlines = newlines
+        return bisect_right(newlines, offset - 1) + 1
+
+    def hot_regions(self, limit: int | None = None) -> list[HotRegion]:
+        """
+        Contiguous re-parsed spans, the most re-parsed first
+        """
+        regions = []
+        i = 0
+        segments = self.segments
+        while i < len(segments):
+            start, end, peak = segments[i]
+            total = (end - start) * peak
+            i += 1
+            while i < len(segments) and segments[i][0] == end:
+                _, end, count = segments[i]
+                total += (end - segments[i][0]) * count
+                peak = max(peak, count)
+                i += 1
+            first, last = self.line_of(start), self.line_of(end - 1)
+            regions.append(HotRegion(start, end, first, last, peak, total))
+        regions.sort(key=lambda r: (r.peak, r.total), reverse=True)
+        return regions[:limit]
+
+    def print_summary(self, limit: int = 10, file: TextIO | None = None) -> None:
+        out = file if file is not None else sys.stdout
+        print(f"{'peak':>10}{'total':>10}  lines", file=out)
+        for r in self.hot_regions(limit):
+            lines = str(r.first_line)
+            if r.last_line != r.first_line:
+                lines = f"{r.first_line}-{r.last_line}"
+            print(f"{r.peak:>10}{r.total:>10}  {lines}", file=out)
+        print(file=out)
+        print(f"{'rollbacks':>10}{'offsets':>10}{'widest':>10}  labels", file=out)
+        for site in self.sites[:limit]:
+            labels = " > ".join(site.labels) or "<no label>"
+            print(
+                f"{site.rollbacks:>10}{site.rolled_back:>10}{site.widest:>10}"
+                f"  {labels}",
+                file=out,
+            )
+
+
+def _test_backtrack_tracer():
+    from collections import namedtuple
+
+    Pos = namedtuple("Pos", "line col")
+    input = "ab\ncd\tx\nef"
+    tracer = BacktrackTracer(input)
+
+    frame = tracer.enter("rule")
+    # From offset 0, failing at "x", on line 2 after the tab
+    tracer.rollback(0, Pos(1, 1), Pos(2, 9))
+    tracer.enter("inner")
+    tracer.rollback(3, Pos(2, 1), Pos(2, 2))
+    tracer.exit(frame, False, 0)
+    assert tracer.labels == []
+    tracer.rollback(8, Pos(3, 1), Pos(3, 2))
+    tracer.rollback(10, Pos(3, 3), Pos(3, 3))
+
+    report = tracer.report()
+    heat = report.heatmap()
+    assert heat == [1, 1, 1, 2, 2, 1, 1, 0, 1, 1]
+    assert [s.labels for s in report.sites] == [("rule",), ("rule", "inner"), ()]
+    assert report.sites[2].rollbacks == 2
+    assert (report.sites[0].rollbacks, report.sites[0].widest) == (1, 7)
+
+    regions = report.hot_regions()
+    assert [(r.start, r.end, r.peak, r.total) for r in regions] == [
+        (0, 7, 2, 9),
+        (8, 10, 1, 2),
+    ]
+    assert [(r.first_line, r.last_line) for r in regions] == [(1, 2), (3, 3)]
+
+    binary = BacktrackTracer(b"\x00" * 8)
+    binary.rollback(2, Pos(1, 3), Pos(1, 6))
+    assert binary.report().heatmap() == [0, 0, 1, 1, 1, 1, 0, 0]